@@ -9,6 +9,9 @@ APP_DIR = Path(os.path.dirname(os.path.abspath(__file__)))
 PROJECT_ROOT = APP_DIR.parent
 STATIC_DIR = APP_DIR / "static"
 DATA_DIR = PROJECT_ROOT / "data" / "data_processed"
+RAW_DATA_DIR = PROJECT_ROOT / "data" / "raw"
+# 預先建構的檢索樹檔案目錄（TREE_ARTIFACT_DIR）
+TREE_ARTIFACT_DIR = Path(os.getenv("TREE_ARTIFACT_DIR", str(PROJECT_ROOT / "data" / "trees")))
 
 # 系統參數設定（支援環境變數覆寫）
 def _get_env_int(name: str, default: int) -> int:
@@ -21,6 +24,16 @@ def _get_env_int(name: str, default: int) -> int:
         return default
 
 
+def _get_env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        return default
+
+
 # bool 解析
 def _get_env_bool(name: str, default: bool) -> bool:
     value = os.getenv(name)
@@ -39,6 +52,19 @@ MAX_TOKENS = _get_env_int("OPENAI_MAX_TOKENS", 8196)
 
 # 詞嵌入模型名稱（EMBEDDING_MODEL_NAME）
 MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "intfloat/multilingual-e5-large")
+# 查詢向量快取：記憶體層最多保留的向量數（0 為停用）、可選的磁碟層目錄（空值為停用）與磁碟層筆數上限（0 為不限制）
+EMBEDDING_CACHE_SIZE = _get_env_int("EMBEDDING_CACHE_SIZE", 4096)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", "")
+EMBEDDING_CACHE_DISK_MAX = _get_env_int("EMBEDDING_CACHE_DISK_MAX", 100000)
+# 詞嵌入推論後端：torch、onnx（ONNX Runtime）、onnx-int8（動態 int8 量化的 ONNX 圖）或 int8（torch 動態量化）
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").strip().lower()
+EMBEDDING_NUM_THREADS = _get_env_int("EMBEDDING_NUM_THREADS", 0)  # CPU 推論的 intra-op 執行緒數（0 為函式庫預設）
+# onnx-int8 量化後模型的存放目錄
+EMBEDDING_ONNX_DIR = Path(os.getenv("EMBEDDING_ONNX_DIR", str(PROJECT_ROOT / "data" / "onnx")))
+# 非 torch 後端載入後，以已存 embeddings 中的 EMBEDDING_AGREEMENT_SAMPLE 個文本（0 為不檢查）檢查餘弦一致性，
+# 最低值低於 EMBEDDING_MIN_AGREEMENT 時改用 torch，確保與既有檢索樹相容
+EMBEDDING_AGREEMENT_SAMPLE = _get_env_int("EMBEDDING_AGREEMENT_SAMPLE", 32)
+EMBEDDING_MIN_AGREEMENT = _get_env_float("EMBEDDING_MIN_AGREEMENT", 0.99)
 
 # 檢索參數（皆可由環境變數覆蓋）
 CHUNK_SIZE = _get_env_int("CHUNK_SIZE", 100)  # 文本分塊大小
@@ -46,13 +72,66 @@ CHUNK_OVERLAP = _get_env_int("CHUNK_OVERLAP", 40)  # 文本分塊重疊大小
 MAX_CHUNKS = _get_env_int("MAX_CHUNKS", 10)  # 最大分塊數量
 MAX_RESULTS = _get_env_int("MAX_RESULTS", 70)  # 結果數量超過此值時進行進一步篩選
 TOP_K = _get_env_int("TOP_K", 10)  # 相關性排序後選取的top k筆數
+# 最相似節點搜尋方式：vectorized（一次矩陣乘法）、bfs（逐節點計算餘弦距離）或 beam（由根往下的 beam search）
+TREE_SEARCH_MODE = os.getenv("TREE_SEARCH_MODE", "vectorized").strip().lower()
+TREE_BEAM_WIDTH = _get_env_int("TREE_BEAM_WIDTH", 4)  # beam 模式每層保留的節點數
+TREE_LEAF_BUDGET = _get_env_int("TREE_LEAF_BUDGET", MAX_RESULTS)  # beam 模式停止展開的子樹葉節點數上限
+# 節點向量的打分格式：float32（精確）、float16 或 int8（量化後粗略打分，再以 float32 重算前 TREE_RESCORE_K 個候選）
+TREE_VECTOR_DTYPE = os.getenv("TREE_VECTOR_DTYPE", "float32").strip().lower()
+TREE_RESCORE_K = _get_env_int("TREE_RESCORE_K", TOP_K)
+# 相關性門檻：最佳節點餘弦相似度 / 最佳 rerank 分數低於門檻時不呼叫 LLM，直接回覆固定答案（未設定則不啟用）
+RELEVANCE_MIN_NODE_SCORE = _get_env_float("RELEVANCE_MIN_NODE_SCORE", None)
+RELEVANCE_MIN_RERANK_SCORE = _get_env_float("RELEVANCE_MIN_RERANK_SCORE", None)
+# 送交 LLM 的檢索內容：token 上限（0 為不限制）與視為分塊重疊而合併的最少字元數
+CONTEXT_MAX_TOKENS = _get_env_int("CONTEXT_MAX_TOKENS", 4000)
+CONTEXT_MIN_OVERLAP = _get_env_int("CONTEXT_MIN_OVERLAP", 20)
+# 完整查詢回應快取：記憶體層筆數（0 為停用）、有效秒數（0 為不過期）、可選的磁碟層目錄（空值為停用）與磁碟層筆數上限（0 為不限制）
+RESPONSE_CACHE_SIZE = _get_env_int("RESPONSE_CACHE_SIZE", 1024)
+RESPONSE_CACHE_TTL = _get_env_int("RESPONSE_CACHE_TTL", 3600)
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "")
+RESPONSE_CACHE_DISK_MAX = _get_env_int("RESPONSE_CACHE_DISK_MAX", 10000)
+# query extraction：結果快取筆數（0 為停用）與等待 LLM 的秒數上限（超過時改用原始查詢的檢索結果，0 為不限制）
+EXTRACTION_CACHE_SIZE = _get_env_int("EXTRACTION_CACHE_SIZE", 1024)
+EXTRACTION_TIMEOUT = _get_env_float("EXTRACTION_TIMEOUT", 20.0)
 
 # API設定（支援環境變數覆寫）
 _cors_env = os.getenv("CORS_ORIGINS")
 CORS_ORIGINS = _cors_env.split(",") if _cors_env and _cors_env.strip() != "" else ["*"]
 API_TITLE = os.getenv("API_TITLE", "RAG System API")  # API標題
+# 執行檢索（編碼、檢索樹搜尋、重排序）的執行緒池大小，即同時進行的檢索數上限
+RETRIEVAL_MAX_WORKERS = _get_env_int("RETRIEVAL_MAX_WORKERS", 4)
+# 跨請求微批次：並發的 encode / Cross-Encoder predict 合併為單次批次推論
+INFERENCE_BATCHING = _get_env_bool("INFERENCE_BATCHING", True)
+INFERENCE_MAX_BATCH = _get_env_int("INFERENCE_MAX_BATCH", 64)  # 單一批次最多輸入筆數
+INFERENCE_MAX_WAIT_MS = _get_env_int("INFERENCE_MAX_WAIT_MS", 5)  # 第一筆請求最多等待毫秒數
 
 # Reranker 設定（支援 Cross-Encoder）
 RERANKER_USE_CROSS_ENCODER = _get_env_bool("RERANKER_USE_CROSS_ENCODER", False)
 RERANKER_MODEL_NAME = os.getenv("RERANKER_MODEL_NAME", "cross-encoder/ms-marco-MiniLM-L-6-v2")
-RERANKER_ENABLE_IN_PIPELINE = _get_env_bool("RERANKER_ENABLE_IN_PIPELINE", False)
\ No newline at end of file
+RERANKER_ENABLE_IN_PIPELINE = _get_env_bool("RERANKER_ENABLE_IN_PIPELINE", False)
+# Cross-Encoder 推論後端：torch、onnx（需安裝 optimum[onnxruntime]）或 int8（torch 動態量化，僅 CPU）
+RERANKER_BACKEND = os.getenv("RERANKER_BACKEND", "torch").strip().lower()
+# 送入 Cross-Encoder 前依向量相似度保留的候選數（0 為不截斷）與配對分數快取筆數（0 為停用）
+RERANKER_PRE_TOP_N = _get_env_int("RERANKER_PRE_TOP_N", 50)
+RERANKER_CACHE_SIZE = _get_env_int("RERANKER_CACHE_SIZE", 20000)
+
+# 離線語料處理（python -m src.data_processing.ingest）：分塊大小 / 重疊、每次編碼的文本塊數、分塊行程數（0 為 CPU 核心數）
+INGEST_CHUNK_SIZE = _get_env_int("INGEST_CHUNK_SIZE", 50)
+INGEST_CHUNK_OVERLAP = _get_env_int("INGEST_CHUNK_OVERLAP", 0)
+INGEST_BATCH_SIZE = _get_env_int("INGEST_BATCH_SIZE", 256)
+INGEST_WORKERS = _get_env_int("INGEST_WORKERS", 0)
+
+# 檢索樹建構：linkage 方法（single / average / complete / ward）與建構策略
+# exact 直接對全部向量聚類；kmeans 先分群、群內再聚類，單次聚類最多 TREE_BUILD_CLUSTER_SIZE 筆，適合大型語料
+TREE_LINKAGE_METHOD = os.getenv("TREE_LINKAGE_METHOD", "single").strip().lower()
+TREE_BUILD_STRATEGY = os.getenv("TREE_BUILD_STRATEGY", "exact").strip().lower()
+TREE_BUILD_CLUSTER_SIZE = _get_env_int("TREE_BUILD_CLUSTER_SIZE", 2000)
+# 增量更新（新增 / 刪除）累積的異動比例超過此值時，於背景重新建構檢索樹
+TREE_COMPACTION_DRIFT = _get_env_float("TREE_COMPACTION_DRIFT", 0.2)
+
+# 檢索樹預載：啟動時即載入（或建構）所有可用文本的檢索樹，否則於第一次查詢時才載入
+TREE_PRELOAD = _get_env_bool("TREE_PRELOAD", False)
+# 以唯讀 mmap 開啟預建檢索樹，多個 worker 共用 page cache
+TREE_MMAP = _get_env_bool("TREE_MMAP", True)
+# 常駐檢索樹的總記憶體上限（MB），超過時淘汰最久未使用的語料；0 表示不限制
+TREE_MEMORY_BUDGET_MB = _get_env_int("TREE_MEMORY_BUDGET_MB", 1024)
@@ -1,15 +1,21 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+import hashlib
+import json
+import numpy as np
 import uvicorn
 import os
+import time
+import uuid
 from dotenv import load_dotenv
-import pickle
 import sys
-import numpy as np
 
 # 添加專案根目錄到路徑，以便引入其他模組
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -18,13 +24,27 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from app.config import (
     APP_DIR, STATIC_DIR, DATA_DIR,
     MAX_TOKENS, CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNKS,
-    CORS_ORIGINS, API_TITLE
+    CORS_ORIGINS, API_TITLE, TREE_PRELOAD, RETRIEVAL_MAX_WORKERS, TREE_MEMORY_BUDGET_MB,
+    RELEVANCE_MIN_NODE_SCORE, RELEVANCE_MIN_RERANK_SCORE, CONTEXT_MAX_TOKENS, CONTEXT_MIN_OVERLAP,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DIR, RESPONSE_CACHE_DISK_MAX, EXTRACTION_TIMEOUT
 )
+import app.config as config
 
 # 導入檢索和生成模組
 from src.utils.word_embedding import WordEmbedding
 import src.retrieval.RAGTree_function as rf
 import src.retrieval.generated_function as gf
+import src.retrieval.tree_artifact as ta
+from src.retrieval.tree_updates import TreeCompactor
+from src.retrieval.tree_registry import TreeRegistry
+from src.retrieval.retrieval_hit import unique_texts
+from src.retrieval.relevance_gate import RelevanceGate
+from src.retrieval.context_packing import ContextPacker
+from src.retrieval.cross_encoder import reranker_stats
+from src.utils.embedding_cache import get_embedding_cache, cached_encode, model_cache_name
+from src.utils.response_cache import ResponseCache
+from src.utils.latency import LatencyTracker
+from src.utils.micro_batcher import batching_stats
 from langchain_openai import ChatOpenAI
 
 # 載入環境變數
@@ -67,11 +87,42 @@ def _create_chat_llm() -> ChatOpenAI:
 # 應用狀態
 class AppState:
     model = None
-    trees: Dict[str, Any] = {}
+    # 檢索樹依語料名稱快取，超過記憶體上限時淘汰最久未使用者；並發的首次請求合併為一次載入
+    trees = TreeRegistry(lambda text_name: _load_tree(text_name), TREE_MEMORY_BUDGET_MB * 2**20)
     llm = None
+    # 檢索等 CPU 密集工作在此執行緒池中執行，避免阻塞事件迴圈
+    executor = ThreadPoolExecutor(max_workers=RETRIEVAL_MAX_WORKERS, thread_name_prefix="retrieval")
+    # 增量更新後 drift 超過門檻時於背景重建檢索樹
+    compactor = TreeCompactor()
+    # 檢索相關性過低時不呼叫 LLM
+    relevance_gate = RelevanceGate(RELEVANCE_MIN_NODE_SCORE, RELEVANCE_MIN_RERANK_SCORE)
+    # 送交 LLM 前的檢索內容排版（去除重疊、token 預算）
+    context_packer = ContextPacker(CONTEXT_MAX_TOKENS, CONTEXT_MIN_OVERLAP)
+    # 完整查詢回應快取；鍵包含各語料版本（來源檔案雜湊，增量異動後附加新標記）
+    response_cache = ResponseCache(
+        RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_DIR or None, RESPONSE_CACHE_DISK_MAX
+    )
+    corpus_versions = {}
+    # query extraction 與端到端延遲統計
+    latency = LatencyTracker()
 
 app.state.app_state = AppState()
 
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    將阻塞的 CPU 工作（模型載入、編碼、檢索樹搜尋）交給有上限的執行緒池執行。
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        app.state.app_state.executor, functools.partial(func, *args, **kwargs)
+    )
+
+
+def _load_embedding_model():
+    word_embedding = WordEmbedding()
+    return word_embedding.load_model()
+
 # Configure CORS
 app.add_middleware(
     CORSMiddleware,
@@ -87,7 +138,8 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 class QueryRequest(BaseModel):
     query: str
     use_extraction: bool = False
-    text_name: str  # 添加文本名稱欄位
+    text_name: Optional[str] = None  # 添加文本名稱欄位
+    text_names: Optional[List[str]] = None  # 跨語料檢索：同時搜尋多個文本
     prompt_type: str = "task_oriented"  # 新增 prompt 類型欄位，預設為 task_oriented
 
 class QueryResponse(BaseModel):
@@ -97,77 +149,83 @@ class QueryResponse(BaseModel):
 class TextListResponse(BaseModel):
     available_texts: List[str]
 
+class ChunkInsertRequest(BaseModel):
+    texts: List[str]
+
+class ChunkUpdateResponse(BaseModel):
+    leaf_ids: List[int]
+    drift: float
+    compacting: bool
+
 # 初始化模型和語言模型
 @app.on_event("startup")
 async def startup_event():
     try:
         # 初始化embedding模型
-        word_embedding = WordEmbedding()
-        app.state.app_state.model = word_embedding.load_model()
+        app.state.app_state.model = _load_embedding_model()
         print("詞嵌入模型已載入")
         
         # 初始化語言模型
         try:
             app.state.app_state.llm = _create_chat_llm()
             print("OpenAI語言模型已載入")
+            # 先解析 tokenizer（可能需下載 tiktoken 編碼檔），避免第一個查詢等待
+            app.state.app_state.context_packer.token_counter(app.state.app_state.llm)
         except ValueError as _:
             print("警告：OPENAI_API_KEY 環境變數未設置")
     except Exception as e:
         print(f"初始化模型時發生錯誤: {str(e)}")
 
-def get_tree(text_name):
-    """
-    根據分開儲存的 embeddings 與 texts 建構檢索樹：
-    - {text_name}_embeddings.pkl：儲存 vectors
-    - {text_name}_texts.pkl：儲存 texts
-    """
-    if text_name not in app.state.app_state.trees:
-        try:
-            embeddings_path = os.path.join(DATA_DIR, f"{text_name}_embeddings.pkl")
-            texts_path = os.path.join(DATA_DIR, f"{text_name}.pkl")
-
-            if not os.path.exists(embeddings_path):
-                raise FileNotFoundError(f"找不到向量檔案: {embeddings_path}")
-            if not os.path.exists(texts_path):
-                raise FileNotFoundError(f"找不到文本檔案: {texts_path}")
+    if TREE_PRELOAD:
+        for text_name in get_available_texts():
+            try:
+                get_tree(text_name)
+            except ValueError as e:
+                print(str(e))
 
-            # 分別載入
-            with open(embeddings_path, 'rb') as f:
-                vectors = pickle.load(f)
-            with open(texts_path, 'rb') as f:
-                texts = pickle.load(f)
 
-            if not isinstance(vectors, np.ndarray):
-                vectors = np.array(vectors)
+@app.on_event("shutdown")
+async def shutdown_event():
+    app.state.app_state.executor.shutdown(wait=False)
 
-            # 維度一致性檢查：避免查詢模型與已存向量維度不一致
-            try:
-                embedding_dim = vectors.shape[1]
-            except Exception:
-                raise ValueError(f"讀取到的向量格式異常，請確認檔案內容：{embeddings_path}")
+def _load_tree(text_name):
+    """
+    載入檢索樹：優先載入 {TREE_ARTIFACT_DIR}/{text_name}/ 的預建檢索樹，
+    僅在來源檔案（{text_name}_embeddings.pkl、{text_name}.pkl）或詞嵌入模型改變時才重新建構。
+    """
+    try:
+        tree = ta.load_or_build_tree(text_name)
 
-            try:
-                expected_dim = app.state.app_state.model.get_sentence_embedding_dimension()
-            except Exception:
-                # 後備：若模型無該方法，嘗試編碼一個樣本以取得維度
-                expected_dim = int(app.state.app_state.model.encode(["dim_check"]).shape[1])
-
-            if embedding_dim != expected_dim:
-                raise ValueError(
-                    "Embedding 維度不一致：\n"
-                    f"- 檔案 {embeddings_path} 維度 = {embedding_dim}\n"
-                    f"- 目前模型維度 = {expected_dim}\n\n"
-                    "請調整環境變數 EMBEDDING_MODEL_NAME 以匹配原先建立向量所用模型，"
-                    "或重新產生 embeddings 使其與目前模型一致。"
-                )
+        # 維度一致性檢查：避免查詢模型與已存向量維度不一致
+        embedding_dim = tree.vectors.shape[1]
+        try:
+            expected_dim = app.state.app_state.model.get_sentence_embedding_dimension()
+        except Exception:
+            # 後備：若模型無該方法，嘗試編碼一個樣本以取得維度
+            expected_dim = int(app.state.app_state.model.encode(["dim_check"]).shape[1])
+
+        if embedding_dim != expected_dim:
+            raise ValueError(
+                "Embedding 維度不一致：\n"
+                f"- 檢索樹 {text_name} 維度 = {embedding_dim}\n"
+                f"- 目前模型維度 = {expected_dim}\n\n"
+                "請調整環境變數 EMBEDDING_MODEL_NAME 以匹配原先建立向量所用模型，"
+                "或重新產生 embeddings 使其與目前模型一致。"
+            )
+
+        manifest = ta.read_manifest(ta.artifact_path(text_name))
+        app.state.app_state.corpus_versions[text_name] = manifest.get("source_hash") if manifest else None
+        print(f"✅ 已載入檢索樹：{text_name}")
+        return tree
+    except Exception as e:
+        raise ValueError(f"❌ 建構檢索樹失敗 '{text_name}': {str(e)}")
 
-            tree = rf.create_ahc_tree(vectors, texts)
-            app.state.app_state.trees[text_name] = tree
-            print(f"✅ 已建構檢索樹：{text_name}")
-        except Exception as e:
-            raise ValueError(f"❌ 建構檢索樹失敗 '{text_name}': {str(e)}")
 
-    return app.state.app_state.trees[text_name]
+def get_tree(text_name):
+    """
+    取得檢索樹（經由 TreeRegistry 快取；尚未載入時呼叫 _load_tree）。
+    """
+    return app.state.app_state.trees.get(text_name)
 
 # 獲取可用的文本列表
 def get_available_texts():
@@ -208,61 +266,325 @@ async def get_texts():
         # 如果出現錯誤，返回預設值
         return TextListResponse(available_texts=["民法總則", "土地法與都市計畫法"])
 
+@app.get("/metrics")
+async def get_metrics():
+    return {
+        "embedding_cache": get_embedding_cache().stats(),
+        "inference_batching": batching_stats(),
+        "tree_compaction": app.state.app_state.compactor.stats(),
+        "tree_registry": app.state.app_state.trees.stats(),
+        "relevance_gate": app.state.app_state.relevance_gate.stats(),
+        "context_packing": app.state.app_state.context_packer.stats(),
+        "reranker": reranker_stats(),
+        "response_cache": app.state.app_state.response_cache.stats(),
+        "query_extraction": {"timeout_seconds": EXTRACTION_TIMEOUT, "cache": gf.extraction_cache_stats()},
+        "latency": app.state.app_state.latency.stats(),
+    }
+
+
+def _schedule_compaction(text_name, tree):
+    """
+    drift 超過門檻時於背景重建檢索樹，完成後換上新樹。
+    """
+    def on_compacted(new_tree):
+        app.state.app_state.trees.replace(text_name, new_tree)
+        _bump_corpus_version(text_name)
+
+    tree = app.state.app_state.trees.peek(text_name) or tree
+    return app.state.app_state.compactor.maybe_compact(text_name, tree, on_compacted)
+
+
+def _current_drift(text_name, tree):
+    # 背景重建可能已換上新樹
+    return (app.state.app_state.trees.peek(text_name) or tree).drift
+
+
+def _bump_corpus_version(text_name):
+    """
+    語料內容改變（增量新增 / 刪除、背景重建）後更新版本，使回應快取中的舊項目不再命中。
+    版本保留來源檔案雜湊並附加隨機標記，服務重啟後不會與先前的異動版本重複。
+    """
+    versions = app.state.app_state.corpus_versions
+    base = (versions.get(text_name) or "").split(":")[0]
+    versions[text_name] = f"{base}:{uuid.uuid4().hex[:12]}"
+
+
+def insert_chunks(text_name, texts):
+    tree = get_tree(text_name)
+    vectors = np.atleast_2d(cached_encode(app.state.app_state.model, list(texts)))
+    leaf_ids = [tree.insert(vector, text) for vector, text in zip(vectors, texts)]
+    _bump_corpus_version(text_name)
+    compacting = _schedule_compaction(text_name, tree)
+    return ChunkUpdateResponse(
+        leaf_ids=leaf_ids, drift=_current_drift(text_name, tree), compacting=compacting
+    )
+
+
+def delete_chunk(text_name, leaf_id):
+    tree = get_tree(text_name)
+    deleted = tree.delete(leaf_id)
+    if deleted:
+        _bump_corpus_version(text_name)
+    compacting = _schedule_compaction(text_name, tree)
+    return ChunkUpdateResponse(
+        leaf_ids=[leaf_id] if deleted else [],
+        drift=_current_drift(text_name, tree),
+        compacting=compacting,
+    )
+
+
+@app.post("/texts/{text_name}/chunks", response_model=ChunkUpdateResponse)
+async def add_chunks(text_name: str, request: ChunkInsertRequest):
+    """
+    將新文本增量加入檢索樹（僅影響記憶體中的檢索樹，不會改寫來源 pkl）。
+    """
+    if not request.texts:
+        raise HTTPException(status_code=400, detail="texts 不可為空")
+    if app.state.app_state.model is None:
+        app.state.app_state.model = await run_blocking(_load_embedding_model)
+    try:
+        return await run_blocking(insert_chunks, text_name, request.texts)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.delete("/texts/{text_name}/chunks/{leaf_id}", response_model=ChunkUpdateResponse)
+async def remove_chunk(text_name: str, leaf_id: int):
+    """
+    以墓碑標記刪除檢索樹中的文本，leaf_id 為原始文本索引。
+    """
+    try:
+        return await run_blocking(delete_chunk, text_name, leaf_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+# ✅ 防呆處理：強制將輸入轉為純文字
+def normalize_query(query):
+    if isinstance(query, list):
+        return " ".join(map(str, query))
+    if not isinstance(query, str):
+        return str(query)
+    return query
+
+
+async def _ensure_models():
+    # 檢查模型是否已初始化
+    if app.state.app_state.model is None:
+        app.state.app_state.model = await run_blocking(_load_embedding_model)
+        print("詞嵌入模型已重新載入")
+
+    # 檢查語言模型是否已初始化
+    if app.state.app_state.llm is None:
+        app.state.app_state.llm = _create_chat_llm()
+        print("語言模型已重新載入")
+        await run_blocking(app.state.app_state.context_packer.token_counter, app.state.app_state.llm)
+
+
+def _request_corpora(request: QueryRequest) -> List[str]:
+    """
+    請求要搜尋的文本名稱（text_names 優先，其次 text_name），去除重複並保留順序。
+    """
+    names = list(request.text_names or [])
+    if request.text_name and not names:
+        names = [request.text_name]
+    names = list(dict.fromkeys(name for name in names if name))
+    if not names:
+        raise ValueError("請提供 text_name 或 text_names")
+    return names
+
+
+async def _federated_retrieve(text_names: List[str], trees, search_query: str):
+    """
+    跨語料檢索：查詢只編碼一次，各檢索樹在執行緒池中平行搜尋，最後合併候選並執行一次 TOP_K / rerank。
+    """
+    model = app.state.app_state.model
+    queries = rf.split_query(search_query, CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNKS)
+    query_vectors = await run_blocking(rf.encode_queries, queries, model)
+    per_corpus = await asyncio.gather(
+        *(run_blocking(rf.corpus_candidates, tree, query_vectors) for tree in trees)
+    )
+    return await run_blocking(rf.merge_candidate_hits, queries, query_vectors, per_corpus, model, text_names)
+
+
+async def _load_corpora(text_names: List[str]):
+    # 獲取檢索樹（多個文本時平行載入）
+    return await asyncio.gather(*(run_blocking(get_tree, name) for name in text_names))
+
+
+def _pipeline_fingerprint():
+    """
+    影響回應內容的模型、設定與 prompt 模板摘要，任一項改變時回應快取的舊項目不再命中。
+    """
+    llm = app.state.app_state.llm
+    settings = {name: getattr(config, name) for name in _FINGERPRINT_SETTINGS}
+    settings["embedding_model"] = model_cache_name(app.state.app_state.model)
+    settings["prompts"] = gf.prompt_fingerprint()
+    settings["llm"] = [
+        getattr(llm, name, None) for name in ("model_name", "temperature", "top_p", "max_tokens")
+    ]
+    payload = json.dumps(settings, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+# 納入回應快取指紋的設定
+_FINGERPRINT_SETTINGS = (
+    "MODEL_NAME", "CHUNK_SIZE", "CHUNK_OVERLAP", "MAX_CHUNKS", "MAX_RESULTS", "TOP_K",
+    "TREE_SEARCH_MODE", "TREE_BEAM_WIDTH", "TREE_LEAF_BUDGET", "TREE_VECTOR_DTYPE", "TREE_RESCORE_K",
+    "TREE_LINKAGE_METHOD", "TREE_BUILD_STRATEGY", "TREE_BUILD_CLUSTER_SIZE",
+    "RELEVANCE_MIN_NODE_SCORE", "RELEVANCE_MIN_RERANK_SCORE", "CONTEXT_MAX_TOKENS", "CONTEXT_MIN_OVERLAP",
+    "RERANKER_ENABLE_IN_PIPELINE", "RERANKER_USE_CROSS_ENCODER", "RERANKER_MODEL_NAME", "RERANKER_BACKEND",
+    "RERANKER_PRE_TOP_N",
+)
+
+
+def _response_cache_key(request: QueryRequest, normalized_query: str, text_names: List[str]):
+    versions = app.state.app_state.corpus_versions
+    return ResponseCache.key(
+        [(name, versions.get(name)) for name in text_names],
+        normalized_query, request.use_extraction, request.prompt_type, _pipeline_fingerprint(),
+    )
+
+
+async def _search(text_names: List[str], trees, search_query: str):
+    # 檢索交給執行緒池
+    if len(trees) > 1:
+        return await _federated_retrieve(text_names, trees, search_query)
+    return await run_blocking(
+        rf.tree_search_hits, trees[0], search_query, app.state.app_state.model,
+        CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNKS
+    )
+
+
+async def _timed_extraction(normalized_query: str, generator):
+    start_time = time.perf_counter()
+    search_query = await generator.query_extraction_async(normalized_query, app.state.app_state.llm)
+    app.state.app_state.latency.record("extraction", time.perf_counter() - start_time)
+    return search_query
+
+
+def _consume_exception(task):
+    # 逾時後不再等待的工作，其例外於此取出，避免「exception was never retrieved」警告
+    if not task.cancelled():
+        task.exception()
+
+
+async def _extraction_retrieve(text_names: List[str], trees, normalized_query: str, generator):
+    """
+    Summary:
+    query extraction 與原始查詢的檢索同時進行，回傳 (hits, mode)。
+
+    - 提取結果已快取時直接以其檢索（mode 為 "extraction_cached"）
+    - 否則在等待 LLM 的同時以原始查詢檢索（編碼查詢並預熱檢索樹）；提取完成後以提取結果檢索（"extraction"）
+    - 提取逾時（EXTRACTION_TIMEOUT）或失敗時改用原始查詢的檢索結果（"fallback"）；
+      逾時的提取仍在背景完成並寫入快取，供之後相同的查詢使用
+    """
+    llm = app.state.app_state.llm
+    if generator.is_extraction_cached(normalized_query, llm):
+        search_query = await generator.query_extraction_async(normalized_query, llm)
+        return await _search(text_names, trees, search_query), "extraction_cached"
+
+    loop = asyncio.get_running_loop()
+    extraction = loop.create_task(_timed_extraction(normalized_query, generator))
+    raw_search = loop.create_task(_search(text_names, trees, normalized_query))
+    extraction.add_done_callback(_consume_exception)
+    raw_search.add_done_callback(_consume_exception)
+
+    start_time = time.perf_counter()
+    try:
+        search_query = await asyncio.wait_for(asyncio.shield(extraction), EXTRACTION_TIMEOUT or None)
+        reason = None
+    except asyncio.TimeoutError:
+        reason = f"逾時 {EXTRACTION_TIMEOUT} 秒"
+    except Exception as e:
+        reason = f"錯誤：{str(e)}"
+    app.state.app_state.latency.record("extraction_wait", time.perf_counter() - start_time)
+
+    if reason is not None:
+        print(f"query extraction {reason}，改用原始查詢的檢索結果")
+        app.state.app_state.latency.increment("extraction_fallback")
+        return await raw_search, "fallback"
+    if search_query == normalized_query:
+        return await raw_search, "extraction"
+    # 原始查詢的檢索已完成預熱，不再需要其結果
+    raw_search.cancel()
+    return await _search(text_names, trees, search_query), "extraction"
+
+
+async def _retrieve(request: QueryRequest, normalized_query: str, generator, trees=None):
+    """
+    依請求設定執行（可選的 query extraction 與）檢索，回傳 (RetrievalHit 列表, 檢索模式)。
+    檢索模式為 "direct"、"extraction"、"extraction_cached" 或 "fallback"（提取逾時或失敗）。
+    trees 為已載入的檢索樹（順序同 _request_corpora），未提供時於此載入。
+    """
+    text_names = _request_corpora(request)
+    print(f"接收查詢: {normalized_query}, 文本: {'、'.join(text_names)}, 使用提取: {request.use_extraction}")
+
+    if trees is None:
+        trees = await _load_corpora(text_names)
+
+    if request.use_extraction:
+        print("使用提取方法進行檢索...")
+        return await _extraction_retrieve(text_names, trees, normalized_query, generator)
+    print("使用直接檢索方法...")
+    return await _search(text_names, trees, normalized_query), "direct"
+
+
+def _insufficient_context_answer(request: QueryRequest, hits, generator):
+    """
+    檢索相關性低於門檻時回傳固定答案（不呼叫 LLM），否則回傳 None。
+    """
+    reason = app.state.app_state.relevance_gate.check(hits)
+    if reason is None:
+        return None
+    print(f"檢索相關性不足（{reason}），略過 LLM 直接回覆")
+    return generator.insufficient_context_answer(request.prompt_type)
+
+
 @app.post("/query", response_model=QueryResponse)
 async def process_query(request: QueryRequest):
     try:
-        # ✅ 防呆處理：強制將輸入轉為純文字
-        def normalize_query(query):
-            if isinstance(query, list):
-                return " ".join(map(str, query))
-            if not isinstance(query, str):
-                return str(query)
-            return query
-
         normalized_query = normalize_query(request.query)
-        
-        # 檢查模型是否已初始化
-        if app.state.app_state.model is None:
-            word_embedding = WordEmbedding()
-            app.state.app_state.model = word_embedding.load_model()
-            print("詞嵌入模型已重新載入")
-        
-        # 檢查語言模型是否已初始化
-        if app.state.app_state.llm is None:
-            app.state.app_state.llm = _create_chat_llm()
-            print("語言模型已重新載入")
-        
-        print(f"接收查詢: {normalized_query}, 文本: {request.text_name}, 使用提取: {request.use_extraction}")
+        await _ensure_models()
 
-        # 獲取檢索樹
-        tree = get_tree(request.text_name)
-
-        start_time = __import__('time').time()
+        start_time = time.time()
         
         # 創建 GeneratedFunction 實例
         generator = gf.GeneratedFunction()
+        llm = app.state.app_state.llm
+
+        # 相同的查詢與設定直接回傳快取的回應（先載入檢索樹以取得語料版本）
+        text_names = _request_corpora(request)
+        trees = await _load_corpora(text_names)
+        cache_key = _response_cache_key(request, normalized_query, text_names)
+        cached = app.state.app_state.response_cache.get(cache_key, "/query")
+        if cached is not None:
+            print(f"回應快取命中: {normalized_query}")
+            app.state.app_state.latency.record("/query:cached", time.time() - start_time)
+            return QueryResponse(**cached)
 
         # 執行檢索與生成
-        if request.use_extraction:
-            print("使用提取方法進行檢索...")
-            retrieved_docs = rf.extraction_tree_search(tree, normalized_query, app.state.app_state.model,
-                                                     CHUNK_SIZE, CHUNK_OVERLAP, app.state.app_state.llm, MAX_CHUNKS)
-            if request.prompt_type == "cot":
-                answer = generator.RAG_CoT(normalized_query, retrieved_docs, app.state.app_state.llm)
-            else:
-                answer = generator.LLM_Task_Oriented(normalized_query, app.state.app_state.llm, retrieved_docs)
-        else:
-            print("使用直接檢索方法...")
-            retrieved_docs = rf.tree_search(tree, normalized_query, app.state.app_state.model,
-                                           CHUNK_SIZE, CHUNK_OVERLAP, MAX_CHUNKS)
+        hits, mode = await _retrieve(request, normalized_query, generator, trees)
+        retrieved_docs = unique_texts(hits)
+
+        answer = _insufficient_context_answer(request, hits, generator)
+        if answer is None:
+            context = await run_blocking(app.state.app_state.context_packer.pack, hits, llm)
             if request.prompt_type == "cot":
-                answer = generator.RAG_CoT(normalized_query, retrieved_docs, app.state.app_state.llm)
+                answer = await generator.RAG_CoT_async(normalized_query, context, llm)
             else:
-                answer = generator.LLM_Task_Oriented(normalized_query, app.state.app_state.llm, retrieved_docs)
+                answer = await generator.LLM_Task_Oriented_async(normalized_query, llm, context)
 
-        elapsed_time = __import__('time').time() - start_time
+        elapsed_time = time.time() - start_time
         print(f"檢索和生成完成，耗時: {elapsed_time:.2f}秒")
+        app.state.app_state.latency.record(f"/query:{mode}", elapsed_time)
 
+        # 提取逾時時的回應不是請求設定下的結果，不寫入快取
+        if mode != "fallback":
+            app.state.app_state.response_cache.put(
+                cache_key, {"answer": answer, "retrieved_docs": retrieved_docs}, "/query"
+            )
         return QueryResponse(
             answer=answer,
             retrieved_docs=retrieved_docs
@@ -278,6 +600,92 @@ async def process_query(request: QueryRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _sse_event(event: str, data) -> str:
+    payload = json.dumps(data, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+@app.post("/query/stream")
+async def process_query_stream(request: QueryRequest):
+    """
+    以 Server-Sent Events 串流回應：
+    - event: docs，data 為 {"retrieved_docs": [...]}，檢索完成後立即送出
+    - event: token，data 為 {"text": "..."}，LLM 產生的片段
+    - event: done，data 為 {"answer": "...", "elapsed": 秒數}
+    - event: error，data 為 {"detail": "..."}，串流開始後發生錯誤時送出
+    """
+    try:
+        normalized_query = normalize_query(request.query)
+        await _ensure_models()
+        generator = gf.GeneratedFunction()
+        start_time = time.time()
+        text_names = _request_corpora(request)
+        trees = await _load_corpora(text_names)
+        cache_key = _response_cache_key(request, normalized_query, text_names)
+        cached = app.state.app_state.response_cache.get(cache_key, "/query/stream")
+        mode = "cached"
+        if cached is None:
+            hits, mode = await _retrieve(request, normalized_query, generator, trees)
+            retrieved_docs = unique_texts(hits)
+            canned_answer = _insufficient_context_answer(request, hits, generator)
+        else:
+            # 快取命中時以單一 token 送出完整答案
+            print(f"回應快取命中: {normalized_query}")
+            retrieved_docs, canned_answer = cached["retrieved_docs"], cached["answer"]
+    except ValueError as e:
+        print(f"值錯誤: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"處理查詢時發生錯誤: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    llm = app.state.app_state.llm
+
+    async def event_stream():
+        yield _sse_event("docs", {"retrieved_docs": retrieved_docs})
+        if canned_answer is not None:
+            if cached is None and mode != "fallback":
+                app.state.app_state.response_cache.put(
+                    cache_key, {"answer": canned_answer, "retrieved_docs": retrieved_docs}, "/query/stream"
+                )
+            elapsed_time = time.time() - start_time
+            app.state.app_state.latency.record(f"/query/stream:{mode}", elapsed_time)
+            yield _sse_event("token", {"text": canned_answer})
+            yield _sse_event("done", {"answer": canned_answer, "elapsed": round(elapsed_time, 3)})
+            return
+        context = await run_blocking(app.state.app_state.context_packer.pack, hits, llm)
+        if request.prompt_type == "cot":
+            tokens = generator.RAG_CoT_stream(normalized_query, context, llm)
+        else:
+            tokens = generator.LLM_Task_Oriented_stream(normalized_query, llm, context)
+
+        answer_parts = []
+        try:
+            async for token in tokens:
+                answer_parts.append(token)
+                yield _sse_event("token", {"text": token})
+        except Exception as e:
+            print(f"串流生成時發生錯誤: {str(e)}")
+            yield _sse_event("error", {"detail": str(e)})
+            return
+
+        elapsed_time = time.time() - start_time
+        print(f"檢索和串流生成完成，耗時: {elapsed_time:.2f}秒")
+        app.state.app_state.latency.record(f"/query/stream:{mode}", elapsed_time)
+        answer = "".join(answer_parts)
+        if mode != "fallback":
+            app.state.app_state.response_cache.put(
+                cache_key, {"answer": answer, "retrieved_docs": retrieved_docs}, "/query/stream"
+            )
+        yield _sse_event("done", {"answer": answer, "elapsed": round(elapsed_time, 3)})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 if __name__ == "__main__":
     # Ensure the static directory exists
     if not os.path.exists(STATIC_DIR):
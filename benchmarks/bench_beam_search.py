@@ -0,0 +1,92 @@
+"""
+Beam search 由根往下搜尋 vs 全節點掃描（vectorized）的 recall 與延遲比較
+
+以 data/data_processed 內附的語料建構檢索樹，查詢向量取自既有 embeddings 加上高斯雜訊。
+以所有葉節點的精確餘弦相似度前 k 名為基準，計算各方式回傳子樹所涵蓋的比例（recall@k），
+並列出回傳的平均葉節點數、全節點掃描的最佳節點落在 beam 回傳子樹內的比例與延遲，
+用以為各語料選擇 beam 寬度。
+
+beam search 每層的成本固定，層數約等於樹高；single linkage 在小型語料上常形成很深的鏈狀樹，
+此時一次矩陣乘法的全節點掃描反而較快，beam 模式的效益在大型、較平衡的樹上才會顯現。
+
+用法:
+    python benchmarks/bench_beam_search.py
+    python benchmarks/bench_beam_search.py --texts 民法總則 --beams 1 2 4 8 --leaf-budget 70 --k 10
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import TREE_LEAF_BUDGET
+import src.retrieval.RAGTree_function as rf
+from benchmarks.bench_tree_search import DEFAULT_TEXTS, load_corpus, make_queries
+
+
+def exact_top_k(tree, queries, k):
+    """
+    以所有葉節點的精確餘弦相似度取前 k 名，回傳原始文本索引的集合。
+    """
+    leaves = np.asarray(tree.vectors[: tree.n_leaves], dtype=np.float32)
+    leaves = leaves / np.linalg.norm(leaves, axis=1, keepdims=True)
+    scores = queries @ leaves.T
+    top = np.argsort(-scores, axis=1)[:, :k]
+    return [set(tree.leaf_ids[row].tolist()) for row in top]
+
+
+def evaluate(search, tree, queries, truth, exhaustive, k):
+    latencies, recalls, sizes, covered = [], [], [], []
+    for query_vector, expected, reference in zip(queries, truth, exhaustive):
+        start = time.perf_counter()
+        node = search(query_vector)
+        latencies.append(time.perf_counter() - start)
+        leaf_ids = set(tree.subtree_leaf_ids(node.index).tolist())
+        recalls.append(len(leaf_ids & expected) / k)
+        sizes.append(len(leaf_ids))
+        # 全節點掃描的最佳節點是否位於回傳的子樹內
+        start_leaf, end_leaf = tree.leaf_ranges[node.index]
+        ref_start, ref_end = tree.leaf_ranges[reference]
+        covered.append(start_leaf <= ref_start and ref_end <= end_leaf)
+    return np.array(latencies) * 1000, np.mean(recalls), np.mean(sizes), np.mean(covered)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="beam search 與全節點掃描的 recall@k / 延遲比較")
+    parser.add_argument("--texts", nargs="+", default=DEFAULT_TEXTS, help="要測試的語料名稱")
+    parser.add_argument("--queries", type=int, default=200, help="每個語料的查詢數")
+    parser.add_argument("--noise", type=float, default=0.02, help="查詢向量的雜訊標準差")
+    parser.add_argument("--beams", type=int, nargs="+", default=[1, 2, 4, 8, 16], help="要測試的 beam 寬度")
+    parser.add_argument("--leaf-budget", type=int, default=TREE_LEAF_BUDGET, help="停止展開的子樹葉節點數上限")
+    parser.add_argument("--k", type=int, default=10, help="recall@k 的 k")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for text_name in args.texts:
+        vectors, texts = load_corpus(text_name)
+        tree = rf.create_ahc_tree(vectors, texts)
+        queries = make_queries(vectors, args.queries, args.noise, args.seed)
+        truth = exact_top_k(tree, queries, args.k)
+        exhaustive = [rf._vectorized_best_node(tree, q).index for q in queries]
+
+        print(f"== {text_name}（{tree.n_leaves} 葉節點，{tree.n_nodes} 節點，葉節點上限 {args.leaf_budget}）")
+        print(f"  {'方式':<14}{'recall@' + str(args.k):>10}{'平均葉節點':>10}{'涵蓋掃描結果':>8}{'mean':>10}{'p95':>10}")
+
+        def report(label, search):
+            latencies, recall, size, covered = evaluate(search, tree, queries, truth, exhaustive, args.k)
+            print(
+                f"  {label:<14}{recall:>10.3f}{size:>12.1f}{covered:>12.1%}"
+                f"{latencies.mean():>9.3f}ms{np.percentile(latencies, 95):>8.3f}ms"
+            )
+
+        report("vectorized", lambda q: rf._vectorized_best_node(tree, q))
+        for beam in args.beams:
+            report(f"beam B={beam}", lambda q, beam=beam: rf._beam_best_node(tree, q, beam, args.leaf_budget))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+並發負載下輕量端點的延遲量測
+
+對執行中的服務同時送出多個 /query，並在期間持續呼叫 /available-texts，
+回報輕量端點的 p50 / p99 延遲。/query 不阻塞事件迴圈時，輕量端點延遲應與無負載時相近。
+
+需額外安裝 httpx。
+
+用法:
+    uvicorn app.main:app --port 8000
+    python benchmarks/bench_concurrency.py --url http://localhost:8000 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+import numpy as np
+
+
+async def measure_light(client, duration):
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await client.get("/available-texts")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.05)
+    return np.array(latencies) * 1000
+
+
+async def run(args):
+    async with httpx.AsyncClient(base_url=args.url, timeout=None) as client:
+        baseline = await measure_light(client, 2.0)
+
+        payload = {"query": args.query, "text_name": args.text_name}
+        heavy = [
+            asyncio.create_task(client.post("/query", json=payload))
+            for _ in range(args.concurrency)
+        ]
+        loaded = await measure_light(client, args.duration)
+        responses = await asyncio.gather(*heavy)
+
+    failed = sum(r.status_code != 200 for r in responses)
+    print(f"/query 並發數: {args.concurrency}（失敗 {failed}）")
+    for label, latencies in (("無負載", baseline), ("負載中", loaded)):
+        print(
+            f"  {label} /available-texts: "
+            f"p50={np.percentile(latencies, 50):7.1f}ms p99={np.percentile(latencies, 99):7.1f}ms "
+            f"（{len(latencies)} 次）"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="並發 /query 負載下的輕量端點延遲")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--text-name", default="民法總則")
+    parser.add_argument("--query", default="限制行為能力人未得法定代理人允許所為之法律行為效力為何？")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="負載期間量測秒數")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
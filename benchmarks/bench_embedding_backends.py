@@ -0,0 +1,99 @@
+"""
+詞嵌入推論後端（torch / int8 / onnx / onnx-int8）的 CPU 延遲與向量一致性比較
+
+查詢為 data/data_processed 內附語料中隨機取出的文本片段（長度與一般查詢相近），逐筆編碼量測單一查詢延遲，
+另以 --batch 筆為一批量測批次吞吐量。一致性分兩部分：
+- 與已存 *_embeddings.pkl 的餘弦相似度（建構既有檢索樹所用的向量，服務啟動時的檢查同此）
+- 與 torch 後端對同一批查詢的餘弦相似度
+
+onnx / onnx-int8 需安裝 optimum[onnxruntime]，無法載入的後端會略過。
+
+用法:
+    python benchmarks/bench_embedding_backends.py
+    python benchmarks/bench_embedding_backends.py --backends torch int8 onnx onnx-int8 --threads 4
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import MODEL_NAME
+from src.utils.word_embedding import EMBEDDING_BACKENDS, embedding_agreement, load_sentence_transformer
+from benchmarks.bench_tree_search import DEFAULT_TEXTS, load_corpus, summarize
+
+
+def make_queries(text_names, n_queries, length, seed):
+    rng = np.random.default_rng(seed)
+    texts = [text for text_name in text_names for text in load_corpus(text_name)[1]]
+    queries = []
+    for pick in rng.integers(0, len(texts), size=n_queries):
+        text = texts[pick].strip()
+        start = int(rng.integers(0, max(1, len(text) - length)))
+        queries.append(text[start:start + length])
+    return queries
+
+
+def cosine_rows(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="詞嵌入推論後端的 CPU 延遲與向量一致性比較")
+    parser.add_argument("--model", default=MODEL_NAME, help="詞嵌入模型名稱或路徑")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), help="要比較的後端")
+    parser.add_argument("--texts", nargs="+", default=DEFAULT_TEXTS, help="要測試的語料名稱")
+    parser.add_argument("--queries", type=int, default=50, help="單一查詢延遲的查詢數")
+    parser.add_argument("--length", type=int, default=40, help="查詢長度（字元）")
+    parser.add_argument("--batch", type=int, default=32, help="批次吞吐量的批次大小")
+    parser.add_argument("--sample", type=int, default=128, help="與已存 embeddings 比較的每語料文本數")
+    parser.add_argument("--threads", type=int, default=0, help="intra-op 執行緒數（0 為函式庫預設）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    queries = make_queries(args.texts, args.queries, args.length, args.seed)
+    reference = None
+    print(f"== {args.model}（CPU，{args.queries} 個查詢，長度 {args.length}）")
+    for backend in args.backends:
+        start = time.perf_counter()
+        try:
+            model = load_sentence_transformer(args.model, backend, device="cpu", num_threads=args.threads)
+        except Exception as e:
+            print(f"  {backend:<10}無法載入：{str(e)}")
+            continue
+        load_seconds = time.perf_counter() - start
+
+        model.encode(queries[:1])
+        latencies, vectors = [], []
+        for query in queries:
+            start = time.perf_counter()
+            vectors.append(model.encode(query))
+            latencies.append(time.perf_counter() - start)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        start = time.perf_counter()
+        model.encode(queries[: args.batch], batch_size=args.batch)
+        batch_seconds = time.perf_counter() - start
+
+        if reference is None and backend == "torch":
+            reference = vectors
+        versus_torch = ""
+        if reference is not None and backend != "torch" and reference.shape == vectors.shape:
+            cosines = cosine_rows(vectors, reference)
+            versus_torch = f"  與 torch 餘弦 平均 {cosines.mean():.4f} 最低 {cosines.min():.4f}"
+        print(
+            f"  {backend:<10}載入 {load_seconds:6.1f}s  單筆 {summarize(np.array(latencies) * 1000)}  "
+            f"批次 {min(args.batch, len(queries)) / batch_seconds:7.1f} 筆/秒{versus_torch}"
+        )
+        for text_name, result in embedding_agreement(model, args.sample, args.texts, args.seed).items():
+            if result["mean"] is None:
+                print(f"    {text_name}：維度與已存 embeddings 不同")
+            else:
+                print(f"    {text_name}：與已存 embeddings 餘弦 平均 {result['mean']:.4f} 最低 {result['min']:.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+量化節點向量（float16 / int8）與 float32 的記憶體、延遲與檢索結果比較
+
+以 data/data_processed 內附的語料建構檢索樹，查詢向量取自既有 embeddings 加上高斯雜訊。
+各格式皆以向量化模式（全節點掃描 + 前 TREE_RESCORE_K 個候選以 float32 重算）搜尋，
+與 float32 比較：打分矩陣大小、延遲、最佳節點一致比例，以及回傳子樹（即送往後續排序的文本）
+完全相同的比例與平均 Jaccard；並檢查檢索樹登錄表估計的常駐大小（tree_nbytes）在量化後確實變小。
+
+內附語料只有數百個節點，打分本身不到 1ms，量化的延遲效益要在大型矩陣才看得出來；
+可加上 --synthetic N 以 N 個隨機單位向量量測純打分的延遲。
+
+用法:
+    python benchmarks/bench_quantization.py
+    python benchmarks/bench_quantization.py --rescore-k 4 10 32 --synthetic 100000
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import TREE_RESCORE_K
+import src.retrieval.RAGTree_function as rf
+from src.retrieval.quantization import QuantizedVectors
+from src.retrieval.tree_registry import tree_nbytes
+from benchmarks.bench_tree_search import DEFAULT_TEXTS, load_corpus, make_queries, summarize
+
+
+QUANTIZED_DTYPES = ("float16", "int8")
+
+
+def search_all(tree, queries, rescore_k):
+    latencies, results = [], []
+    for query_vector in queries:
+        start = time.perf_counter()
+        node = rf._vectorized_best_node(tree, query_vector, rescore_k=rescore_k)
+        latencies.append(time.perf_counter() - start)
+        results.append(node.index)
+    return np.array(latencies) * 1000, results
+
+
+def compare(tree, baseline, results):
+    same_node, same_docs, jaccard = [], [], []
+    for expected, actual in zip(baseline, results):
+        expected_ids = set(tree.subtree_leaf_ids(expected).tolist())
+        actual_ids = set(tree.subtree_leaf_ids(actual).tolist())
+        same_node.append(expected == actual)
+        same_docs.append(expected_ids == actual_ids)
+        jaccard.append(len(expected_ids & actual_ids) / len(expected_ids | actual_ids))
+    return np.mean(same_node), np.mean(same_docs), np.mean(jaccard)
+
+
+def bench_corpus(text_name, args):
+    vectors, texts = load_corpus(text_name)
+    tree = rf.create_ahc_tree(vectors, texts)
+    queries = make_queries(vectors, args.queries, args.noise, args.seed)
+
+    latencies, baseline = search_all(tree, queries, None)
+    print(f"== {text_name}（{tree.n_leaves} 葉節點，{tree.n_nodes} 節點）")
+    float32_resident = tree_nbytes(tree)
+    print(f"  {'float32':<18}{tree.scoring_nbytes / 1024:>9.1f}KB  {summarize(latencies)}  常駐估計 {float32_resident / 1024:.1f}KB")
+    for dtype in QUANTIZED_DTYPES:
+        tree.quantize(dtype)
+        resident = tree_nbytes(tree)
+        print(f"  {dtype:<18}常駐估計 {resident / 1024:.1f}KB")
+        assert resident < float32_resident, f"{dtype} 檢索樹的常駐估計（{resident}）應小於 float32（{float32_resident}）"
+        for rescore_k in args.rescore_k:
+            latencies, results = search_all(tree, queries, rescore_k)
+            same_node, same_docs, jaccard = compare(tree, baseline, results)
+            print(
+                f"  {dtype + ' k=' + str(rescore_k):<18}{tree.scoring_nbytes / 1024:>9.1f}KB  {summarize(latencies)}  "
+                f"最佳節點一致 {same_node:6.1%}  文本完全相同 {same_docs:6.1%}  Jaccard {jaccard:.3f}"
+            )
+    tree.quantize("float32")
+
+
+def bench_synthetic(n, dim, args):
+    rng = np.random.default_rng(args.seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = rng.normal(size=(args.queries, dim)).astype(np.float32)
+
+    def time_scores(score):
+        latencies = []
+        for query_vector in queries:
+            start = time.perf_counter()
+            score(query_vector)
+            latencies.append(time.perf_counter() - start)
+        return np.array(latencies) * 1000
+
+    print(f"== 隨機向量 {n} x {dim}（僅打分）")
+    latencies = time_scores(lambda q: vectors @ q)
+    print(f"  {'float32':<10}{vectors.nbytes / 2**20:>9.1f}MB  {summarize(latencies)}")
+    exact_top = [set(np.argsort(-(vectors @ q))[: TREE_RESCORE_K].tolist()) for q in queries]
+    for dtype in QUANTIZED_DTYPES:
+        quantized = QuantizedVectors.from_vectors(vectors, dtype)
+        latencies = time_scores(quantized.scores)
+        overlap = np.mean([
+            len(set(np.argsort(-quantized.scores(q))[: TREE_RESCORE_K].tolist()) & expected) / TREE_RESCORE_K
+            for q, expected in zip(queries, exact_top)
+        ])
+        print(
+            f"  {dtype:<10}{quantized.nbytes / 2**20:>9.1f}MB  {summarize(latencies)}  "
+            f"前 {TREE_RESCORE_K} 名與 float32 重疊 {overlap:6.1%}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="量化節點向量的記憶體、延遲與檢索結果比較")
+    parser.add_argument("--texts", nargs="+", default=DEFAULT_TEXTS, help="要測試的語料名稱")
+    parser.add_argument("--queries", type=int, default=200, help="每個語料的查詢數")
+    parser.add_argument("--noise", type=float, default=0.02, help="查詢向量的雜訊標準差")
+    parser.add_argument("--rescore-k", type=int, nargs="+", default=[TREE_RESCORE_K], help="以 float32 重算的候選數")
+    parser.add_argument("--synthetic", type=int, default=0, help="額外以 N 個隨機向量量測純打分延遲")
+    parser.add_argument("--dim", type=int, default=1024, help="隨機向量維度")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for text_name in args.texts:
+        bench_corpus(text_name, args)
+    if args.synthetic:
+        bench_synthetic(args.synthetic, args.dim, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Cross-Encoder 重排序的延遲與排序一致性比較
+
+以 data/data_processed 內附的語料模擬檢索結果：隨機取一個文本，取其中一段作為查詢文字，
+查詢向量為該文本的 embedding 加上高斯雜訊；候選為與查詢向量最相似的 --candidates 個文本
+（模擬一個數百葉節點的子樹）。基準為 torch 後端、不截斷、不快取，對所有候選推論。比較：
+
+- 預先截斷（RERANKER_PRE_TOP_N）：只對向量相似度前 N 個候選推論
+- 分數快取（RERANKER_CACHE_SIZE）：同一批查詢再執行一次（全部命中）時的延遲
+- 推論後端（RERANKER_BACKEND）：int8 動態量化與 ONNX Runtime（需安裝 optimum[onnxruntime]）
+
+排序一致性以前 k 名與基準的重疊比例、第 1 名相同的比例表示。需可下載或已快取 --model 指定的模型。
+
+用法:
+    python benchmarks/bench_reranker.py
+    python benchmarks/bench_reranker.py --candidates 300 --pre-top-n 25 50 100 --backends torch int8 onnx
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import RERANKER_MODEL_NAME, TOP_K
+import src.retrieval.RAGTree_function as rf
+from src.retrieval.cross_encoder import CrossEncoderScorer, load_cross_encoder
+from benchmarks.bench_tree_search import DEFAULT_TEXTS, load_corpus, summarize
+
+
+def make_cases(text_names, n_queries, n_candidates, noise, seed):
+    """
+    回傳 [(query, candidate_texts, vector_scores)]。
+    """
+    rng = np.random.default_rng(seed)
+    corpora = [load_corpus(text_name) for text_name in text_names]
+    cases = []
+    for i in range(n_queries):
+        vectors, texts = corpora[i % len(corpora)]
+        pick = int(rng.integers(0, len(texts)))
+        text = texts[pick].strip()
+        start = int(rng.integers(0, max(1, len(text) - 30)))
+        query = text[start:start + 30]
+        query_vector = vectors[pick] + rng.normal(0.0, noise, size=vectors.shape[1]).astype(np.float32)
+        scores = rf.cosine_scores(query_vector, vectors)
+        candidates = np.argsort(-scores, kind="stable")[:n_candidates]
+        cases.append((query, [texts[j] for j in candidates], scores[candidates]))
+    return cases
+
+
+def run(scorer, cases, k):
+    latencies, rankings = [], []
+    for query, passages, vector_scores in cases:
+        start = time.perf_counter()
+        indices, _ = scorer.rank(query, passages, k, vector_scores)
+        latencies.append(time.perf_counter() - start)
+        rankings.append([int(i) for i in indices])
+    return np.array(latencies) * 1000, rankings
+
+
+def agreement(baseline, rankings, k):
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(baseline, rankings)])
+    top1 = np.mean([a[0] == b[0] for a, b in zip(baseline, rankings)])
+    return f"前 {k} 名重疊 {overlap:6.1%}  第 1 名相同 {top1:6.1%}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-Encoder 重排序的延遲與排序一致性比較")
+    parser.add_argument("--texts", nargs="+", default=DEFAULT_TEXTS, help="要測試的語料名稱")
+    parser.add_argument("--model", default=RERANKER_MODEL_NAME, help="Cross-Encoder 模型名稱或路徑")
+    parser.add_argument("--queries", type=int, default=30, help="查詢數")
+    parser.add_argument("--candidates", type=int, default=300, help="每個查詢的候選數")
+    parser.add_argument("--k", type=int, default=TOP_K, help="取前 k 名")
+    parser.add_argument("--pre-top-n", type=int, nargs="+", default=[25, 50, 100], help="預先截斷的候選數")
+    parser.add_argument("--backends", nargs="+", default=["int8", "onnx"], help="與 torch 比較的推論後端")
+    parser.add_argument("--noise", type=float, default=0.02, help="查詢向量的雜訊標準差")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cases = make_cases(args.texts, args.queries, args.candidates, args.noise, args.seed)
+    model, _ = load_cross_encoder(args.model, "torch", device="cpu")
+    print(f"== {args.model}（{args.queries} 查詢 × {args.candidates} 候選，CPU）")
+
+    baseline_latencies, baseline = run(CrossEncoderScorer(model), cases, args.k)
+    print(f"  {'torch 全部候選':<22}{summarize(baseline_latencies)}")
+
+    for pre_top_n in args.pre_top_n:
+        latencies, rankings = run(CrossEncoderScorer(model, pre_top_n=pre_top_n), cases, args.k)
+        print(f"  {'torch 預先截斷 ' + str(pre_top_n):<22}{summarize(latencies)}  {agreement(baseline, rankings, args.k)}")
+
+    cached = CrossEncoderScorer(model, cache_size=args.queries * args.candidates)
+    run(cached, cases, args.k)
+    latencies, rankings = run(cached, cases, args.k)
+    print(f"  {'torch 快取命中':<22}{summarize(latencies)}  {agreement(baseline, rankings, args.k)}")
+
+    for backend in args.backends:
+        model, loaded = load_cross_encoder(args.model, backend)
+        if loaded != backend:
+            continue
+        latencies, rankings = run(CrossEncoderScorer(model, backend=loaded), cases, args.k)
+        print(f"  {loaded + ' 全部候選':<22}{summarize(latencies)}  {agreement(baseline, rankings, args.k)}")
+
+
+if __name__ == "__main__":
+    main()
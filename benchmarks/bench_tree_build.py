@@ -0,0 +1,127 @@
+"""
+檢索樹建構策略比較：建構時間、峰值記憶體（RSS）與樹的形狀
+
+每個策略在獨立的子行程中建構，以 getrusage 取得該行程的峰值 RSS，互不干擾。
+除了內附語料，也可用 --synthetic 產生大量合成向量，觀察 exact 策略的 O(n²) 距離矩陣
+與 kmeans 兩階段策略的記憶體差異。
+
+樹的形狀以樹高表示；single linkage 容易形成很深的鏈狀樹，
+ward / average / complete 則較平衡。
+
+用法:
+    python benchmarks/bench_tree_build.py
+    python benchmarks/bench_tree_build.py --synthetic 50000 --strategies ward ward+kmeans single+kmeans
+"""
+
+import argparse
+import json
+import os
+import pickle
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import DATA_DIR
+
+
+DEFAULT_TEXTS = ["民法總則", "土地法與都市計畫法"]
+DEFAULT_STRATEGIES = ["single", "average", "complete", "ward", "single+kmeans", "ward+kmeans"]
+
+
+def load_corpus(text_name):
+    with open(os.path.join(DATA_DIR, f"{text_name}_embeddings.pkl"), "rb") as f:
+        vectors = np.asarray(pickle.load(f), dtype=np.float32)
+    with open(os.path.join(DATA_DIR, f"{text_name}.pkl"), "rb") as f:
+        texts = pickle.load(f)
+    return vectors, texts
+
+
+def synthetic_corpus(n, dim, n_topics, seed):
+    """
+    以 n_topics 個主題中心加上雜訊產生正規化向量。
+    """
+    rng = np.random.default_rng(seed)
+    topics = rng.normal(size=(n_topics, dim)).astype(np.float32)
+    vectors = topics[rng.integers(0, n_topics, size=n)] + rng.normal(0.0, 0.6, size=(n, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors, [f"chunk-{i}" for i in range(n)]
+
+
+def peak_rss_mb():
+    # Linux 的 ru_maxrss 單位為 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_worker(args):
+    """
+    子行程：建構一次並以 JSON 輸出量測結果。
+    """
+    # 只匯入建構所需的模組，避免載入 torch 等套件墊高基準 RSS
+    from src.retrieval.tree_builder import TreeBuilder
+
+    if args.synthetic:
+        vectors, texts = synthetic_corpus(args.synthetic, args.dim, args.topics, args.seed)
+    else:
+        vectors, texts = load_corpus(args.worker_text)
+    method, _, strategy = args.worker_strategy.partition("+")
+    builder = TreeBuilder(method, strategy or "exact", args.max_cluster_size)
+
+    baseline = peak_rss_mb()
+    start = time.perf_counter()
+    tree = builder.build(vectors, texts)
+    elapsed = time.perf_counter() - start
+    peak = peak_rss_mb()
+
+    print(json.dumps({
+        "seconds": elapsed,
+        "peak_rss_mb": peak,
+        "build_rss_mb": peak - baseline,
+        "depth": int(tree.depths[tree.root_index]),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="檢索樹建構策略的時間與記憶體比較")
+    parser.add_argument("--texts", nargs="+", default=DEFAULT_TEXTS, help="要測試的語料名稱")
+    parser.add_argument("--strategies", nargs="+", default=DEFAULT_STRATEGIES,
+                        help="linkage 方法，可加上 +kmeans 使用兩階段建構，例如 ward+kmeans")
+    parser.add_argument("--max-cluster-size", type=int, default=None, help="kmeans 策略單次聚類的向量數上限")
+    parser.add_argument("--synthetic", type=int, default=0, help="改用此數量的合成向量")
+    parser.add_argument("--dim", type=int, default=256, help="合成向量維度")
+    parser.add_argument("--topics", type=int, default=200, help="合成向量的主題數")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--worker-text", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-strategy", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker_strategy:
+        run_worker(args)
+        return
+
+    corpora = [f"synthetic-{args.synthetic}"] if args.synthetic else args.texts
+    passthrough = sys.argv[1:]
+    for corpus in corpora:
+        print(f"== {corpus}")
+        print(f"  {'策略':<16}{'時間':>10}{'建構RSS':>10}{'峰值RSS':>10}{'樹高':>8}")
+        for strategy in args.strategies:
+            cmd = [sys.executable, os.path.abspath(__file__), *passthrough,
+                   "--worker-text", corpus, "--worker-strategy", strategy]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                reason = (proc.stderr.strip().splitlines() or ["killed"])[-1]
+                print(f"  {strategy:<16}失敗：{reason}")
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(
+                f"  {strategy:<16}{result['seconds']:>9.2f}s{result['build_rss_mb']:>8.0f}MB"
+                f"{result['peak_rss_mb']:>8.0f}MB{result['depth']:>10}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+最相似節點搜尋的效能比較：逐節點 BFS vs 向量化矩陣乘法
+
+以 data/data_processed 內附的語料建構檢索樹，查詢向量取自既有 embeddings
+加上少量高斯雜訊（不需載入詞嵌入模型），比較兩種方式的延遲與結果一致性。
+
+用法:
+    python benchmarks/bench_tree_search.py
+    python benchmarks/bench_tree_search.py --texts 民法總則 --queries 500
+"""
+
+import argparse
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.config import DATA_DIR
+import src.retrieval.RAGTree_function as rf
+
+
+DEFAULT_TEXTS = ["民法總則", "土地法與都市計畫法"]
+
+
+def load_corpus(text_name):
+    with open(os.path.join(DATA_DIR, f"{text_name}_embeddings.pkl"), "rb") as f:
+        vectors = np.asarray(pickle.load(f), dtype=np.float32)
+    with open(os.path.join(DATA_DIR, f"{text_name}.pkl"), "rb") as f:
+        texts = pickle.load(f)
+    return vectors, texts
+
+
+def make_queries(vectors, n_queries, noise, seed):
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(0, len(vectors), size=n_queries)
+    queries = vectors[picks] + rng.normal(0.0, noise, size=(n_queries, vectors.shape[1]))
+    return queries.astype(np.float32)
+
+
+def time_search(search, tree, queries):
+    latencies = []
+    results = []
+    for query_vector in queries:
+        start = time.perf_counter()
+        node = search(tree, query_vector)
+        latencies.append(time.perf_counter() - start)
+        results.append(node.index)
+    return np.array(latencies) * 1000, results
+
+
+def summarize(latencies):
+    return (
+        f"mean={latencies.mean():8.3f}ms "
+        f"p50={np.percentile(latencies, 50):8.3f}ms "
+        f"p95={np.percentile(latencies, 95):8.3f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BFS vs 向量化最相似節點搜尋效能比較")
+    parser.add_argument("--texts", nargs="+", default=DEFAULT_TEXTS, help="要測試的語料名稱")
+    parser.add_argument("--queries", type=int, default=200, help="每個語料的查詢數")
+    parser.add_argument("--noise", type=float, default=0.02, help="查詢向量的雜訊標準差")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for text_name in args.texts:
+        vectors, texts = load_corpus(text_name)
+        tree = rf.create_ahc_tree(vectors, texts)
+        queries = make_queries(vectors, args.queries, args.noise, args.seed)
+
+        bfs_ms, bfs_nodes = time_search(rf._bfs_best_node, tree, queries)
+        vec_ms, vec_nodes = time_search(rf._vectorized_best_node, tree, queries)
+        agree = sum(a == b for a, b in zip(bfs_nodes, vec_nodes))
+
+        print(f"== {text_name}（{tree.n_leaves} 葉節點，{tree.n_nodes} 節點）")
+        print(f"  bfs        {summarize(bfs_ms)}")
+        print(f"  vectorized {summarize(vec_ms)}")
+        print(f"  加速倍數: {bfs_ms.mean() / vec_ms.mean():.1f}x")
+        print(f"  結果一致: {agree}/{len(queries)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+"""
+離線語料處理流程：data/raw/*.txt → 分塊 → 向量 → 檢索樹
+
+- 分塊：以 process pool 平行處理各檔案，結果依完成順序串流給下一階段
+- 編碼：跨檔案累積為固定大小的批次送入詞嵌入模型
+- 寫出：{title}.pkl 與 {title}_embeddings.pkl 先寫入暫存檔再以 os.replace 替換，不會留下寫一半的檔案
+- 檢查點：每完成一個檔案即記錄於 {out_dir}/.ingest_checkpoint.json（來源雜湊、分塊參數、模型），
+  中斷後重新執行會略過已完成且未變更的檔案
+- 檢索樹：寫出後以 tree_artifact 建構預建檢索樹（可用 --no-tree 略過）
+
+用法:
+    python -m src.data_processing.ingest
+    python -m src.data_processing.ingest --raw-dir data/raw --out-dir data/data_processed --batch-size 256
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# 添加專案根目錄到路徑，以便引入其他模組
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.config import (
+    DATA_DIR,
+    RAW_DATA_DIR,
+    TREE_ARTIFACT_DIR,
+    MODEL_NAME,
+    INGEST_CHUNK_SIZE,
+    INGEST_CHUNK_OVERLAP,
+    INGEST_BATCH_SIZE,
+    INGEST_WORKERS,
+)
+
+
+CHECKPOINT_FILE = ".ingest_checkpoint.json"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def chunk_file(path, chunk_size, chunk_overlap):
+    """
+    Summary:
+    在子行程中讀取並分塊單一 txt 檔，回傳 (title, source_hash, chunks, 耗時秒數)。
+
+    path: txt 檔路徑
+    """
+    from src.utils.word_chunking import RagChunking
+
+    start_time = time.perf_counter()
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    title = os.path.splitext(os.path.basename(path))[0]
+    chunks = RagChunking(content).text_chunking(chunk_size, chunk_overlap)
+    return title, file_sha256(path), chunks, time.perf_counter() - start_time
+
+
+def atomic_pickle(obj, path):
+    """
+    先寫入同目錄的暫存檔再以 os.replace 替換。
+    """
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(obj, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class Checkpoint:
+    """
+    記錄已完成的檔案，每次更新都以原子方式寫回。
+    """
+
+    def __init__(self, out_dir):
+        self.path = os.path.join(out_dir, CHECKPOINT_FILE)
+        self.entries = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.entries = json.load(f)
+            except (OSError, ValueError):
+                self.entries = {}
+
+    def is_done(self, title, signature, out_dir):
+        entry = self.entries.get(title)
+        if entry is not None and entry.get("empty"):
+            # 沒有任何文本塊的檔案不會寫出輸出檔
+            return {key: value for key, value in entry.items() if key != "empty"} == signature
+        outputs_exist = all(os.path.exists(p) for p in output_paths(title, out_dir))
+        return outputs_exist and entry == signature
+
+    def mark_done(self, title, signature):
+        self.entries[title] = signature
+        tmp_path = f"{self.path}.tmp-{os.getpid()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+
+def output_paths(title, out_dir):
+    """
+    回傳 (texts_path, embeddings_path)，與檢索服務讀取的檔名一致。
+    """
+    return os.path.join(out_dir, f"{title}.pkl"), os.path.join(out_dir, f"{title}_embeddings.pkl")
+
+
+class StageTimer:
+    """
+    累計各階段的處理時間與文本塊數，用於回報吞吐量。
+    """
+
+    def __init__(self):
+        self.seconds = {}
+        self.chunks = {}
+
+    def add(self, stage, seconds, chunks):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.chunks[stage] = self.chunks.get(stage, 0) + chunks
+
+    def report(self, wall_seconds):
+        lines = []
+        for stage, seconds in self.seconds.items():
+            rate = self.chunks[stage] / seconds if seconds > 0 else float("inf")
+            lines.append(f"  {stage:<8}{self.chunks[stage]:>8} 塊 {seconds:>9.2f} 秒 {rate:>12.1f} 塊/秒")
+        total = self.chunks.get("encode", 0)
+        if wall_seconds > 0:
+            lines.append(f"  {'整體':<8}{total:>8} 塊 {wall_seconds:>9.2f} 秒 {total / wall_seconds:>12.1f} 塊/秒")
+        return "\n".join(lines)
+
+
+def ingest(
+    raw_dir=RAW_DATA_DIR,
+    out_dir=DATA_DIR,
+    model=None,
+    chunk_size=INGEST_CHUNK_SIZE,
+    chunk_overlap=INGEST_CHUNK_OVERLAP,
+    batch_size=INGEST_BATCH_SIZE,
+    workers=INGEST_WORKERS,
+    build_trees=True,
+    artifact_dir=TREE_ARTIFACT_DIR,
+    model_name=MODEL_NAME,
+    force=False,
+):
+    """
+    Summary:
+    執行完整的語料處理流程，回傳各階段統計（StageTimer）。
+
+    raw_dir: 原始 txt 目錄
+    out_dir: 輸出 pkl 目錄
+    model: 詞嵌入模型，預設以 WordEmbedding 載入
+    batch_size: 每次送入模型的文本塊數
+    workers: 分塊的行程數，0 表示使用 CPU 核心數
+    build_trees: 是否在寫出後建構預建檢索樹
+    force: 忽略檢查點，全部重新處理
+    """
+    start_time = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = Checkpoint(out_dir)
+    timer = StageTimer()
+    params = {"chunk_size": chunk_size, "chunk_overlap": chunk_overlap, "model_name": model_name}
+
+    paths = sorted(
+        os.path.join(raw_dir, name) for name in os.listdir(raw_dir) if name.endswith(".txt")
+    )
+    pending_paths = []
+    for path in paths:
+        title = os.path.splitext(os.path.basename(path))[0]
+        signature = {"source_hash": file_sha256(path), **params}
+        if not force and checkpoint.is_done(title, signature, out_dir):
+            print(f"略過（已完成）：{title}")
+            continue
+        pending_paths.append(path)
+    if not pending_paths:
+        print("沒有需要處理的檔案")
+        return timer
+
+    if model is None:
+        from src.utils.word_embedding import WordEmbedding
+
+        model = WordEmbedding().load_model()
+
+    # 跨檔案累積的待編碼文本塊：(title, 該檔第幾塊, 文本)
+    buffer = []
+    files = {}
+
+    def encode_batch(batch):
+        encode_start = time.perf_counter()
+        vectors = np.asarray(
+            model.encode([text for _, _, text in batch], batch_size=batch_size, show_progress_bar=False),
+            dtype=np.float32,
+        ).reshape(len(batch), -1)
+        timer.add("encode", time.perf_counter() - encode_start, len(batch))
+        for (title, position, _), vector in zip(batch, vectors):
+            entry = files[title]
+            entry["vectors"][position] = vector
+            entry["remaining"] -= 1
+            if entry["remaining"] == 0:
+                finish_file(title)
+
+    def finish_file(title):
+        entry = files.pop(title)
+        texts_path, embeddings_path = output_paths(title, out_dir)
+        if not entry["chunks"]:
+            # 空白的語料不寫出輸出檔（否則會出現在可用文本列表中，查詢時無法建構檢索樹），並移除先前版本的輸出
+            for path in (texts_path, embeddings_path):
+                if os.path.exists(path):
+                    os.remove(path)
+            checkpoint.mark_done(title, {"source_hash": entry["source_hash"], **params, "empty": True})
+            print(f"略過（沒有任何文本塊）：{title}")
+            return
+
+        write_start = time.perf_counter()
+        vectors = np.stack(entry["vectors"])
+        atomic_pickle(vectors, embeddings_path)
+        atomic_pickle(entry["chunks"], texts_path)
+        checkpoint.mark_done(title, {"source_hash": entry["source_hash"], **params})
+        timer.add("write", time.perf_counter() - write_start, len(entry["chunks"]))
+        print(f"✅ 已寫出 {title}：{len(entry['chunks'])} 塊")
+
+        if build_trees:
+            from src.retrieval.tree_artifact import build_tree_artifact
+
+            tree_start = time.perf_counter()
+            build_tree_artifact(title, out_dir, artifact_dir, model_name)
+            timer.add("tree", time.perf_counter() - tree_start, len(entry["chunks"]))
+
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=min(workers, len(pending_paths))) as executor:
+        futures = [executor.submit(chunk_file, path, chunk_size, chunk_overlap) for path in pending_paths]
+        for future in as_completed(futures):
+            title, source_hash, chunks, seconds = future.result()
+            timer.add("chunk", seconds, len(chunks))
+            files[title] = {
+                "chunks": chunks,
+                "vectors": [None] * len(chunks),
+                "remaining": len(chunks),
+                "source_hash": source_hash,
+            }
+            if not chunks:
+                finish_file(title)
+                continue
+            buffer.extend((title, i, text) for i, text in enumerate(chunks))
+            while len(buffer) >= batch_size:
+                batch, buffer = buffer[:batch_size], buffer[batch_size:]
+                encode_batch(batch)
+
+    if buffer:
+        encode_batch(buffer)
+
+    print("各階段吞吐量：")
+    print(timer.report(time.perf_counter() - start_time))
+    return timer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="原始 txt → 分塊 → 向量 → 檢索樹")
+    parser.add_argument("--raw-dir", default=str(RAW_DATA_DIR), help="原始 txt 目錄")
+    parser.add_argument("--out-dir", default=str(DATA_DIR), help="輸出 pkl 目錄")
+    parser.add_argument("--artifact-dir", default=str(TREE_ARTIFACT_DIR), help="預建檢索樹目錄")
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=INGEST_CHUNK_OVERLAP)
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE, help="每次編碼的文本塊數")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="分塊行程數，0 為 CPU 核心數")
+    parser.add_argument("--no-tree", action="store_true", help="不建構預建檢索樹")
+    parser.add_argument("--force", action="store_true", help="忽略檢查點，全部重新處理")
+    args = parser.parse_args(argv)
+
+    ingest(
+        raw_dir=args.raw_dir,
+        out_dir=args.out_dir,
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        build_trees=not args.no_tree,
+        artifact_dir=args.artifact_dir,
+        force=args.force,
+    )
+
+
+if __name__ == "__main__":
+    main()
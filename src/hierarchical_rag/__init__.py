@@ -16,6 +16,8 @@ __email__ = "your.email@example.com"
 # 導入主要類別和函數
 from .retrieval.RAGTree_function import (
     Node,
+    FlatTree,
+    NodeView,
     create_ahc_tree,
     build_tree,
     tree_search,
@@ -45,6 +47,8 @@ from .data_processing.data_dealer import DataDealer
 __all__ = [
     # 核心檢索類別
     "Node",
+    "FlatTree",
+    "NodeView",
     "QueryProcessor", 
     "MultiLevelQueryProcessor",
     "WordEmbedding",
@@ -11,19 +11,21 @@ from langchain.text_splitter import RecursiveCharacterTextSplitter
 # 添加專案根目錄到路徑，以便引入其他模組
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
-from app.config import MAX_RESULTS, TOP_K
-from app.config import RERANKER_USE_CROSS_ENCODER, RERANKER_MODEL_NAME
+from app.config import MAX_RESULTS, TOP_K, TREE_SEARCH_MODE, TREE_BEAM_WIDTH, TREE_LEAF_BUDGET, TREE_RESCORE_K
+from app.config import RERANKER_USE_CROSS_ENCODER
 from app.config import RERANKER_ENABLE_IN_PIPELINE
 
-from fastcluster import linkage
 from collections import deque
 
 from scipy.spatial.distance import cosine, cdist
-from sklearn.preprocessing import normalize
-import torch
-from sentence_transformers import CrossEncoder
 
 import src.retrieval.generated_function as gf
+from src.retrieval.flat_tree import FlatTree, NodeView
+from src.retrieval.retrieval_hit import RetrievalHit, unique_texts
+from src.retrieval.tree_storage import save_flat_tree, load_flat_tree
+from src.retrieval.tree_builder import TreeBuilder
+from src.retrieval.cross_encoder import get_cross_encoder_scorer
+from src.utils.embedding_cache import cached_encode
 
 
 ##Tree方法函數
@@ -44,131 +46,149 @@ class Node:
 def calculate_subtree_depth(node):
     """
     Summary:
-    用來計算樹的深度的函式
+    用來計算樹的深度的函式（以迭代後序走訪實作，避免單一連結產生的長鏈超過遞迴上限）
 
     node:節點
     """
     if node is None:
         return -1
-    left_depth = calculate_subtree_depth(node.left)
-    right_depth = calculate_subtree_depth(node.right)
-    node.subtree_depth = max(left_depth, right_depth) + 1
+
+    stack = [(node, False)]
+    while stack:
+        current, children_done = stack.pop()
+        if children_done:
+            left_depth = current.left.subtree_depth if current.left else -1
+            right_depth = current.right.subtree_depth if current.right else -1
+            current.subtree_depth = max(left_depth, right_depth) + 1
+            continue
+        stack.append((current, True))
+        if current.right:
+            stack.append((current.right, False))
+        if current.left:
+            stack.append((current.left, False))
+
     return node.subtree_depth
 
 
 def build_tree(vectors, texts, linkage_matrix):
     """
     Summary:
-    這是關於檢索樹建構的演算法
+    這是關於檢索樹建構的演算法，所有節點中心向量存放於單一連續矩陣（FlatTree）
 
     vectors: np.array
     texts: list[str]
     linkage_matrix: 可自訂
     """
-    n = len(vectors)
-    nodes = [
-        Node(vector / np.linalg.norm(vector), text, i)
-        for i, (vector, text) in enumerate(zip(vectors, texts))
-    ]
-
-    current_index = n
-
-    for i, (c1, c2, dist, sample_count) in enumerate(linkage_matrix):
-        c1, c2 = int(c1), int(c2)
-        count_c1 = nodes[c1].sample_count
-        count_c2 = nodes[c2].sample_count
-        new_vector = (nodes[c1].vector * count_c1 + nodes[c2].vector * count_c2) / (
-            count_c1 + count_c2
-        )
-        new_vector /= np.linalg.norm(new_vector)
+    return FlatTree.from_linkage(vectors, texts, linkage_matrix)
 
-        new_node = Node(new_vector, None, current_index, nodes[c1], nodes[c2])
-        new_node.sample_count = count_c1 + count_c2
-        nodes.append(new_node)
 
-        current_index += 1
-
-    root = nodes[-1]
-    calculate_subtree_depth(root)
-    return root
-
-
-def create_ahc_tree(vectors, texts):
+def create_ahc_tree(vectors, texts, method=None, strategy=None):
     """
     Summary:
     建構檢索樹
 
     vectors: np.array
     texts: list[str]
+    method: linkage 方法（single / average / complete / ward），預設依 TREE_LINKAGE_METHOD
+    strategy: exact 或 kmeans（先分群再聚類），預設依 TREE_BUILD_STRATEGY
     """
-    linkage_matrix = linkage(vectors, method="single", metric="cosine")
+    vectors = np.asarray(vectors)
+    if len(vectors) < 2:
+        # 單一文本無法做聚類，直接以葉節點作為根
+        return build_tree(vectors, texts, np.empty((0, 4)))
+    linkage_matrix = TreeBuilder(method, strategy).linkage(vectors)
     root = build_tree(vectors, texts, linkage_matrix)
     return root
 
 
-# rerank函數
-
+def _as_node(root):
+    """
+    將 FlatTree 轉為其根節點的 NodeView；Node 與 NodeView 原樣回傳。
+    """
+    if isinstance(root, FlatTree):
+        return root.root
+    return root
 
-_CROSS_ENCODER_INSTANCE = None
 
+# rerank函數
 
-def _determine_device():
-    if torch.cuda.is_available():
-        return "cuda"
-    if hasattr(torch.backends, "mps") and torch.backends.mps.is_available():
-        return "mps"
-    return "cpu"
 
+def cosine_scores(query_vector, passage_vectors):
+    """
+    Summary:
+    以單次矩陣乘法計算查詢向量與各文本向量的餘弦相似度（零向量的相似度為 0）。
 
-def _get_cross_encoder():
-    global _CROSS_ENCODER_INSTANCE
-    if _CROSS_ENCODER_INSTANCE is None:
-        device = _determine_device()
-        _CROSS_ENCODER_INSTANCE = CrossEncoder(RERANKER_MODEL_NAME, device=device)
-        print(f"已載入 CrossEncoder: {RERANKER_MODEL_NAME} 到 {device}")
-    return _CROSS_ENCODER_INSTANCE
+    query_vector: (d,) 或 (1, d)
+    passage_vectors: (n, d)
+    """
+    query_vector = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    passage_vectors = np.asarray(passage_vectors, dtype=np.float32).reshape(-1, query_vector.shape[0])
+    dots = passage_vectors @ query_vector
+    norms = np.linalg.norm(passage_vectors, axis=1) * np.linalg.norm(query_vector)
+    return np.divide(dots, norms, out=np.zeros_like(dots), where=norms > 0)
 
 
-def rerank_texts(query, passages, model, k):
+def rerank_scores(query, passages, model, k, query_vector=None, passage_vectors=None):
     """
     Summary:
-    可切換的文本重排序函數：
-    - 若啟用 Cross-Encoder，使用 cross-encoder 直接對 (query, passage) 配對打分
-    - 否則回退為 embedding 餘弦相似度排序
+    可切換的文本重排序函數，回傳 (indices, scores)：前 k 名在 passages 中的位置與其分數，依分數由高到低。
+    - 若啟用 Cross-Encoder，使用 cross-encoder 直接對 (query, passage) 配對打分；
+      提供向量時先以餘弦相似度預先截斷為前 RERANKER_PRE_TOP_N 個候選
+    - 否則回退為 embedding 餘弦相似度排序；已提供的向量（例如檢索樹中的葉節點向量）不再重新編碼
 
     query: str
     passages: list[str]
-    model: sentence-transformers embedding model（在未啟用 Cross-Encoder 時使用）
+    model: sentence-transformers embedding model（在未啟用 Cross-Encoder 且未提供向量時使用）
     k: int
+    query_vector: 已編碼的查詢向量
+    passage_vectors: 已編碼的 (n, d) 文本向量，順序與 passages 相同
     """
     if RERANKER_USE_CROSS_ENCODER:
-        ce = _get_cross_encoder()
-        pairs = [(query, p) for p in passages]
-        scores = ce.predict(pairs)
-        ranked_indices = np.argsort(scores)[::-1][:k]
-        return [passages[i] for i in ranked_indices]
+        vector_scores = None
+        if query_vector is not None and passage_vectors is not None:
+            vector_scores = cosine_scores(query_vector, passage_vectors)
+        return get_cross_encoder_scorer().rank(query, passages, k, vector_scores)
 
     # 回退：使用 embedding 餘弦相似度
-    query_vector = model.encode(query)
-    passage_vectors = model.encode(passages)
-
-    query_vector = normalize(query_vector)
-    passage_vectors = normalize(passage_vectors)
+    if query_vector is None:
+        query_vector = cached_encode(model, query)
+    if passage_vectors is None:
+        passage_vectors = cached_encode(model, passages)
 
-    similarities = np.dot(passage_vectors, query_vector.T).squeeze()
+    similarities = cosine_scores(query_vector, passage_vectors)
     ranked_indices = np.argsort(similarities)[::-1][:k]
+    return ranked_indices, similarities[ranked_indices]
+
+
+def rerank_texts(query, passages, model, k):
+    """
+    rerank_scores 的文本版本，回傳前 k 名的文本列表。
+    """
+    ranked_indices, _ = rerank_scores(query, passages, model, k)
     return [passages[i] for i in ranked_indices]
 
 
 def save_tree(root, filename):
-    with open(filename, "wb") as f:
-        pickle.dump(root, f)
+    """
+    儲存檢索樹：FlatTree 以二進位目錄格式（可 mmap）儲存，舊版 Node 樹以 pickle 儲存。
+    """
+    if isinstance(root, FlatTree):
+        save_flat_tree(root, filename)
+    else:
+        with open(filename, "wb") as f:
+            pickle.dump(root, f)
     print(f"Tree saved to {filename}")
 
 
-def load_tree(filename):
-    with open(filename, "rb") as f:
-        root = pickle.load(f)
+def load_tree(filename, mmap_mode="r"):
+    """
+    載入檢索樹：目錄格式以 mmap_mode（預設唯讀 mmap）開啟，pickle 檔案則直接反序列化。
+    """
+    if os.path.isdir(filename):
+        root = load_flat_tree(filename, mmap_mode)
+    else:
+        with open(filename, "rb") as f:
+            root = pickle.load(f)
     print(f"Tree loaded from {filename}")
     return root
 
@@ -189,15 +209,18 @@ class QueryProcessor:
         return chunked_texts[:max_chunks]
 
 
-def find_most_similar_node(root, query, model):
+# 向量化搜尋時，與最高內積差距在此範圍內的節點會以 scipy cosine 重新比較
+_TIE_TOLERANCE = 1e-4
+
+
+def _bfs_best_node(root, query_vector):
     """
-    使用BFS搜索檢索樹內最相似的節點。
+    使用BFS逐節點計算餘弦距離，回傳距離最小的節點。
     """
     min_distance = float("inf")
     most_similar_node = None
-    query_vector = model.encode(query)
 
-    queue = deque([root])
+    queue = deque([_as_node(root)])
     while queue:
         node = queue.popleft()
         distance = cosine(query_vector, node.vector)
@@ -212,97 +235,448 @@ def find_most_similar_node(root, query, model):
     return most_similar_node
 
 
+def _rescore_candidates(tree, query_vector, coarse_scores, k=None):
+    """
+    量化打分只用於挑選候選：取粗略分數最高的 k 個節點，以 float32 中心向量重新計算分數，
+    其餘節點視為 -inf。
+    """
+    k = min(max(1, k or TREE_RESCORE_K), len(coarse_scores))
+    candidates = np.argpartition(-coarse_scores, k - 1)[:k]
+    exact = np.full(len(coarse_scores), -np.inf, dtype=np.float32)
+    exact[candidates] = np.nan_to_num(
+        np.asarray(tree.vectors[candidates], dtype=np.float32) @ np.asarray(query_vector, dtype=np.float32),
+        nan=-np.inf,
+    )
+    return exact
+
+
+def _vectorized_best_node(tree, query_vector, scores=None, rescore_k=None):
+    """
+    以一次矩陣向量乘積對所有節點打分並取最大者。
+
+    節點中心皆已正規化，內積最大即餘弦距離最小；為了與BFS結果完全一致，
+    分數接近最大值的候選會以相同的 scipy cosine 重新計算，並依BFS順序決定平手。
+    檢索樹已量化時，先以 float32 重新計算粗略分數最高的 TREE_RESCORE_K 個節點。
+    scores 可傳入批次計算好的節點分數，避免重複計算。
+    """
+    if scores is None:
+        scores = tree.score_nodes(query_vector)
+    scores = np.nan_to_num(scores, nan=-np.inf)
+    if tree.quantized is not None:
+        scores = _rescore_candidates(tree, query_vector, scores, rescore_k)
+    tolerance = _TIE_TOLERANCE * max(float(np.linalg.norm(query_vector)), 1.0)
+    candidates = np.flatnonzero(scores >= scores.max() - tolerance)
+
+    if len(candidates) == 1:
+        return tree.node(candidates[0])
+
+    bfs_rank = tree.bfs_rank
+    min_distance = float("inf")
+    best_index = candidates[0]
+    for index in sorted(candidates, key=lambda i: bfs_rank[i]):
+        distance = cosine(query_vector, tree.vectors[index])
+        if distance < min_distance:
+            min_distance = distance
+            best_index = index
+    return tree.node(best_index)
+
+
+def _beam_best_node(tree, query_vector, beam_width=None, leaf_budget=None):
+    """
+    Summary:
+    自根節點往下的 beam search：每層只保留與查詢最相似的 beam_width 個節點，
+    子樹葉節點數不超過 leaf_budget（或已是葉節點）的節點不再展開，成為候選；
+    回傳候選中餘弦相似度最高者。每層只需計算 2 * beam_width 個節點，
+    在平衡的樹上查詢成本約為 O(beam_width * log n)。
+
+    tree: FlatTree
+    query_vector: (d,) 查詢向量
+    beam_width: 每層保留的節點數，預設為 TREE_BEAM_WIDTH
+    leaf_budget: 停止展開的子樹葉節點數上限，預設為 TREE_LEAF_BUDGET
+    """
+    beam_width = max(1, beam_width or TREE_BEAM_WIDTH)
+    leaf_budget = max(1, leaf_budget or TREE_LEAF_BUDGET)
+    query_vector = np.asarray(query_vector, dtype=np.float32)
+    vectors, children_of, sample_counts = tree.vectors, tree.children, tree.sample_counts
+
+    # 節點中心皆已正規化，內積即可比較餘弦相似度
+    best_index, best_score = tree.root_index, -np.inf
+    frontier = np.array([tree.root_index])
+    scores = vectors[frontier] @ query_vector
+    while len(frontier):
+        stop = (sample_counts[frontier] <= leaf_budget) | (children_of[frontier, 0] < 0)
+        if stop.any():
+            stopped_scores = np.nan_to_num(scores[stop], nan=-np.inf)
+            i = int(np.argmax(stopped_scores))
+            if stopped_scores[i] > best_score:
+                best_index, best_score = int(frontier[stop][i]), stopped_scores[i]
+
+        expand = frontier[~stop]
+        if not len(expand):
+            break
+        children = children_of[expand].ravel()
+        child_scores = np.nan_to_num(vectors[children] @ query_vector, nan=-np.inf)
+        if len(children) > beam_width:
+            keep = np.argpartition(-child_scores, beam_width - 1)[:beam_width]
+            children, child_scores = children[keep], child_scores[keep]
+        frontier, scores = children, child_scores
+
+    return tree.node(best_index)
+
+
+def _supports_vectorized(root):
+    if isinstance(root, FlatTree):
+        return True
+    return isinstance(root, NodeView) and root.index == root.tree.root_index
+
+
+def _as_tree(root):
+    # 固定於目前狀態，同一次檢索中的打分與取子樹不受並發的增量異動影響
+    return (root if isinstance(root, FlatTree) else root.tree).snapshot()
+
+
+def _find_best_node(root, query_vector, mode=None):
+    mode = mode or TREE_SEARCH_MODE
+    if mode == "vectorized" and _supports_vectorized(root):
+        return _vectorized_best_node(_as_tree(root), query_vector)
+    if mode == "beam" and _supports_vectorized(root):
+        return _beam_best_node(_as_tree(root), query_vector)
+    return _bfs_best_node(root, query_vector)
+
+
+def _find_best_nodes(root, query_vectors, mode=None):
+    """
+    批次版的 _find_best_node：向量化模式下以單次 (q, d) × (d, N) 矩陣乘法為所有子查詢打分。
+    """
+    mode = mode or TREE_SEARCH_MODE
+    if mode == "vectorized" and _supports_vectorized(root):
+        tree = _as_tree(root)
+        scores = tree.score_nodes(query_vectors)
+        return [
+            _vectorized_best_node(tree, query_vector, node_scores)
+            for query_vector, node_scores in zip(query_vectors, scores)
+        ]
+    return [_find_best_node(root, query_vector, mode) for query_vector in query_vectors]
+
+
+def find_most_similar_node(root, query, model, mode=None):
+    """
+    搜索檢索樹內最相似的節點。
+
+    Args:
+        root: 檢索樹（FlatTree）或根節點
+        query: 查詢字符串
+        model: 詞嵌入模型
+        mode: "vectorized" 以單次矩陣乘法對所有節點打分；"bfs" 逐節點走訪；
+              "beam" 自根節點往下做 beam search（近似，僅計算少數節點）。
+              預設依 TREE_SEARCH_MODE；舊版 Node 樹一律使用 BFS
+
+    Returns:
+        最相似的節點（NodeView 或 Node）
+    """
+    query_vector = cached_encode(model, query)
+    return _find_best_node(root, query_vector, mode)
+
+
 def collect_leaf_texts(node):
     """
     回傳所蒐集到的文本。
+
+    FlatTree 的節點直接以預先計算的葉節點區段切片取得 (texts, vectors)；
+    舊版 Node 樹則以迭代 DFS（先左後右）蒐集，順序與原本的遞迴版本相同。
     """
-    if node.left is None and node.right is None:
-        return [node.text], [node.vector]
+    node = _as_node(node)
+    if isinstance(node, NodeView):
+        return node.tree.subtree_leaves(node.index)
 
     texts, vectors = [], []
-    if node.left:
-        left_texts, left_vectors = collect_leaf_texts(node.left)
-        texts.extend(left_texts)
-        vectors.extend(left_vectors)
-    if node.right:
-        right_texts, right_vectors = collect_leaf_texts(node.right)
-        texts.extend(right_texts)
-        vectors.extend(right_vectors)
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if current.left is None and current.right is None:
+            texts.append(current.text)
+            vectors.append(current.vector)
+            continue
+        if current.right:
+            stack.append(current.right)
+        if current.left:
+            stack.append(current.left)
 
     return texts, vectors
 
 
+def _node_leaf_texts(node):
+    if node.left is None and node.right is None:
+        return [node.text], [node.vector]
+    return collect_leaf_texts(node)
+
+
+def _node_candidates(node, query_vector):
+    """
+    回傳節點子樹的 (texts, vectors, leaf_ids, node_id, node_depth, node_score)，
+    node_score 為查詢向量與節點中心的餘弦相似度。
+    舊版 Node 樹沒有節點編號與 leaf_id，對應欄位為 None。
+    """
+    texts, vectors = _node_leaf_texts(node)
+    node_score = float(1 - cosine(query_vector, node.vector))
+    if not isinstance(node, NodeView):
+        return texts, vectors, None, None, None, node_score
+
+    tree, index = node.tree, node.index
+    if tree.is_leaf(index):
+        leaf_ids = [tree.leaf_id(index)]
+    else:
+        leaf_ids = tree.subtree_leaf_ids(index)
+    depth, parent = 0, tree.parents[index]
+    while parent >= 0:
+        depth += 1
+        parent = tree.parents[parent]
+    return texts, vectors, leaf_ids, int(index), depth, node_score
+
+
 def query_tree(root, query, model):
     most_similar_node = find_most_similar_node(root, query, model)
-    if most_similar_node.left is None and most_similar_node.right is None:
-        return [most_similar_node.text], [most_similar_node.vector]
-    else:
-        return collect_leaf_texts(most_similar_node)
+    return _node_leaf_texts(most_similar_node)
 
 
-def _process_retrieved_texts(retrieved_texts, retrieved_vectors, sub_query, model):
+def _select_candidates(retrieved_texts, retrieved_vectors, sub_query, model, query_vector=None):
     """
-    處理檢索到的文本，如果超過70個文本則進行排序和篩選。
-    
-    Args:
-        retrieved_texts: 檢索到的文本列表
-        retrieved_vectors: 檢索到的文本向量列表
-        sub_query: 子查詢
-        model: 詞嵌入模型
-        
-    Returns:
-        list: 處理後的文本列表
+    Summary:
+    處理檢索到的文本：超過 MAX_RESULTS 個時排序並取前 TOP_K 個（可選的 rerank），否則全部保留（原順序）。
+    回傳 (indices, scores, reranked)：選出的文本在 retrieved_texts 中的位置、分數，以及分數是否來自 rerank。
+
+    retrieved_texts: 檢索到的文本列表
+    retrieved_vectors: 檢索到的文本向量列表
+    sub_query: 子查詢
+    model: 詞嵌入模型
+    query_vector: 已編碼的子查詢向量；提供時不再重新編碼
     """
+    if query_vector is None:
+        query_vector = cached_encode(model, [sub_query])
+    retrieved_vectors = np.asarray(retrieved_vectors, dtype=np.float32).reshape(len(retrieved_texts), -1)
+    similarities = 1 - cdist(
+        np.asarray(query_vector, dtype=np.float32).reshape(1, -1), retrieved_vectors, metric="cosine"
+    )[0]
+
     if len(retrieved_texts) > MAX_RESULTS:
         # 對於大量檢索結果，做進一步排序篩選
         if RERANKER_ENABLE_IN_PIPELINE:
             try:
-                # 使用通用的 rerank_texts（可根據環境切換 Cross-Encoder / embedding）
-                reranked = rerank_texts(sub_query, retrieved_texts, model, TOP_K)
-                return reranked
+                # 使用通用的 rerank_scores（可根據環境切換 Cross-Encoder / embedding）
+                indices, scores = rerank_scores(
+                    sub_query, list(retrieved_texts), model, TOP_K,
+                    query_vector=query_vector, passage_vectors=retrieved_vectors,
+                )
+                return indices, scores, True
             except Exception as _:
                 # 回退到向量相似度 rerank
                 pass
 
-        query_vector = model.encode([sub_query])
-        similarities = (
-            1 - cdist(query_vector.reshape(1, -1), retrieved_vectors, metric="cosine")[0]
-        )
         # 取前TOP_K個最相關的
         top_indices = np.argsort(similarities)[-TOP_K:][::-1]
-        return [retrieved_texts[i] for i in top_indices]
-    else:
-        # 對於少量結果，直接返回
-        return retrieved_texts
+        return top_indices, similarities[top_indices], False
 
+    # 對於少量結果，直接返回
+    return np.arange(len(retrieved_texts)), similarities, False
 
-def _process_queries(queries, root, model, max_chunks=10):
+
+def _process_retrieved_texts(retrieved_texts, retrieved_vectors, sub_query, model, query_vector=None):
     """
-    處理多個查詢並合併結果
-    
+    處理檢索到的文本，如果超過 MAX_RESULTS 個文本則進行排序和篩選（_select_candidates 的文本版本）。
+
+    Returns:
+        list: 處理後的文本列表
+    """
+    indices, _, _ = _select_candidates(retrieved_texts, retrieved_vectors, sub_query, model, query_vector)
+    return [retrieved_texts[i] for i in indices]
+
+
+def _candidate_hits(candidates, sub_query, sub_query_index, model, query_vector, corpus=None):
+    """
+    將一個子查詢的候選 (_node_candidates) 篩選後轉為 RetrievalHit 列表。
+    """
+    texts, vectors, leaf_ids, node_id, node_depth, node_score = candidates
+    indices, scores, reranked = _select_candidates(texts, vectors, sub_query, model, query_vector)
+    return [
+        RetrievalHit(
+            int(leaf_ids[i]) if leaf_ids is not None else None,
+            texts[i],
+            float(score),
+            node_id,
+            node_depth,
+            sub_query_index,
+            corpus,
+            node_score,
+            reranked,
+        )
+        for i, score in zip(indices, scores)
+    ]
+
+
+def retrieve_hits(queries, root, model, query_vectors=None):
+    """
+    處理多個子查詢，回傳結構化的檢索結果。
+
     Args:
-        queries: 查詢列表
+        queries: 子查詢列表
         root: 檢索樹根節點
         model: 詞嵌入模型
-        max_chunks: 最大塊數
-        
+        query_vectors: 已編碼的 (q, d) 查詢向量；未提供時一次編碼所有子查詢
+
+    Returns:
+        list[RetrievalHit]: 依子查詢順序、各子查詢內依名次排列（未去除重複）
+    """
+    if not queries:
+        return []
+
+    # 所有子查詢一次編碼，節點打分與 TOP_K 篩選共用同一批查詢向量
+    if query_vectors is None:
+        query_vectors = encode_queries(queries, model)
+    best_nodes = _find_best_nodes(root, query_vectors)
+
+    hits = []
+    for i, (sub_query, query_vector, node) in enumerate(zip(queries, query_vectors, best_nodes)):
+        hits.extend(_candidate_hits(_node_candidates(node, query_vector), sub_query, i, model, query_vector))
+    return hits
+
+
+def _process_queries(queries, root, model, max_chunks=10):
+    """
+    處理多個查詢並合併結果（retrieve_hits 的文本版本）
+
     Returns:
         list: 合併後的不重複文本列表
     """
-    results = set()
-    
-    for sub_query in queries:
-        retrieved_texts, retrieved_vectors = query_tree(root, sub_query, model)
-        processed_texts = _process_retrieved_texts(retrieved_texts, retrieved_vectors, sub_query, model)
-        results.update(processed_texts)
-        
-    return list(results)
+    return unique_texts(retrieve_hits(queries, root, model))
 
 
-def tree_search(root, query: str, model, chunk_size: int, chunk_overlap: int, max_chunks: int = 10):
+def split_query(query: str, chunk_size: int, chunk_overlap: int, max_chunks: int = 10):
     """
-    找尋最接近的文本。
-    
+    查詢長度超過 chunk_size 時切分為多個子查詢，否則回傳 [query]。
+    """
+    if len(query) > chunk_size:
+        qp = QueryProcessor(query)
+        return qp.text_chunking(chunk_size, chunk_overlap, max_chunks)
+    return [query]
+
+
+def encode_queries(queries, model):
+    """
+    一次編碼所有子查詢，回傳 (q, d) 查詢向量。
+    """
+    return np.atleast_2d(cached_encode(model, list(queries)))
+
+
+def corpus_candidates(root, query_vectors):
+    """
+    Summary:
+    回傳各子查詢在此檢索樹中最相似節點的候選（_node_candidates），供跨語料合併使用。
+
+    root: 檢索樹（FlatTree）或根節點
+    query_vectors: (q, d) 查詢向量
+    """
+    return [
+        _node_candidates(node, query_vector)
+        for node, query_vector in zip(_find_best_nodes(root, query_vectors), query_vectors)
+    ]
+
+
+def merge_candidate_hits(queries, query_vectors, per_corpus, model, corpus_names=None):
+    """
+    Summary:
+    合併多個語料的候選文本：同一子查詢的候選放入同一個池，以查詢向量與文本向量的餘弦相似度
+    （同一個詞嵌入模型，跨語料可直接比較）由高到低排序，再對整個池執行一次 TOP_K / rerank。
+
+    queries: 子查詢列表
+    query_vectors: (q, d) 查詢向量
+    per_corpus: 各語料的 corpus_candidates 結果
+    model: 詞嵌入模型
+    corpus_names: 各語料名稱，記錄於 RetrievalHit.corpus
+
+    Returns:
+        list[RetrievalHit]: 依子查詢順序、各子查詢內依名次排列
+    """
+    corpus_names = corpus_names or [None] * len(per_corpus)
+    hits = []
+    for i, (sub_query, query_vector) in enumerate(zip(queries, query_vectors)):
+        pooled = []
+        for name, candidates in zip(corpus_names, per_corpus):
+            texts, vectors, leaf_ids, node_id, node_depth, node_score = candidates[i]
+            vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+            pooled.extend(
+                (
+                    texts[j], vectors[j], leaf_ids[j] if leaf_ids is not None else None,
+                    node_id, node_depth, node_score, name,
+                )
+                for j in range(len(texts))
+            )
+        if not pooled:
+            continue
+
+        pooled_vectors = np.stack([entry[1] for entry in pooled])
+        similarities = 1 - cdist(query_vector.reshape(1, -1), pooled_vectors, metric="cosine")[0]
+        order = np.argsort(-similarities, kind="stable")
+        pooled = [pooled[j] for j in order]
+        indices, scores, reranked = _select_candidates(
+            [entry[0] for entry in pooled], pooled_vectors[order], sub_query, model, query_vector
+        )
+        for j, score in zip(indices, scores):
+            text, _, leaf_id, node_id, node_depth, node_score, name = pooled[j]
+            hits.append(RetrievalHit(
+                int(leaf_id) if leaf_id is not None else None, text, float(score), node_id, node_depth, i, name,
+                node_score, reranked,
+            ))
+    return hits
+
+
+def merge_candidates(queries, query_vectors, per_corpus, model):
+    """
+    merge_candidate_hits 的文本版本，回傳合併後的不重複文本列表。
+    """
+    return unique_texts(merge_candidate_hits(queries, query_vectors, per_corpus, model))
+
+
+def federated_search_hits(
+    roots, query: str, model, chunk_size: int, chunk_overlap: int, max_chunks: int = 10,
+    map_fn=map, corpus_names=None,
+):
+    """
+    跨語料檢索：查詢只編碼一次，分別在各檢索樹中搜尋後合併候選。
+
+    Args:
+        roots: 檢索樹列表
+        query: 查詢字符串
+        model: 詞嵌入模型
+        chunk_size: 文本分塊大小
+        chunk_overlap: 文本分塊重疊大小
+        max_chunks: 最大分塊數量
+        map_fn: 對各檢索樹執行搜尋的 map 函式，可傳入 executor.map 以平行搜尋
+        corpus_names: 各檢索樹的語料名稱
+
+    Returns:
+        list[RetrievalHit]: 檢索結果
+    """
+    queries = split_query(query, chunk_size, chunk_overlap, max_chunks)
+    query_vectors = encode_queries(queries, model)
+    per_corpus = list(map_fn(lambda root: corpus_candidates(root, query_vectors), roots))
+    return merge_candidate_hits(queries, query_vectors, per_corpus, model, corpus_names)
+
+
+def federated_tree_search(
+    roots, query: str, model, chunk_size: int, chunk_overlap: int, max_chunks: int = 10, map_fn=map
+):
+    """
+    federated_search_hits 的文本版本，回傳檢索到的文本列表。
+    """
+    return unique_texts(
+        federated_search_hits(roots, query, model, chunk_size, chunk_overlap, max_chunks, map_fn)
+    )
+
+
+def tree_search_hits(root, query: str, model, chunk_size: int, chunk_overlap: int, max_chunks: int = 10):
+    """
+    找尋最接近的文本，回傳結構化的檢索結果。
+
     Args:
         root: 檢索樹根節點
         query: 查詢字符串
@@ -310,17 +684,22 @@ def tree_search(root, query: str, model, chunk_size: int, chunk_overlap: int, ma
         chunk_size: 文本分塊大小
         chunk_overlap: 文本分塊重疊大小
         max_chunks: 最大分塊數量
-        
+
     Returns:
-        list: 檢索到的文本列表
+        list[RetrievalHit]: 依子查詢順序、各子查詢內依名次排列（未去除重複）
     """
-    queries = [query]
+    queries = split_query(query, chunk_size, chunk_overlap, max_chunks)
+    return retrieve_hits(queries, root, model)
 
-    if len(query) > chunk_size:
-        qp = QueryProcessor(query)
-        queries = qp.text_chunking(chunk_size, chunk_overlap, max_chunks)
 
-    return _process_queries(queries, root, model, max_chunks)
+def tree_search(root, query: str, model, chunk_size: int, chunk_overlap: int, max_chunks: int = 10):
+    """
+    找尋最接近的文本（tree_search_hits 的文本版本）。
+
+    Returns:
+        list: 檢索到的文本列表
+    """
+    return unique_texts(tree_search_hits(root, query, model, chunk_size, chunk_overlap, max_chunks))
 
 
 def extraction_tree_search(
@@ -344,10 +723,5 @@ def extraction_tree_search(
     generator = gf.GeneratedFunction()
     simplified_query = generator.query_extraction(query, llm)
     
-    queries = [simplified_query]
-
-    if len(simplified_query) > chunk_size:
-        qp = QueryProcessor(simplified_query)
-        queries = qp.text_chunking(chunk_size, chunk_overlap, max_chunks)
-
+    queries = split_query(simplified_query, chunk_size, chunk_overlap, max_chunks)
     return _process_queries(queries, root, model, max_chunks)
@@ -4,10 +4,15 @@
 
 from .RAGTree_function import (
     Node,
+    FlatTree,
+    NodeView,
     create_ahc_tree,
     build_tree,
     tree_search,
+    tree_search_hits,
     extraction_tree_search,
+    federated_tree_search,
+    federated_search_hits,
     find_most_similar_node,
     collect_leaf_texts,
     rerank_texts,
@@ -15,6 +20,7 @@ from .RAGTree_function import (
     load_tree,
     QueryProcessor
 )
+from .retrieval_hit import RetrievalHit, unique_texts
 
 
 
@@ -23,6 +29,9 @@ from .generated_function import GeneratedFunction
 __all__ = [
     # 核心檢索類別
     "Node",
+    "FlatTree",
+    "NodeView",
+    "RetrievalHit",
     "QueryProcessor", 
     "GeneratedFunction",
     
@@ -30,7 +39,11 @@ __all__ = [
     "create_ahc_tree",
     "build_tree", 
     "tree_search",
+    "tree_search_hits",
     "extraction_tree_search",
+    "federated_tree_search",
+    "federated_search_hits",
+    "unique_texts",
     "find_most_similar_node",
     "collect_leaf_texts",
     "rerank_texts",
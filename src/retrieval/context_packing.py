@@ -0,0 +1,247 @@
+"""
+送交 LLM 前的檢索內容排版
+
+- 依相關性排序：各子查詢的第 1 名、第 2 名……輪流取出，同一文本只保留一次
+- 去除重疊：同一語料中相鄰的分塊（leaf_id 相鄰，切分時的 chunk_overlap 造成首尾重疊）合併為一段
+- 依 token 預算裝填：以目標模型的 tokenizer 計算，依相關性放入不超過預算的段落
+- 精簡呈現：每段以「[編號] 內容」呈現並去除多餘空白，取代 Python 列表的字串表示（括號、引號與跳脫的 \\n）
+"""
+
+import threading
+
+
+def estimate_tokens(text):
+    """
+    Summary:
+    無法取得模型 tokenizer 時的 token 數估計：非 ASCII 字元（中文等）每字 1 個，ASCII 每 4 字元 1 個。
+    """
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return non_ascii + (len(text) - non_ascii + 3) // 4
+
+
+def make_token_counter(llm):
+    """
+    Summary:
+    回傳計算 token 數的函式：OpenAI 模型（具 model_name）使用對應的 tiktoken 編碼，
+    其他模型或無法載入編碼時（例如離線無法下載編碼檔）改用 estimate_tokens。
+    """
+    model_name = getattr(llm, "model_name", None)
+    if model_name:
+        try:
+            import tiktoken
+
+            try:
+                encoding = tiktoken.encoding_for_model(model_name)
+            except KeyError:
+                encoding = tiktoken.get_encoding("o200k_base")
+            return lambda text: len(encoding.encode(text))
+        except Exception as e:
+            print(f"無法載入 {model_name} 的 tokenizer，改以字元數估計 token：{str(e)}")
+    return estimate_tokens
+
+
+def relevance_order(hits):
+    """
+    依相關性排列文本不重複的 RetrievalHit：各子查詢依名次輪流取出（第 1 名、第 2 名……），避免單一子查詢佔滿預算。
+    """
+    per_query = {}
+    for hit in hits:
+        per_query.setdefault(hit.sub_query_index, []).append(hit)
+    ranked = {}
+    for rank in range(max((len(query_hits) for query_hits in per_query.values()), default=0)):
+        for index in sorted(per_query):
+            query_hits = per_query[index]
+            if rank < len(query_hits):
+                ranked.setdefault(query_hits[rank].text, query_hits[rank])
+    return list(ranked.values())
+
+
+def _overlap(head, tail, min_overlap):
+    """
+    head 的結尾與 tail 的開頭重疊的字元數（不足 min_overlap 時回傳 0）。
+    只在 head 結尾出現 tail 前 min_overlap 字元的位置比對，重疊長度小於兩者的長度。
+    """
+    if min_overlap <= 0:
+        return 0
+    probe = tail[:min_overlap]
+    position = head.find(probe, max(1, len(head) - len(tail) + 1))
+    while position != -1:
+        if tail.startswith(head[position:]):
+            return len(head) - position
+        position = head.find(probe, position + 1)
+    return 0
+
+
+class _Passage:
+    """
+    合併中的段落：同一語料 first_leaf..last_leaf 的連續分塊；rank 為加入順序，被併入其他段落後 text 為 None。
+    """
+
+    __slots__ = ("text", "first_leaf", "last_leaf", "rank")
+
+    def __init__(self, text, leaf_id, rank):
+        self.text = text
+        self.first_leaf = leaf_id
+        self.last_leaf = leaf_id
+        self.rank = rank
+
+
+def merge_overlaps(hits, min_overlap):
+    """
+    Summary:
+    依序處理檢索結果，回傳 (passages, merged)：
+    與已選段落屬同一語料、leaf_id 相鄰且首尾重疊至少 min_overlap 字元的分塊接成同一段，其餘各自成段。
+    只比對相鄰的分塊，成本與文本數量成線性；段落維持其中最相關文本的位置。
+
+    hits: 依相關性排序、文本不重複的 RetrievalHit 列表（leaf_id 為 None 時不合併）
+    min_overlap: 視為分塊重疊的最少字元數，0 表示不合併
+    """
+    passages = []
+    # (語料, 段落第一個 / 最後一個 leaf_id) -> 段落
+    starts, ends = {}, {}
+    seen = set()
+    merged = 0
+
+    def join(corpus, head, tail):
+        # 重疊時兩段接成一段，留在較相關（先加入）的段落位置；回傳合併後的段落，未合併時回傳 None
+        size = _overlap(head.text, tail.text, min_overlap)
+        if not size:
+            return None
+        del ends[(corpus, head.last_leaf)]
+        del starts[(corpus, tail.first_leaf)]
+        keep, drop = (head, tail) if head.rank < tail.rank else (tail, head)
+        keep.text, keep.first_leaf, keep.last_leaf = head.text + tail.text[size:], head.first_leaf, tail.last_leaf
+        drop.text = None
+        starts[(corpus, keep.first_leaf)] = keep
+        ends[(corpus, keep.last_leaf)] = keep
+        return keep
+
+    for hit in hits:
+        text = hit.text.strip()
+        if not text:
+            continue
+        current = _Passage(text, hit.leaf_id, len(passages))
+        passages.append(current)
+        corpus = hit.corpus
+        if hit.leaf_id is None or not min_overlap or (corpus, hit.leaf_id) in seen:
+            continue
+        seen.add((corpus, hit.leaf_id))
+        starts[(corpus, hit.leaf_id)] = current
+        ends[(corpus, hit.leaf_id)] = current
+
+        before = ends.get((corpus, hit.leaf_id - 1))
+        if before is not None:
+            joined = join(corpus, before, current)
+            if joined is not None:
+                current = joined
+                merged += 1
+        after = starts.get((corpus, hit.leaf_id + 1))
+        if after is not None and join(corpus, current, after) is not None:
+            merged += 1
+    return [passage.text for passage in passages if passage.text is not None], merged
+
+
+def render_passage(number, passage):
+    """
+    以「[編號] 內容」呈現，去除各行前後空白與空行。
+    """
+    lines = [line.strip() for line in passage.splitlines()]
+    return f"[{number}] " + "\n".join(line for line in lines if line)
+
+
+class ContextPacker:
+    """
+    Summary:
+    將檢索結果排版成送交 LLM 的檢索內容字串。
+
+    max_tokens: 檢索內容的 token 上限，0 表示不限制（仍會去除重疊並精簡呈現）
+    min_overlap: 視為分塊重疊而合併的最少字元數
+    """
+
+    def __init__(self, max_tokens=0, min_overlap=20):
+        self.max_tokens = max(0, int(max_tokens))
+        self.min_overlap = max(0, int(min_overlap))
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "packed": 0, "texts_in": 0, "merged": 0, "passages_out": 0, "dropped": 0, "truncated": 0,
+            "tokens_out": 0, "tokens_unpacked": 0,
+        }
+
+    def token_counter(self, llm):
+        """
+        依模型名稱快取 token 計數函式。
+        """
+        key = getattr(llm, "model_name", None) or type(llm).__name__
+        counter = self._counters.get(key)
+        if counter is None:
+            counter = make_token_counter(llm)
+            self._counters[key] = counter
+        return counter
+
+    def _truncate(self, number, passage, budget, count_tokens):
+        """
+        截斷單一段落使其不超過 budget（僅在預算連最相關的段落都放不下時使用）。
+        """
+        rendered = render_passage(number, passage)
+        tokens = count_tokens(rendered)
+        end = len(passage)
+        while tokens > budget and end > 0:
+            end = min(end - 1, int(end * budget / tokens))
+            rendered = render_passage(number, passage[:end])
+            tokens = count_tokens(rendered)
+        return rendered, tokens
+
+    def pack(self, hits, llm):
+        """
+        Summary:
+        回傳送交 LLM 的檢索內容字串。
+
+        hits: list[RetrievalHit]
+        llm: 目標語言模型，用於取得 tokenizer
+        """
+        count_tokens = self.token_counter(llm)
+        ranked = relevance_order(hits)
+        passages, merged = merge_overlaps(ranked, self.min_overlap)
+
+        # candidate_tokens：所有段落不限預算時的 token 數（沿用逐段計算的結果，不另外計算），用於比較
+        rendered, used, candidate_tokens, dropped, truncated = [], 0, 0, 0, 0
+        # 段落之間以換行分隔
+        separator_tokens = count_tokens("\n")
+        for passage in passages:
+            block = render_passage(len(rendered) + 1, passage)
+            tokens = count_tokens(block) + (separator_tokens if rendered else 0)
+            candidate_tokens += tokens
+            if self.max_tokens and used + tokens > self.max_tokens:
+                dropped += 1
+                continue
+            rendered.append(block)
+            used += tokens
+        if passages and not rendered:
+            # 預算連最相關的段落都放不下時，截斷該段落而非送出空白內容
+            block, used = self._truncate(1, passages[0], self.max_tokens, count_tokens)
+            rendered.append(block)
+            dropped -= 1
+            truncated = 1
+        context = "\n".join(rendered)
+
+        with self._lock:
+            stats = self._stats
+            stats["packed"] += 1
+            stats["texts_in"] += len(ranked)
+            stats["merged"] += merged
+            stats["passages_out"] += len(rendered)
+            stats["dropped"] += dropped
+            stats["truncated"] += truncated
+            stats["tokens_out"] += used
+            stats["tokens_unpacked"] += candidate_tokens
+        return context
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        packed = stats["packed"]
+        stats["max_tokens"] = self.max_tokens
+        stats["avg_tokens_out"] = stats["tokens_out"] / packed if packed else 0.0
+        stats["avg_tokens_unpacked"] = stats["tokens_unpacked"] / packed if packed else 0.0
+        return stats
@@ -0,0 +1,174 @@
+"""
+Cross-Encoder 重排序：推論後端、候選預先截斷與配對分數快取
+
+- 推論後端（RERANKER_BACKEND）：
+  - torch：原本的 PyTorch CrossEncoder（自動偵測 CUDA / MPS / CPU）
+  - onnx：sentence-transformers 的 ONNX Runtime 後端（需安裝 optimum[onnxruntime]），無法載入時改用 torch
+  - int8：以 torch 動態量化 Linear 層（僅 CPU），不需額外套件
+- 預先截斷（RERANKER_PRE_TOP_N）：已有向量時，先以餘弦相似度取前 N 個候選再送入 Cross-Encoder
+- 分數快取（RERANKER_CACHE_SIZE）：以 (查詢雜湊, 文本雜湊) 為鍵保留最近的配對分數，只推論未命中的配對
+"""
+
+import hashlib
+import threading
+
+import numpy as np
+import torch
+from sentence_transformers import CrossEncoder
+
+from app.config import RERANKER_MODEL_NAME, RERANKER_BACKEND, RERANKER_PRE_TOP_N, RERANKER_CACHE_SIZE
+from app.config import INFERENCE_BATCHING, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS
+from src.utils.lru_cache import LRUCache
+from src.utils.micro_batcher import BatchedCrossEncoder, register_batcher
+
+
+CROSS_ENCODER_BACKENDS = ("torch", "onnx", "int8")
+
+
+def determine_device():
+    if torch.cuda.is_available():
+        return "cuda"
+    if hasattr(torch.backends, "mps") and torch.backends.mps.is_available():
+        return "mps"
+    return "cpu"
+
+
+def load_cross_encoder(model_name, backend="torch", device=None):
+    """
+    Summary:
+    依後端載入 CrossEncoder，回傳 (model, 實際使用的後端)。
+
+    model_name: 模型名稱或路徑
+    backend: torch / onnx / int8
+    device: torch 後端使用的裝置，未指定時自動偵測；onnx 與 int8 固定使用 CPU
+    """
+    if backend not in CROSS_ENCODER_BACKENDS:
+        raise ValueError(f"不支援的 Cross-Encoder 後端：{backend}（可用：{', '.join(CROSS_ENCODER_BACKENDS)}）")
+
+    if backend == "onnx":
+        try:
+            return CrossEncoder(model_name, device="cpu", backend="onnx"), "onnx"
+        except Exception as e:
+            # 舊版 sentence-transformers 沒有 backend 參數，或未安裝 optimum / onnxruntime
+            print(f"無法以 ONNX Runtime 載入 {model_name}，改用 torch：{str(e)}")
+            backend = "torch"
+
+    if backend == "int8":
+        model = CrossEncoder(model_name, device="cpu")
+        # 新版 CrossEncoder 本身即為 nn.Module，舊版的模型在 model.model
+        module = model if isinstance(model, torch.nn.Module) else model.model
+        torch.ao.quantization.quantize_dynamic(module, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model, "int8"
+
+    return CrossEncoder(model_name, device=device or determine_device()), "torch"
+
+
+def _digest(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class CrossEncoderScorer:
+    """
+    Summary:
+    包裝 CrossEncoder 的重排序：預先截斷候選、快取配對分數並記錄統計。
+
+    model: 具 predict(pairs) 的模型（CrossEncoder 或 BatchedCrossEncoder）
+    pre_top_n: 提供向量時先以餘弦相似度保留的候選數，0 表示不截斷
+    cache_size: 配對分數快取的筆數上限，0 表示停用
+    backend: 實際使用的推論後端（僅供統計）
+    """
+
+    def __init__(self, model, pre_top_n=0, cache_size=0, backend="torch"):
+        self.model = model
+        self.pre_top_n = max(0, int(pre_top_n))
+        self.backend = backend
+        self.cache = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.candidates = 0
+        self.pairs_scored = 0
+        self.pairs_predicted = 0
+
+    def scores(self, query, passages):
+        """
+        回傳 query 與各文本的 Cross-Encoder 分數；快取命中的配對與重複文本不再推論。
+        """
+        query_digest = _digest(query)
+        keys = [(query_digest, _digest(passage)) for passage in passages]
+        scores = np.empty(len(passages), dtype=np.float32)
+        missing = {}
+        for i, key in enumerate(keys):
+            cached = self.cache.get(key)
+            if cached is None:
+                missing.setdefault(key, []).append(i)
+            else:
+                scores[i] = cached
+        if missing:
+            pairs = [(query, passages[positions[0]]) for positions in missing.values()]
+            predicted = np.asarray(self.model.predict(pairs), dtype=np.float32).reshape(len(pairs))
+            for (key, positions), score in zip(missing.items(), predicted):
+                scores[positions] = score
+                self.cache.put(key, float(score))
+        with self._lock:
+            self.pairs_scored += len(passages)
+            self.pairs_predicted += len(missing)
+        return scores
+
+    def rank(self, query, passages, k, vector_scores=None):
+        """
+        Summary:
+        回傳 (indices, scores)：前 k 名在 passages 中的位置與 Cross-Encoder 分數，依分數由高到低。
+
+        vector_scores: 各文本的向量相似度；提供且候選數超過 pre_top_n 時，只對相似度前 pre_top_n 個候選推論
+        """
+        candidates = np.arange(len(passages))
+        if vector_scores is not None and self.pre_top_n and len(passages) > self.pre_top_n:
+            candidates = np.argsort(-np.asarray(vector_scores), kind="stable")[: self.pre_top_n]
+        with self._lock:
+            self.requests += 1
+            self.candidates += len(passages)
+
+        scores = self.scores(query, [passages[i] for i in candidates])
+        ranked = np.argsort(scores)[::-1][:k]
+        return candidates[ranked], scores[ranked]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "model": RERANKER_MODEL_NAME,
+                "backend": self.backend,
+                "pre_top_n": self.pre_top_n,
+                "requests": self.requests,
+                "candidates": self.candidates,
+                "pairs_scored": self.pairs_scored,
+                "pairs_predicted": self.pairs_predicted,
+                "cache": self.cache.stats(),
+            }
+
+
+_SCORER = None
+_SCORER_LOCK = threading.Lock()
+
+
+def get_cross_encoder_scorer():
+    """
+    依設定載入（僅一次）並回傳共用的 CrossEncoderScorer。
+    """
+    global _SCORER
+    with _SCORER_LOCK:
+        if _SCORER is None:
+            model, backend = load_cross_encoder(RERANKER_MODEL_NAME, RERANKER_BACKEND)
+            if INFERENCE_BATCHING:
+                # 並發請求的 predict 合併為批次推論
+                model = BatchedCrossEncoder(model, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS / 1000)
+                register_batcher("cross_encoder", model.batcher)
+            _SCORER = CrossEncoderScorer(model, RERANKER_PRE_TOP_N, RERANKER_CACHE_SIZE, backend)
+            print(f"已載入 CrossEncoder: {RERANKER_MODEL_NAME}（{backend}）")
+        return _SCORER
+
+
+def reranker_stats():
+    """
+    Cross-Encoder 的統計；尚未載入時回傳 None。
+    """
+    return _SCORER.stats() if _SCORER is not None else None
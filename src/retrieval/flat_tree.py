@@ -0,0 +1,798 @@
+"""
+以連續陣列儲存的檢索樹結構
+"""
+
+import copy
+import threading
+
+import numpy as np
+
+from src.retrieval.quantization import QuantizedVectors
+
+
+class NodeView:
+    """
+    FlatTree 節點的輕量檢視，提供與 Node 相同的屬性介面
+    （vector、text、index、left、right、sample_count、subtree_depth），
+    讓既有以 Node 為對象的程式碼可以直接沿用。
+    """
+
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree, index):
+        self.tree = tree
+        self.index = int(index)
+
+    @property
+    def vector(self):
+        return self.tree.vectors[self.index]
+
+    @property
+    def text(self):
+        if self.tree.is_leaf(self.index):
+            return self.tree.leaf_text(self.index)
+        return None
+
+    @property
+    def left(self):
+        child = self.tree.children[self.index, 0]
+        return NodeView(self.tree, child) if child >= 0 else None
+
+    @property
+    def right(self):
+        child = self.tree.children[self.index, 1]
+        return NodeView(self.tree, child) if child >= 0 else None
+
+    @property
+    def sample_count(self):
+        return int(self.tree.sample_counts[self.index])
+
+    @property
+    def subtree_depth(self):
+        return int(self.tree.depths[self.index])
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, NodeView)
+            and other.tree is self.tree
+            and other.index == self.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self):
+        return f"NodeView(index={self.index}, sample_count={self.sample_count})"
+
+
+class _TreeState:
+    """
+    FlatTree 某一時間點的節點陣列。發布後不再修改（bfs_rank 與 quantized 為第一次使用時才計算的快取），
+    讀取端每次呼叫取用一次，即使同時有異動也只會看到一致的版本。
+
+    dirty: (N,) bool，子樹內有增量異動的節點；未異動過的樹為 None
+    root: 根節點編號；None 表示最後一個節點
+    """
+
+    __slots__ = (
+        "vectors", "children", "parents", "sample_counts", "depths", "dirty", "root", "bfs_rank", "quantized"
+    )
+
+    def __init__(self, vectors, children, parents, sample_counts, depths, dirty=None, root=None, quantized=None):
+        self.vectors = vectors
+        self.children = children
+        self.parents = parents
+        self.sample_counts = sample_counts
+        self.depths = depths
+        self.dirty = dirty
+        self.root = root
+        self.bfs_rank = None
+        self.quantized = quantized
+
+    @property
+    def root_index(self):
+        return self.root if self.root is not None else self.vectors.shape[0] - 1
+
+    def grown(self, extra):
+        """
+        回傳可寫入的複本，尾端預留 extra 個新節點（異動在複本上進行，完成後才發布）。
+        """
+        size = self.vectors.shape[0]
+
+        def grow(array, fill):
+            out = np.empty((size + extra,) + array.shape[1:], dtype=array.dtype)
+            out[:size] = array
+            out[size:] = fill
+            return out
+
+        dirty = self.dirty if self.dirty is not None else np.zeros(size, dtype=bool)
+        return _TreeState(
+            grow(self.vectors, np.nan),
+            grow(self.children, -1),
+            grow(self.parents, -1),
+            grow(self.sample_counts, 0),
+            grow(self.depths, 0),
+            grow(dirty, True),
+            self.root_index,
+        )
+
+
+class FlatTree:
+    """
+    Summary:
+    以連續陣列表示的階層式檢索樹。
+
+    節點編號沿用 linkage matrix 的慣例：0..n-1 為葉節點，n..2n-2 依合併順序為內部節點，
+    最後一個節點為根。建構時葉節點會依樹狀圖（dendrogram，先左後右）順序重新編號，
+    因此任一子樹的葉節點都是連續區段 [start, end)，蒐集子樹文本只需切片。
+
+    vectors: (2n-1, d) float32，每列為已正規化的節點中心向量；前 n 列即依樹狀圖順序排列的葉向量
+    children: (2n-1, 2) int32，左右子節點編號，葉節點為 -1
+    parents: (2n-1,) int32，父節點編號，根為 -1
+    sample_counts: (2n-1,) int32，子樹葉節點數
+    depths: (2n-1,) int32，子樹深度（葉節點為 0）
+    leaf_ranges: (2n-1, 2) int32，子樹葉節點在樹狀圖順序中的 [start, end)
+    leaf_ids: (n,) int32，各葉節點對應的原始文本索引
+    texts: list[str]，長度為 n，依樹狀圖順序排列
+
+    quantize("float16" / "int8") 後，score_nodes 改以量化矩陣做粗略打分，
+    呼叫端再以 float32 的 vectors 重新計算候選節點的分數。
+
+    樹建好後可用 insert / delete 增量更新：新節點附加在陣列尾端，刪除的葉節點以墓碑標記
+    （sample_count 為 0、中心向量為 NaN，不會被搜尋選中）。受影響的祖先節點改以走訪蒐集葉節點，
+    其餘子樹仍以區段切片取得。異動累積到一定比例（drift）後應以 tree_updates 重新建構。
+    異動在陣列的複本上進行，完成後以單一參照換上新的 _TreeState（複製成本與 insert 本身的全節點打分同階）；
+    讀取端每次呼叫只取用一次狀態，需要跨多次呼叫保持一致時使用 snapshot()。
+    """
+
+    def __init__(
+        self,
+        vectors,
+        texts,
+        children,
+        parents,
+        sample_counts,
+        depths,
+        linkage_matrix=None,
+        leaf_ranges=None,
+        leaf_ids=None,
+    ):
+        self._state = _TreeState(vectors, children, parents, sample_counts, depths)
+        self.texts = texts
+        self.linkage_matrix = linkage_matrix
+        self.leaf_ranges = leaf_ranges if leaf_ranges is not None else self._leaf_ranges(children, len(texts))
+        self.leaf_ids = leaf_ids if leaf_ids is not None else np.arange(len(texts), dtype=np.int32)
+
+        # 粗略打分所用的量化格式（None 表示直接以 float32 打分）；異動後的新狀態於下次打分時重新量化
+        self._quantized_dtype = None
+
+        # 增量新增的葉節點文本與 leaf_id（只增不刪，發布新狀態前寫入）
+        self._extra_texts = {}
+        self._extra_ids = {}
+        self._leaf_nodes = None
+        self._superseded_by = None
+        self._lock = threading.RLock()
+        self.inserted = 0
+        self.deleted = 0
+        # 背景重建期間的異動紀錄（record_mutations 後才記錄），None 表示不記錄
+        self.mutations = None
+
+    @staticmethod
+    def _dendrogram_order(linkage_matrix, n):
+        """
+        以迭代 DFS（先左後右）求出葉節點的樹狀圖順序。
+        """
+        if n == 1:
+            return np.zeros(1, dtype=np.int32)
+        merges = linkage_matrix[:, :2].astype(np.int64)
+        order = []
+        stack = [2 * n - 2]
+        while stack:
+            node = stack.pop()
+            if node < n:
+                order.append(node)
+            else:
+                c1, c2 = merges[node - n]
+                stack.append(c2)
+                stack.append(c1)
+        return np.asarray(order, dtype=np.int32)
+
+    @staticmethod
+    def _leaf_ranges(children, n):
+        """
+        計算每個節點的葉節點區段 [start, end)，要求葉節點已依樹狀圖順序編號。
+        """
+        leaf_ranges = np.empty((children.shape[0], 2), dtype=np.int32)
+        leaf_ranges[:n, 0] = np.arange(n)
+        leaf_ranges[:n, 1] = np.arange(1, n + 1)
+        for node in range(n, children.shape[0]):
+            c1, c2 = children[node]
+            if leaf_ranges[c1, 1] != leaf_ranges[c2, 0]:
+                raise ValueError("葉節點未依樹狀圖順序編號，無法建立連續的葉節點區段")
+            leaf_ranges[node] = (leaf_ranges[c1, 0], leaf_ranges[c2, 1])
+        return leaf_ranges
+
+    @staticmethod
+    def _structure_from_linkage(linkage_matrix, n):
+        """
+        由 linkage matrix 推得 children / parents / sample_counts / depths 陣列。
+        """
+        n_nodes = 2 * n - 1
+        children = np.full((n_nodes, 2), -1, dtype=np.int32)
+        parents = np.full(n_nodes, -1, dtype=np.int32)
+        sample_counts = np.ones(n_nodes, dtype=np.int32)
+        depths = np.zeros(n_nodes, dtype=np.int32)
+
+        merges = linkage_matrix[:, :2].astype(np.int32)
+        for i, (c1, c2) in enumerate(merges):
+            node = n + i
+            children[node] = (c1, c2)
+            parents[c1] = node
+            parents[c2] = node
+            sample_counts[node] = sample_counts[c1] + sample_counts[c2]
+            depths[node] = max(depths[c1], depths[c2]) + 1
+
+        return children, parents, sample_counts, depths
+
+    @classmethod
+    def from_linkage(cls, vectors, texts, linkage_matrix):
+        """
+        Summary:
+        依 linkage matrix 建構 FlatTree，內部節點中心為子節點中心依樣本數加權後再正規化。
+        葉節點會依樹狀圖順序重新編號，原始索引保存在 leaf_ids。
+
+        vectors: np.array，形狀 (n, d)
+        texts: list[str]
+        linkage_matrix: fastcluster / scipy 格式的 (n-1, 4) 矩陣
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n, dim = vectors.shape
+        linkage_matrix = np.asarray(linkage_matrix, dtype=np.float64).reshape(-1, 4)
+
+        # 依樹狀圖順序重新編號葉節點，內部節點編號不變
+        leaf_ids = cls._dendrogram_order(linkage_matrix, n)
+        position = np.empty(n, dtype=np.int64)
+        position[leaf_ids] = np.arange(n)
+        linkage_matrix = linkage_matrix.copy()
+        for col in (0, 1):
+            ids = linkage_matrix[:, col].astype(np.int64)
+            is_leaf = ids < n
+            linkage_matrix[is_leaf, col] = position[ids[is_leaf]]
+        vectors = vectors[leaf_ids]
+        texts = [texts[i] for i in leaf_ids]
+
+        children, parents, sample_counts, depths = cls._structure_from_linkage(linkage_matrix, n)
+
+        node_vectors = np.empty((2 * n - 1, dim), dtype=np.float32)
+        node_vectors[:n] = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+        for node in range(n, 2 * n - 1):
+            c1, c2 = children[node]
+            count_c1 = sample_counts[c1]
+            count_c2 = sample_counts[c2]
+            new_vector = (node_vectors[c1] * count_c1 + node_vectors[c2] * count_c2) / (
+                count_c1 + count_c2
+            )
+            node_vectors[node] = new_vector / np.linalg.norm(new_vector)
+
+        return cls(
+            node_vectors,
+            texts,
+            children,
+            parents,
+            sample_counts,
+            depths,
+            linkage_matrix,
+            leaf_ids=leaf_ids,
+        )
+
+    @classmethod
+    def from_centroids(cls, centroids, texts, linkage_matrix, leaf_ids=None):
+        """
+        Summary:
+        以預先算好的節點中心矩陣（例如從檔案載入）還原 FlatTree，不重新計算中心向量。
+        centroids、texts 與 linkage_matrix 須為 FlatTree 本身的（已依樹狀圖順序編號）版本。
+
+        centroids: np.array，形狀 (2n-1, d)
+        texts: list[str]
+        linkage_matrix: (n-1, 4) 矩陣
+        leaf_ids: 各葉節點對應的原始文本索引
+        """
+        n = len(texts)
+        if centroids.shape[0] != 2 * n - 1:
+            raise ValueError(
+                f"節點中心數量 {centroids.shape[0]} 與文本數量 {n} 不符（應為 {2 * n - 1}）"
+            )
+        linkage_matrix = np.asarray(linkage_matrix, dtype=np.float64).reshape(-1, 4)
+        children, parents, sample_counts, depths = cls._structure_from_linkage(linkage_matrix, n)
+        return cls(
+            centroids,
+            texts,
+            children,
+            parents,
+            sample_counts,
+            depths,
+            linkage_matrix,
+            leaf_ids=leaf_ids,
+        )
+
+    def subtree_leaves(self, index):
+        """
+        Summary:
+        回傳節點子樹的 (texts, vectors)，vectors 為葉向量矩陣的切片檢視，不複製資料。
+        子樹內有增量異動時，改為依樹狀圖順序走訪存活的葉節點。
+
+        index: 節點編號
+        """
+        state = self._state
+        if self._is_dirty(state, index):
+            leaves = self._live_leaf_nodes(state, index)
+            dim = state.vectors.shape[1]
+            vectors = state.vectors[leaves] if leaves else np.empty((0, dim), dtype=np.float32)
+            return [self.leaf_text(i) for i in leaves], vectors
+        start, end = self.leaf_ranges[index]
+        return self.texts[start:end], state.vectors[start:end]
+
+    def subtree_leaf_ids(self, index):
+        """
+        回傳節點子樹內葉節點對應的原始文本索引（切片檢視）。
+        """
+        state = self._state
+        if self._is_dirty(state, index):
+            return np.asarray([self.leaf_id(i) for i in self._live_leaf_nodes(state, index)], dtype=np.int64)
+        start, end = self.leaf_ranges[index]
+        return self.leaf_ids[start:end]
+
+    def leaf_text(self, index):
+        if index < len(self.texts):
+            return self.texts[index]
+        return self._extra_texts[index]
+
+    def leaf_id(self, index):
+        if index < len(self.texts):
+            return int(self.leaf_ids[index])
+        return self._extra_ids[index]
+
+    @staticmethod
+    def _is_dirty(state, index):
+        return state.dirty is not None and bool(state.dirty[index])
+
+    @staticmethod
+    def _live_leaf_nodes(state, index):
+        """
+        以迭代 DFS（先左後右）蒐集子樹內未刪除的葉節點編號。
+        """
+        leaves = []
+        stack = [int(index)]
+        while stack:
+            node = stack.pop()
+            if state.sample_counts[node] == 0:
+                continue
+            left, right = state.children[node]
+            if left < 0:
+                leaves.append(node)
+                continue
+            stack.append(int(right))
+            stack.append(int(left))
+        return leaves
+
+    # 增量更新
+
+    @property
+    def is_modified(self):
+        return self._state.dirty is not None
+
+    @property
+    def n_live_leaves(self):
+        return len(self.texts) + self.inserted - self.deleted
+
+    @property
+    def drift(self):
+        """
+        自建構以來的異動（新增 + 刪除）比例，用於判斷是否需要重新建構。
+        """
+        return (self.inserted + self.deleted) / max(len(self.texts), 1)
+
+    @staticmethod
+    def _write_node(state, index, vector, children, sample_count, depth):
+        state.vectors[index] = vector
+        state.children[index] = children
+        state.parents[index] = -1
+        state.sample_counts[index] = sample_count
+        state.depths[index] = depth
+        state.dirty[index] = True
+
+    @staticmethod
+    def _refresh_ancestors(state, index):
+        """
+        自 index 往上更新祖先的 sample_count、中心向量與深度，並標記為已異動（在尚未發布的 state 上進行）。
+        中心向量與建構時相同：存活子節點中心依樣本數加權後再正規化。
+        """
+        vectors, children, sample_counts = state.vectors, state.children, state.sample_counts
+        while index >= 0:
+            left, right = children[index]
+            count_left, count_right = sample_counts[left], sample_counts[right]
+            count = count_left + count_right
+            sample_counts[index] = count
+            state.depths[index] = max(state.depths[left], state.depths[right]) + 1
+            if count == 0:
+                vectors[index] = np.nan
+            else:
+                vector = np.zeros(vectors.shape[1], dtype=np.float64)
+                for child, child_count in ((left, count_left), (right, count_right)):
+                    if child_count:
+                        vector += vectors[child] * child_count
+                vector /= count
+                vectors[index] = vector / np.linalg.norm(vector)
+            state.dirty[index] = True
+            index = state.parents[index]
+
+    def _leaf_node_map(self):
+        """
+        leaf_id → 節點編號的對照表（第一次使用時建立）。
+        """
+        if self._leaf_nodes is None:
+            self._leaf_nodes = {int(leaf): i for i, leaf in enumerate(self.leaf_ids)}
+            self._leaf_nodes.update({leaf: i for i, leaf in self._extra_ids.items()})
+        return self._leaf_nodes
+
+    def _leaf_node(self, leaf_id):
+        leaf_nodes = self._leaf_node_map()
+        if leaf_id not in leaf_nodes:
+            raise KeyError(f"找不到葉節點: {leaf_id}")
+        return leaf_nodes[leaf_id]
+
+    def _next_leaf_id(self):
+        ids = [int(self.leaf_ids.max()) if len(self.leaf_ids) else -1]
+        ids.extend(self._extra_ids.values())
+        return max(ids) + 1
+
+    def insert(self, vector, text, leaf_id=None):
+        """
+        Summary:
+        新增一個葉節點：找到與新向量最相似的存活節點，在其上方插入新的父節點
+        （子節點為原節點與新葉節點），再沿祖先路徑更新中心向量與 sample_count。
+        回傳新葉節點的 leaf_id。
+
+        vector: (d,) 新文本的向量
+        text: 新文本
+        leaf_id: 指定的原始文本索引，預設為目前最大值 + 1
+        """
+        with self._lock:
+            if self._superseded_by is not None:
+                return self._superseded_by.insert(vector, text, leaf_id)
+            current = self._state
+            vector = np.asarray(vector, dtype=np.float32).ravel()
+            norm = np.linalg.norm(vector)
+            if vector.shape[0] != current.vectors.shape[1] or not np.isfinite(norm) or norm == 0:
+                raise ValueError(f"新增向量維度或數值異常，需為非零的 {current.vectors.shape[1]} 維向量")
+            vector = vector / norm
+            if leaf_id is None:
+                leaf_id = self._next_leaf_id()
+            elif leaf_id in self._leaf_node_map():
+                raise ValueError(f"葉節點 {leaf_id} 已存在")
+
+            scores = np.nan_to_num(current.vectors @ vector, nan=-np.inf)
+            target = int(np.argmax(scores))
+            if not np.isfinite(scores[target]):
+                raise ValueError("檢索樹沒有存活的節點，請重新建構")
+
+            # 新葉節點與其父節點（子節點為原節點與新葉節點）附加在尾端，再接到原父節點底下
+            state = current.grown(2)
+            leaf, parent = current.vectors.shape[0], current.vectors.shape[0] + 1
+            self._write_node(state, leaf, vector, (-1, -1), 1, 0)
+            self._write_node(state, parent, current.vectors[target], (target, leaf), 0, 0)
+            old_parent = int(state.parents[target])
+            state.parents[leaf] = parent
+            state.parents[parent] = old_parent
+            state.parents[target] = parent
+            if old_parent < 0:
+                state.root = parent
+            else:
+                side = 0 if state.children[old_parent, 0] == target else 1
+                state.children[old_parent, side] = parent
+            self._refresh_ancestors(state, parent)
+
+            # 文本先寫入，讀取端取得新狀態時即可查到
+            self._extra_texts[leaf] = text
+            self._extra_ids[leaf] = leaf_id
+            self._leaf_node_map()[leaf_id] = leaf
+            self._state = state
+
+            self.inserted += 1
+            if self.mutations is not None:
+                self.mutations.append(("insert", leaf_id, vector, text))
+            return leaf_id
+
+    def delete(self, leaf_id):
+        """
+        Summary:
+        以墓碑標記刪除葉節點，並沿祖先路徑更新中心向量與 sample_count。
+        回傳是否確實刪除（已刪除過則回傳 False）。
+
+        leaf_id: 原始文本索引（leaf_ids 中的值）
+        """
+        with self._lock:
+            if self._superseded_by is not None:
+                return self._superseded_by.delete(leaf_id)
+            leaf = self._leaf_node(int(leaf_id))
+            if self._state.sample_counts[leaf] == 0:
+                return False
+            state = self._state.grown(0)
+            state.sample_counts[leaf] = 0
+            state.vectors[leaf] = np.nan
+            state.dirty[leaf] = True
+            if state.parents[leaf] >= 0:
+                self._refresh_ancestors(state, int(state.parents[leaf]))
+            self._state = state
+
+            self.deleted += 1
+            if self.mutations is not None:
+                self.mutations.append(("delete", int(leaf_id)))
+            return True
+
+    def record_mutations(self):
+        """
+        開始記錄 insert / delete（背景重建期間使用，完成後以 stop_recording 取回並停止記錄）。
+        """
+        with self._lock:
+            self.mutations = []
+
+    def stop_recording(self):
+        """
+        停止記錄並回傳 record_mutations 之後的異動。
+        """
+        with self._lock:
+            mutations, self.mutations = self.mutations or [], None
+            return mutations
+
+    def apply_mutations(self, mutations):
+        """
+        依序重播 insert / delete 紀錄（例如背景重建期間累積的異動）。
+        """
+        for mutation in mutations:
+            if mutation[0] == "insert":
+                _, leaf_id, vector, text = mutation
+                self.insert(vector, text, leaf_id)
+            else:
+                self.delete(mutation[1])
+
+    def live_leaves(self):
+        """
+        回傳存活葉節點的 (texts, vectors, leaf_ids)，依目前的樹狀圖順序排列。
+        """
+        tree = self.snapshot()
+        texts, vectors = tree.subtree_leaves(tree.root_index)
+        return list(texts), np.asarray(vectors), np.asarray(tree.subtree_leaf_ids(tree.root_index))
+
+    def snapshot(self):
+        """
+        Summary:
+        回傳固定於目前狀態的 FlatTree 檢視（共用陣列，不複製）：之後的異動不影響此檢視，
+        一次檢索中的多次呼叫（打分、取子樹）因此看到同一個版本。對檢視的 insert / delete 會轉交給原樹。
+        """
+        view = copy.copy(self)
+        view._superseded_by = self
+        return view
+
+    def materialize(self):
+        """
+        Summary:
+        將增量異動後的樹整理為連續排列的新 FlatTree：保留目前的階層結構、移除墓碑，
+        只剩一個存活子節點的內部節點會被合併。不重新聚類，成本為 O(節點數)。
+        """
+        with self._lock:
+            state = self._state
+            if state.dirty is None:
+                return self
+            live = self._live_leaf_nodes(state, state.root_index)
+            if not live:
+                raise ValueError("檢索樹沒有存活的葉節點")
+            leaf_order = {leaf: i for i, leaf in enumerate(live)}
+            rows = []
+            # 後序走訪，記錄每個節點在新 linkage 中的編號（整個子樹已刪除時為 None）
+            compact_id = {}
+            stack = [(state.root_index, False)]
+            while stack:
+                node, expanded = stack.pop()
+                if state.sample_counts[node] == 0:
+                    compact_id[node] = None
+                    continue
+                left, right = state.children[node]
+                if left < 0:
+                    compact_id[node] = leaf_order[node]
+                    continue
+                if not expanded:
+                    stack.append((node, True))
+                    stack.append((int(right), False))
+                    stack.append((int(left), False))
+                    continue
+                a, b = compact_id[int(left)], compact_id[int(right)]
+                if a is None or b is None:
+                    compact_id[node] = a if b is None else b
+                    continue
+                rows.append((a, b, float(state.depths[node]), int(state.sample_counts[node])))
+                compact_id[node] = len(live) + len(rows) - 1
+
+            texts, vectors, leaf_ids = self.live_leaves()
+            tree = FlatTree.from_linkage(vectors, texts, np.asarray(rows, dtype=np.float64).reshape(-1, 4))
+            tree.leaf_ids = leaf_ids[tree.leaf_ids].astype(np.int32)
+            return tree
+
+    def supersede(self, new_tree):
+        """
+        標記此樹已被 new_tree 取代，之後對舊樹的 insert / delete 會轉交給新樹。
+        """
+        with self._lock:
+            self._superseded_by = new_tree
+
+    # 結構查詢（各屬性皆取自目前的狀態；同時需要多個陣列時應先取得 snapshot()）
+
+    @property
+    def vectors(self):
+        return self._state.vectors
+
+    @property
+    def children(self):
+        return self._state.children
+
+    @property
+    def parents(self):
+        return self._state.parents
+
+    @property
+    def sample_counts(self):
+        return self._state.sample_counts
+
+    @property
+    def depths(self):
+        return self._state.depths
+
+    @property
+    def n_leaves(self):
+        return len(self.texts)
+
+    @property
+    def n_nodes(self):
+        return self._state.vectors.shape[0]
+
+    @property
+    def root_index(self):
+        return self._state.root_index
+
+    @property
+    def root(self):
+        return NodeView(self, self.root_index)
+
+    def node(self, index):
+        return NodeView(self, index)
+
+    def is_leaf(self, index):
+        return self.children[index, 0] < 0
+
+    @property
+    def bfs_rank(self):
+        """
+        各節點在自根節點出發的 BFS（先左後右）走訪中的名次，用於比對時決定平手順序。
+        """
+        state = self._state
+        if state.bfs_rank is None:
+            n_nodes = state.vectors.shape[0]
+            order = np.empty(n_nodes, dtype=np.int32)
+            order[0] = state.root_index
+            head, tail = 0, 1
+            while head < tail:
+                node = order[head]
+                head += 1
+                for child in state.children[node]:
+                    if child >= 0:
+                        order[tail] = child
+                        tail += 1
+            rank = np.empty(n_nodes, dtype=np.int32)
+            rank[order] = np.arange(n_nodes, dtype=np.int32)
+            state.bfs_rank = rank
+        return state.bfs_rank
+
+    @property
+    def quantized(self):
+        return self._state.quantized
+
+    @property
+    def vector_dtype(self):
+        return self._quantized_dtype or "float32"
+
+    def quantize(self, dtype, quantized=None):
+        """
+        Summary:
+        設定粗略打分所用的向量格式。
+
+        dtype: float32（不量化）、float16 或 int8
+        quantized: 已量化好的 QuantizedVectors（例如由檔案以 mmap 開啟），預設由 vectors 計算
+        """
+        with self._lock:
+            state = self._state
+            if dtype in (None, "float32"):
+                self._quantized_dtype = None
+                state.quantized = None
+            else:
+                self._quantized_dtype = dtype
+                state.quantized = quantized if quantized is not None else QuantizedVectors.from_vectors(
+                    state.vectors, dtype
+                )
+        return self
+
+    def score_nodes(self, query_vectors):
+        """
+        以一次矩陣乘法計算查詢向量與所有節點中心的內積。
+        已量化時回傳的是近似分數，需要精確名次的呼叫端應以 vectors 重新計算候選節點。
+
+        query_vectors: (d,) 或 (q, d)
+        回傳: (2n-1,) 或 (q, 2n-1)
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        state = self._state
+        if self._quantized_dtype is None:
+            return query_vectors @ state.vectors.T
+        if state.quantized is None:
+            # 異動後的新狀態尚未量化
+            with self._lock:
+                if state.quantized is None:
+                    state.quantized = QuantizedVectors.from_vectors(state.vectors, self._quantized_dtype)
+        return state.quantized.scores(query_vectors)
+
+    @property
+    def scoring_nbytes(self):
+        """
+        全節點打分時需要掃描的向量矩陣大小。
+        """
+        state = self._state
+        return state.quantized.nbytes if state.quantized is not None else state.vectors.nbytes
+
+    @property
+    def nbytes(self):
+        """
+        陣列部分所佔的位元組數（不含 texts）。
+        """
+        state = self._state
+        return (
+            state.vectors.nbytes
+            + state.children.nbytes
+            + state.parents.nbytes
+            + state.sample_counts.nbytes
+            + state.depths.nbytes
+            + self.leaf_ranges.nbytes
+            + self.leaf_ids.nbytes
+        )
+
+    # 與 Node 相容的根節點屬性，讓 FlatTree 可直接當作根節點傳入舊有函式
+
+    @property
+    def vector(self):
+        return self.root.vector
+
+    @property
+    def text(self):
+        return self.root.text
+
+    @property
+    def index(self):
+        return self.root_index
+
+    @property
+    def left(self):
+        return self.root.left
+
+    @property
+    def right(self):
+        return self.root.right
+
+    @property
+    def sample_count(self):
+        return self.root.sample_count
+
+    @property
+    def subtree_depth(self):
+        return self.root.subtree_depth
+
+    def __repr__(self):
+        return f"FlatTree(n_leaves={self.n_leaves}, dim={self.vectors.shape[1]})"
@@ -2,9 +2,58 @@
 這裡蒐集生成與評測時所使用的函式
 """
 
+import hashlib
+import os
+import sys
+
 from langchain.prompts import PromptTemplate
 from langchain import LLMChain
 
+# 添加專案根目錄到路徑，以便引入其他模組
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.config import EXTRACTION_CACHE_SIZE
+from src.utils.embedding_cache import normalize_text
+from src.utils.lru_cache import LRUCache
+
+
+# 檢索內容不足時各 prompt 要求模型回覆的固定答案
+INSUFFICIENT_CONTEXT_ANSWERS = {
+    "task_oriented": "我沒有足夠的相關資訊來回答這個問題",
+    "cot": "依目前檢索內容，無法完整回答。",
+}
+
+
+# query extraction 結果快取：以 (語言模型, 正規化查詢) 的雜湊為鍵，行程內共用
+_EXTRACTION_CACHE = LRUCache(EXTRACTION_CACHE_SIZE)
+
+
+def _extraction_key(query, llm):
+    model_name = getattr(llm, "model_name", None) or type(llm).__name__
+    return hashlib.sha256(f"{model_name}\x1f{normalize_text(query)}".encode("utf-8")).hexdigest()
+
+
+def extraction_cache_stats():
+    return _EXTRACTION_CACHE.stats()
+
+
+_PROMPT_FINGERPRINT = None
+
+
+def prompt_fingerprint():
+    """
+    生成所用 prompt 模板與固定答案的雜湊；模板修改後回應快取的舊項目不再命中。
+    """
+    global _PROMPT_FINGERPRINT
+    if _PROMPT_FINGERPRINT is None:
+        generator = GeneratedFunction()
+        templates = [
+            prompt.template
+            for prompt in (generator._query_extraction_prompt(), generator._task_oriented_prompt(), generator._cot_prompt())
+        ]
+        payload = "\x1e".join(templates + sorted(f"{k}\x1f{v}" for k, v in INSUFFICIENT_CONTEXT_ANSWERS.items()))
+        _PROMPT_FINGERPRINT = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    return _PROMPT_FINGERPRINT
 
 
 class GeneratedFunction:
@@ -12,14 +61,11 @@ class GeneratedFunction:
     def __init__(self):
         pass
 
-    def query_extraction(self, query: str, llm):
+    def _query_extraction_prompt(self):
         """
-        Summary:
-        這是一個提取query的函式
-
-        query: str
+        query extraction 使用的 prompt
         """
-        prompt = PromptTemplate(
+        return PromptTemplate(
             input_variables=["query"],
             template="""
 
@@ -56,27 +102,11 @@ class GeneratedFunction:
 """,
         )
 
-        llm_chain = LLMChain(llm=llm, prompt=prompt)
-
-        final_result = llm_chain.run(query=query)
-
-        print("Final Result:\n", final_result)
-        return final_result
-
-    def LLM_Task_Oriented(self, query: str, llm, retrieved_docs: list) -> str:
+    def _task_oriented_prompt(self):
         """
-        使用任務導向方式生成回答。
-        
-        Args:
-            query: 使用者查詢
-            llm: 語言模型實例
-            retrieved_docs: 檢索到的文檔列表
-            
-        Returns:
-            str: 生成的回答
+        任務導向回答使用的 prompt
         """
-
-        prompt = PromptTemplate(
+        return PromptTemplate(
             input_variables=["context", "query"],
             template="""
 你將獲得以下兩個資訊：
@@ -105,26 +135,11 @@ Observation: 提供清晰、準確的回答。
     """,
         )
 
-        llm_chain = LLMChain(llm=llm, prompt=prompt)
-
-        final_result = llm_chain.run(context=retrieved_docs, query=query)
-
-        print("Final Result:\n", final_result)
-        return final_result
-
-    def RAG_CoT(self, query: str, context: list, llm) -> str:
+    def _cot_prompt(self):
         """
-        使用思維鏈方法生成答案，適合需要詳細分析的問題。
-        
-        Args:
-            query: 原始使用者問題
-            context: 檢索到的文本列表
-            llm: 語言模型實例
-            
-        Returns:
-            str: 根據思維鏈方式生成的詳細解答
+        思維鏈回答使用的 prompt
         """
-        prompt = PromptTemplate(
+        return PromptTemplate(
             input_variables=["context", "query"],
             template="""
 
@@ -160,6 +175,70 @@ Observation: 提供清晰、準確的回答。
 """,
         )
 
+    def query_extraction(self, query: str, llm):
+        """
+        Summary:
+        這是一個提取query的函式；相同的查詢與語言模型會直接回傳快取的結果（EXTRACTION_CACHE_SIZE）
+
+        query: str
+        """
+        key = _extraction_key(query, llm)
+        cached = _EXTRACTION_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+        prompt = self._query_extraction_prompt()
+
+        llm_chain = LLMChain(llm=llm, prompt=prompt)
+
+        final_result = llm_chain.run(query=query)
+
+        print("Final Result:\n", final_result)
+        _EXTRACTION_CACHE.put(key, final_result)
+        return final_result
+
+    def is_extraction_cached(self, query: str, llm) -> bool:
+        """
+        query extraction 的結果是否已在快取中（不計入命中統計）。
+        """
+        return _extraction_key(query, llm) in _EXTRACTION_CACHE
+
+    def LLM_Task_Oriented(self, query: str, llm, retrieved_docs: list) -> str:
+        """
+        使用任務導向方式生成回答。
+        
+        Args:
+            query: 使用者查詢
+            llm: 語言模型實例
+            retrieved_docs: 檢索到的文檔列表，或 ContextPacker 排版後的檢索內容字串
+            
+        Returns:
+            str: 生成的回答
+        """
+
+        prompt = self._task_oriented_prompt()
+
+        llm_chain = LLMChain(llm=llm, prompt=prompt)
+
+        final_result = llm_chain.run(context=retrieved_docs, query=query)
+
+        print("Final Result:\n", final_result)
+        return final_result
+
+    def RAG_CoT(self, query: str, context: list, llm) -> str:
+        """
+        使用思維鏈方法生成答案，適合需要詳細分析的問題。
+        
+        Args:
+            query: 原始使用者問題
+            context: 檢索到的文本列表，或 ContextPacker 排版後的檢索內容字串
+            llm: 語言模型實例
+            
+        Returns:
+            str: 根據思維鏈方式生成的詳細解答
+        """
+        prompt = self._cot_prompt()
+
         llm_chain = LLMChain(llm=llm, prompt=prompt)
 
         final_result = llm_chain.run(context=context, query=query)
@@ -167,6 +246,69 @@ Observation: 提供清晰、準確的回答。
         print("Final Result:\n", final_result)
         return final_result
 
+    def insufficient_context_answer(self, prompt_type: str = "task_oriented") -> str:
+        """
+        檢索相關性不足時直接回覆的固定答案，與 prompt 中「無法回答時」的指示一致。
+        """
+        return INSUFFICIENT_CONTEXT_ANSWERS.get(prompt_type, INSUFFICIENT_CONTEXT_ANSWERS["task_oriented"])
+
+    async def query_extraction_async(self, query: str, llm):
+        """
+        query_extraction 的非同步版本，等待 LLM 回應時不會阻塞事件迴圈。
+        """
+        key = _extraction_key(query, llm)
+        cached = _EXTRACTION_CACHE.get(key)
+        if cached is not None:
+            return cached
+
+        llm_chain = LLMChain(llm=llm, prompt=self._query_extraction_prompt())
+
+        final_result = await llm_chain.arun(query=query)
+
+        print("Final Result:\n", final_result)
+        _EXTRACTION_CACHE.put(key, final_result)
+        return final_result
+
+    async def LLM_Task_Oriented_async(self, query: str, llm, retrieved_docs: list) -> str:
+        """
+        LLM_Task_Oriented 的非同步版本。
+        """
+        llm_chain = LLMChain(llm=llm, prompt=self._task_oriented_prompt())
+
+        final_result = await llm_chain.arun(context=retrieved_docs, query=query)
+
+        print("Final Result:\n", final_result)
+        return final_result
+
+    async def RAG_CoT_async(self, query: str, context: list, llm) -> str:
+        """
+        RAG_CoT 的非同步版本。
+        """
+        llm_chain = LLMChain(llm=llm, prompt=self._cot_prompt())
+
+        final_result = await llm_chain.arun(context=context, query=query)
+
+        print("Final Result:\n", final_result)
+        return final_result
+
+    async def LLM_Task_Oriented_stream(self, query: str, llm, retrieved_docs: list):
+        """
+        LLM_Task_Oriented 的串流版本，逐段 yield LLM 產生的文字。
+        """
+        chain = self._task_oriented_prompt() | llm
+        async for chunk in chain.astream({"context": retrieved_docs, "query": query}):
+            if chunk.content:
+                yield chunk.content
+
+    async def RAG_CoT_stream(self, query: str, context: list, llm):
+        """
+        RAG_CoT 的串流版本，逐段 yield LLM 產生的文字。
+        """
+        chain = self._cot_prompt() | llm
+        async for chunk in chain.astream({"context": context, "query": query}):
+            if chunk.content:
+                yield chunk.content
+
     def LLM_benchmark(self, query, llm, retrieved_docs, answer1, answer2):
         """
         Summary:
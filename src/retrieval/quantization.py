@@ -0,0 +1,128 @@
+"""
+節點向量的量化儲存（float16 / int8），用於全節點掃描的粗略打分
+
+- float16：直接以半精度儲存，記憶體減半
+- int8：每個向量各自的 scale（max|v| / 127）做對稱量化，記憶體為 float32 的 1/4
+
+打分時以固定大小的區塊轉回 float32 再做矩陣乘法，暫存空間與節點數無關；
+粗略分數只用於挑選候選節點，最終名次由 float32 向量重新計算（見 RAGTree_function._vectorized_best_node）。
+"""
+
+import os
+
+import numpy as np
+
+
+VECTOR_DTYPES = ("float32", "float16", "int8")
+
+# 區塊大小：轉換後的 float32 區塊可放進 CPU 快取
+_BLOCK_ROWS = 128
+
+QUANTIZED_FILES = {
+    "float16": ("centroids.f16.npy", None),
+    "int8": ("centroids.i8.npy", "centroids.i8.scale.npy"),
+}
+
+
+class QuantizedVectors:
+    """
+    Summary:
+    量化後的節點向量矩陣。
+
+    data: (N, d) float16 或 int8
+    scales: (N,) float32，僅 int8 使用；向量 i 約等於 data[i] * scales[i]
+    """
+
+    def __init__(self, data, scales=None):
+        self.data = data
+        self.scales = scales
+
+    @property
+    def dtype(self):
+        return "int8" if self.scales is not None else "float16"
+
+    @classmethod
+    def from_vectors(cls, vectors, dtype):
+        """
+        Summary:
+        將 float32 向量量化。NaN 向量（已刪除的節點）量化後打分仍為 NaN。
+
+        vectors: (N, d)
+        dtype: float16 或 int8
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if dtype == "float16":
+            return cls(vectors.astype(np.float16))
+        if dtype != "int8":
+            raise ValueError(f"不支援的量化格式: {dtype}（可用: float16、int8）")
+
+        with np.errstate(invalid="ignore"):
+            max_abs = np.abs(vectors).max(axis=1) if vectors.size else np.zeros(len(vectors), dtype=np.float32)
+        scales = (max_abs / 127.0).astype(np.float32)
+        safe = np.where(np.isfinite(scales) & (scales > 0), scales, 1.0).astype(np.float32)
+        data = np.clip(np.rint(np.nan_to_num(vectors / safe[:, None])), -127, 127).astype(np.int8)
+        # 全零向量的 scale 設為 0，NaN 向量保留 NaN
+        scales = np.where(np.isfinite(scales), scales, np.nan).astype(np.float32)
+        return cls(data, scales)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def __len__(self):
+        return len(self.data)
+
+    def scores(self, query_vectors):
+        """
+        Summary:
+        計算查詢向量與所有量化向量的內積（近似值）。
+
+        query_vectors: (d,) 或 (q, d)
+        回傳: (N,) 或 (q, N) float32
+        """
+        query_vectors = np.asarray(query_vectors, dtype=np.float32)
+        single = query_vectors.ndim == 1
+        queries = query_vectors.reshape(-1, query_vectors.shape[-1]).T
+        n = len(self.data)
+        out = np.empty((n, queries.shape[1]), dtype=np.float32)
+        block = np.empty((min(_BLOCK_ROWS, max(n, 1)), self.data.shape[1]), dtype=np.float32)
+        for start in range(0, n, _BLOCK_ROWS):
+            rows = self.data[start:start + _BLOCK_ROWS]
+            buffer = block[: len(rows)]
+            buffer[...] = rows
+            np.dot(buffer, queries, out=out[start:start + len(rows)])
+        if self.scales is not None:
+            out *= self.scales[:, None]
+        out = out.T
+        return out[0] if single else out
+
+
+def save_quantized(quantized, path):
+    """
+    將量化矩陣寫入檢索樹目錄（先寫暫存檔再替換）。
+    """
+    data_file, scale_file = QUANTIZED_FILES[quantized.dtype]
+    for filename, array in ((data_file, quantized.data), (scale_file, quantized.scales)):
+        if filename is None:
+            continue
+        target = os.path.join(path, filename)
+        tmp_path = f"{target}.tmp-{os.getpid()}.npy"
+        np.save(tmp_path, array)
+        os.replace(tmp_path, target)
+
+
+def load_quantized(path, dtype, mmap_mode="r"):
+    """
+    從檢索樹目錄開啟量化矩陣，檔案不存在時回傳 None。
+    """
+    data_file, scale_file = QUANTIZED_FILES[dtype]
+    data_path = os.path.join(path, data_file)
+    if not os.path.exists(data_path):
+        return None
+    scales = None
+    if scale_file is not None:
+        scale_path = os.path.join(path, scale_file)
+        if not os.path.exists(scale_path):
+            return None
+        scales = np.load(scale_path, mmap_mode=mmap_mode)
+    return QuantizedVectors(np.load(data_path, mmap_mode=mmap_mode), scales)
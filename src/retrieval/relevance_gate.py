@@ -0,0 +1,81 @@
+"""
+檢索相關性門檻：最佳分數過低時不呼叫 LLM，直接回覆固定答案
+
+- node_score：子查詢與命中節點中心的餘弦相似度（find_most_similar_node 的選擇依據），取所有子查詢中的最大值
+- rerank 分數：候選經 rerank 時（Cross-Encoder 為其原始分數），取最大值
+兩者的門檻皆為 None 時不啟用。最近的最佳分數分佈可由 stats() 取得，用於設定門檻。
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class RelevanceGate:
+    """
+    Summary:
+    判斷檢索結果是否足以送交 LLM 回答。
+
+    min_node_score: 最佳 node_score 的下限
+    min_rerank_score: 最佳 rerank 分數的下限（僅在有經過 rerank 的結果時判斷）
+    """
+
+    def __init__(self, min_node_score=None, min_rerank_score=None):
+        self.min_node_score = min_node_score
+        self.min_rerank_score = min_rerank_score
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.short_circuited = {"no_hits": 0, "node_score": 0, "rerank_score": 0}
+        self._recent_node_scores = deque(maxlen=1024)
+        self._recent_rerank_scores = deque(maxlen=1024)
+
+    def check(self, hits):
+        """
+        回傳 None 表示通過；未通過時回傳原因（no_hits / node_score / rerank_score）。
+
+        hits: list[RetrievalHit]
+        """
+        node_scores = [hit.node_score for hit in hits if hit.node_score is not None]
+        rerank_scores = [hit.score for hit in hits if hit.reranked]
+        best_node = max(node_scores) if node_scores else None
+        best_rerank = max(rerank_scores) if rerank_scores else None
+
+        reason = None
+        if not hits:
+            reason = "no_hits"
+        elif self.min_node_score is not None and best_node is not None and best_node < self.min_node_score:
+            reason = "node_score"
+        elif self.min_rerank_score is not None and best_rerank is not None and best_rerank < self.min_rerank_score:
+            reason = "rerank_score"
+
+        with self._lock:
+            self.checked += 1
+            if best_node is not None:
+                self._recent_node_scores.append(best_node)
+            if best_rerank is not None:
+                self._recent_rerank_scores.append(best_rerank)
+            if reason is not None:
+                self.short_circuited[reason] += 1
+        return reason
+
+    @staticmethod
+    def _percentiles(values):
+        if not values:
+            return None
+        values = np.asarray(values)
+        return {f"p{q}": float(np.percentile(values, q)) for q in (10, 50, 90)}
+
+    def stats(self):
+        with self._lock:
+            short_circuited = sum(self.short_circuited.values())
+            return {
+                "min_node_score": self.min_node_score,
+                "min_rerank_score": self.min_rerank_score,
+                "checked": self.checked,
+                "short_circuited": short_circuited,
+                "short_circuit_rate": short_circuited / self.checked if self.checked else 0.0,
+                "by_reason": dict(self.short_circuited),
+                "recent_best_node_score": self._percentiles(self._recent_node_scores),
+                "recent_best_rerank_score": self._percentiles(self._recent_rerank_scores),
+            }
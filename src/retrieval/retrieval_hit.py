@@ -0,0 +1,55 @@
+"""
+結構化的檢索結果
+"""
+
+
+class RetrievalHit:
+    """
+    Summary:
+    單筆檢索結果。
+
+    leaf_id: 原始文本索引（FlatTree 的 leaf_ids；舊版 Node 樹為 None）
+    text: 文本內容
+    score: 排序分數；一般為查詢向量與文本向量的餘弦相似度，經 rerank 時為 rerank 分數
+    node_id: 子查詢命中的最相似節點編號（舊版 Node 樹為 None）
+    node_depth: 該節點與根節點的距離（根節點為 0；舊版 Node 樹為 None）
+    sub_query_index: 產生此結果的子查詢在 split_query 結果中的位置
+    corpus: 跨語料檢索時的語料名稱
+    node_score: 子查詢與命中節點中心的餘弦相似度（find_most_similar_node 的選擇依據）
+    reranked: score 是否來自 rerank
+    """
+
+    __slots__ = (
+        "leaf_id", "text", "score", "node_id", "node_depth", "sub_query_index", "corpus", "node_score", "reranked"
+    )
+
+    def __init__(
+        self, leaf_id, text, score, node_id=None, node_depth=None, sub_query_index=0, corpus=None,
+        node_score=None, reranked=False,
+    ):
+        self.leaf_id = leaf_id
+        self.text = text
+        self.score = score
+        self.node_id = node_id
+        self.node_depth = node_depth
+        self.sub_query_index = sub_query_index
+        self.corpus = corpus
+        self.node_score = node_score
+        self.reranked = reranked
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        preview = self.text[:20] + ("…" if len(self.text) > 20 else "")
+        return (
+            f"RetrievalHit(leaf_id={self.leaf_id}, score={self.score:.4f}, node_id={self.node_id}, "
+            f"sub_query_index={self.sub_query_index}, text={preview!r})"
+        )
+
+
+def unique_texts(hits):
+    """
+    依名次回傳不重複的文本列表（同一文本被多個子查詢命中時只保留第一次出現）。
+    """
+    return list(dict.fromkeys(hit.text for hit in hits))
@@ -0,0 +1,304 @@
+"""
+預先建構的檢索樹檔案：離線建構、版本化儲存與載入
+
+每個文本對應一個目錄 {TREE_ARTIFACT_DIR}/{text_name}/，內含：
+- manifest.json：格式版本、模型名稱、向量維度、來源檔案雜湊等資訊
+- tree_storage 定義的二進位檔案（linkage matrix、節點中心矩陣、結構陣列、文本 offsets + blob），
+  可用唯讀 mmap 開啟
+
+只有當來源 embeddings / texts 檔案的雜湊、詞嵌入模型或建構設定（linkage 方法、建構策略）改變時才需要重建。
+
+離線建構:
+    python -m src.retrieval.tree_artifact --all
+    python -m src.retrieval.tree_artifact --text-name 民法總則 --force
+    python -m src.retrieval.tree_artifact --all --method ward --strategy kmeans
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sys
+import time
+
+import numpy as np
+
+# 添加專案根目錄到路徑，以便引入其他模組
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.config import DATA_DIR, TREE_ARTIFACT_DIR, MODEL_NAME, TREE_MMAP, TREE_VECTOR_DTYPE
+from src.retrieval.tree_storage import save_flat_tree, load_flat_tree
+from src.retrieval.tree_builder import TreeBuilder
+
+
+ARTIFACT_FORMAT_VERSION = 3
+
+MANIFEST_FILE = "manifest.json"
+
+
+def source_paths(text_name, data_dir=DATA_DIR):
+    """
+    回傳 (embeddings_path, texts_path)。
+    """
+    embeddings_path = os.path.join(data_dir, f"{text_name}_embeddings.pkl")
+    texts_path = os.path.join(data_dir, f"{text_name}.pkl")
+    return embeddings_path, texts_path
+
+
+def artifact_path(text_name, artifact_dir=TREE_ARTIFACT_DIR):
+    return os.path.join(artifact_dir, text_name)
+
+
+def source_fingerprint(embeddings_path, texts_path):
+    """
+    計算來源 embeddings 與 texts 檔案內容的 sha256。
+    """
+    digest = hashlib.sha256()
+    for path in (embeddings_path, texts_path):
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def source_stat(embeddings_path, texts_path):
+    """
+    來源檔案的大小與修改時間，用於在檔案未變動時略過雜湊計算。
+    """
+    return [[os.path.getsize(p), os.stat(p).st_mtime_ns] for p in (embeddings_path, texts_path)]
+
+
+def current_source_hash(manifest, embeddings_path, texts_path):
+    """
+    若來源檔案大小與修改時間與 manifest 記錄相同，直接沿用其雜湊，否則重新計算。
+    """
+    if manifest is not None and manifest.get("source_stat") == source_stat(embeddings_path, texts_path):
+        return manifest.get("source_hash")
+    return source_fingerprint(embeddings_path, texts_path)
+
+
+def read_manifest(path):
+    """
+    讀取檢索樹目錄的 manifest，不存在或格式錯誤時回傳 None。
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def is_artifact_current(manifest, source_hash, model_name=MODEL_NAME, builder=None):
+    """
+    判斷既有檢索樹是否仍對應目前的來源檔案、詞嵌入模型與建構設定。
+    """
+    builder = builder or TreeBuilder()
+    return (
+        manifest is not None
+        and manifest.get("format_version") == ARTIFACT_FORMAT_VERSION
+        and manifest.get("source_hash") == source_hash
+        and manifest.get("model_name") == model_name
+        and manifest.get("linkage_method", "single") == builder.method
+        and manifest.get("build_strategy", "exact") == builder.strategy
+        # kmeans 策略的分群大小會改變樹的結構（exact 策略不記錄此設定）
+        and (builder.strategy != "kmeans" or manifest.get("max_cluster_size") == builder.max_cluster_size)
+    )
+
+
+def write_tree_artifact(
+    tree, path, source_hash, model_name=MODEL_NAME, text_name=None, stat_info=None, build_info=None
+):
+    """
+    Summary:
+    將 FlatTree 寫入檢索樹目錄。先寫入暫存目錄再替換，避免讀取到寫一半的檔案。
+
+    tree: FlatTree
+    path: 輸出目錄
+    source_hash: 來源檔案雜湊（source_fingerprint）
+    model_name: 建立 embeddings 所用的詞嵌入模型
+    stat_info: 來源檔案的大小與修改時間（source_stat）
+    build_info: 建構設定（TreeBuilder.describe），預設為 single linkage 直接聚類
+    """
+    if tree.is_modified:
+        tree = tree.materialize()
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    old_path = f"{path}.old-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    save_flat_tree(tree, tmp_path, TREE_VECTOR_DTYPE)
+
+    manifest = {
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        "text_name": text_name,
+        "model_name": model_name,
+        "dimension": int(tree.vectors.shape[1]),
+        "n_leaves": int(tree.n_leaves),
+        **(build_info or {"linkage_method": "single", "build_strategy": "exact"}),
+        "source_hash": source_hash,
+        "source_stat": stat_info,
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(os.path.join(tmp_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(path):
+        os.rename(path, old_path)
+    os.rename(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return manifest
+
+
+def load_tree_artifact(path, mmap_mode="r", vector_dtype=TREE_VECTOR_DTYPE):
+    """
+    Summary:
+    從檢索樹目錄載入 FlatTree（不重新執行聚類）。
+
+    path: 檢索樹目錄
+    mmap_mode: "r" 以唯讀 mmap 開啟（多個 worker 共用 page cache）；None 則整份讀入記憶體
+    vector_dtype: 粗略打分所用的向量格式（float32 / float16 / int8）
+    """
+    manifest = read_manifest(path)
+    if manifest is None:
+        raise FileNotFoundError(f"找不到檢索樹 manifest: {os.path.join(path, MANIFEST_FILE)}")
+    if manifest.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        raise ValueError(
+            f"檢索樹格式版本不符：{manifest.get('format_version')}（需要 {ARTIFACT_FORMAT_VERSION}），請重新建構"
+        )
+
+    return load_flat_tree(path, mmap_mode, vector_dtype)
+
+
+def load_source(text_name, data_dir=DATA_DIR):
+    """
+    載入來源 embeddings 與 texts。
+    """
+    embeddings_path, texts_path = source_paths(text_name, data_dir)
+    if not os.path.exists(embeddings_path):
+        raise FileNotFoundError(f"找不到向量檔案: {embeddings_path}")
+    if not os.path.exists(texts_path):
+        raise FileNotFoundError(f"找不到文本檔案: {texts_path}")
+
+    with open(embeddings_path, "rb") as f:
+        vectors = pickle.load(f)
+    with open(texts_path, "rb") as f:
+        texts = pickle.load(f)
+
+    if not isinstance(vectors, np.ndarray):
+        vectors = np.array(vectors)
+    if vectors.ndim != 2:
+        raise ValueError(f"讀取到的向量格式異常，請確認檔案內容：{embeddings_path}")
+    return vectors, texts
+
+
+def build_tree_artifact(
+    text_name, data_dir=DATA_DIR, artifact_dir=TREE_ARTIFACT_DIR, model_name=MODEL_NAME, builder=None
+):
+    """
+    Summary:
+    從來源 pkl 建構檢索樹並寫入檢索樹目錄，回傳 (tree, manifest)。
+
+    text_name: 文本名稱
+    builder: TreeBuilder，預設依 TREE_LINKAGE_METHOD / TREE_BUILD_STRATEGY
+    """
+    builder = builder or TreeBuilder()
+    embeddings_path, texts_path = source_paths(text_name, data_dir)
+    vectors, texts = load_source(text_name, data_dir)
+    source_hash = source_fingerprint(embeddings_path, texts_path)
+
+    tree = builder.build(vectors, texts)
+    manifest = write_tree_artifact(
+        tree,
+        artifact_path(text_name, artifact_dir),
+        source_hash,
+        model_name,
+        text_name,
+        source_stat(embeddings_path, texts_path),
+        builder.describe(),
+    )
+    return tree, manifest
+
+
+def load_or_build_tree(
+    text_name, data_dir=DATA_DIR, artifact_dir=TREE_ARTIFACT_DIR, model_name=MODEL_NAME, mmap=TREE_MMAP
+):
+    """
+    Summary:
+    優先載入既有的檢索樹；若不存在、格式過舊、來源雜湊或模型不符，才重新建構並寫回。
+
+    text_name: 文本名稱
+    mmap: 是否以唯讀 mmap 開啟檢索樹檔案
+    """
+    embeddings_path, texts_path = source_paths(text_name, data_dir)
+    if not os.path.exists(embeddings_path):
+        raise FileNotFoundError(f"找不到向量檔案: {embeddings_path}")
+    if not os.path.exists(texts_path):
+        raise FileNotFoundError(f"找不到文本檔案: {texts_path}")
+
+    mmap_mode = "r" if mmap else None
+    path = artifact_path(text_name, artifact_dir)
+    manifest = read_manifest(path)
+    source_hash = current_source_hash(manifest, embeddings_path, texts_path)
+    if is_artifact_current(manifest, source_hash, model_name):
+        try:
+            tree = load_tree_artifact(path, mmap_mode)
+            print(f"已載入預建檢索樹：{path}")
+            return tree
+        except (OSError, ValueError) as e:
+            print(f"預建檢索樹載入失敗，改為重新建構：{e}")
+
+    build_tree_artifact(text_name, data_dir, artifact_dir, model_name)
+    print(f"已重新建構並儲存檢索樹：{path}")
+    # 重新以檔案開啟，讓剛建好的檢索樹同樣走 mmap
+    return load_tree_artifact(path, mmap_mode)
+
+
+def available_text_names(data_dir=DATA_DIR):
+    files = os.listdir(data_dir)
+    texts = set(f[: -len(".pkl")] for f in files if f.endswith(".pkl"))
+    embeddings = set(f[: -len("_embeddings.pkl")] for f in files if f.endswith("_embeddings.pkl"))
+    return sorted(texts & embeddings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="離線建構檢索樹檔案")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--text-name", nargs="+", help="要建構的文本名稱")
+    group.add_argument("--all", action="store_true", help="建構資料目錄下所有文本")
+    parser.add_argument("--data-dir", default=str(DATA_DIR), help="來源 pkl 目錄")
+    parser.add_argument("--artifact-dir", default=str(TREE_ARTIFACT_DIR), help="輸出目錄")
+    parser.add_argument("--model-name", default=MODEL_NAME, help="建立 embeddings 所用的詞嵌入模型")
+    parser.add_argument("--method", default=None, help="linkage 方法：single / average / complete / ward")
+    parser.add_argument("--strategy", default=None, help="建構策略：exact 或 kmeans（大型語料）")
+    parser.add_argument("--max-cluster-size", type=int, default=None, help="kmeans 策略單次聚類的向量數上限")
+    parser.add_argument("--force", action="store_true", help="即使來源未變更也重新建構")
+    args = parser.parse_args(argv)
+    builder = TreeBuilder(args.method, args.strategy, args.max_cluster_size)
+
+    text_names = available_text_names(args.data_dir) if args.all else args.text_name
+    for text_name in text_names:
+        path = artifact_path(text_name, args.artifact_dir)
+        embeddings_path, texts_path = source_paths(text_name, args.data_dir)
+        manifest = read_manifest(path)
+        source_hash = current_source_hash(manifest, embeddings_path, texts_path)
+        if not args.force and is_artifact_current(manifest, source_hash, args.model_name, builder):
+            print(f"略過（已是最新）：{text_name}")
+            continue
+
+        start_time = time.time()
+        _, manifest = build_tree_artifact(text_name, args.data_dir, args.artifact_dir, args.model_name, builder)
+        print(
+            f"✅ 已建構 {text_name}（{builder.method} / {builder.strategy}）：{manifest['n_leaves']} 葉節點，"
+            f"維度 {manifest['dimension']}，耗時 {time.time() - start_time:.2f} 秒 → {path}"
+        )
+
+
+if __name__ == "__main__":
+    main()
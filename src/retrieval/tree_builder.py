@@ -0,0 +1,196 @@
+"""
+檢索樹建構策略：可切換的 linkage 方法與大型語料用的兩階段建構
+
+- exact：對全部向量直接做階層式聚類。single / average / complete 使用 cosine 距離，
+  ward 在正規化後的向量上以歐氏距離計算（fastcluster.linkage_vector，記憶體 O(n·d)）。
+  single / average / complete 需要 O(n²) 的距離矩陣，僅適合中小型語料。
+- kmeans：先以 k-means（FAISS，無法使用時改用 scikit-learn）把向量分群，
+  群內再做階層式聚類，最後以各群中心建立上層階層。超過 max_cluster_size 的群會遞迴再分，
+  因此任何一次聚類的距離矩陣都不超過 max_cluster_size²，建構記憶體有上限。
+"""
+
+import os
+import sys
+
+import numpy as np
+from fastcluster import linkage, linkage_vector
+
+# 添加專案根目錄到路徑，以便引入其他模組
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.config import TREE_LINKAGE_METHOD, TREE_BUILD_STRATEGY, TREE_BUILD_CLUSTER_SIZE
+from src.retrieval.flat_tree import FlatTree
+
+
+LINKAGE_METHODS = ("single", "average", "complete", "ward")
+BUILD_STRATEGIES = ("exact", "kmeans")
+
+
+def normalize_vectors(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def compute_linkage(vectors, method="single"):
+    """
+    Summary:
+    對向量做階層式聚類，回傳 (n-1, 4) linkage matrix。
+
+    vectors: np.array，形狀 (n, d)
+    method: single / average / complete（cosine 距離）或 ward（正規化後的歐氏距離）
+    """
+    if method not in LINKAGE_METHODS:
+        raise ValueError(f"不支援的 linkage 方法: {method}（可用: {', '.join(LINKAGE_METHODS)}）")
+    if len(vectors) < 2:
+        return np.empty((0, 4))
+    if method == "single":
+        # 與原本的建構方式相同，確保既有檢索樹結果不變
+        return linkage(vectors, method="single", metric="cosine")
+    normalized = normalize_vectors(vectors).astype(np.float64)
+    if method == "ward":
+        return linkage_vector(normalized, method="ward")
+    return linkage(normalized, method=method, metric="cosine")
+
+
+def kmeans_assign(vectors, n_clusters, seed=0):
+    """
+    Summary:
+    以球面 k-means 將正規化向量分為 n_clusters 群，回傳各向量的群編號。
+    優先使用 FAISS，無法匯入時改用 scikit-learn 的 MiniBatchKMeans。
+
+    vectors: 已正規化的 np.array，形狀 (n, d)
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    try:
+        import faiss
+    except ImportError:
+        faiss = None
+
+    if faiss is not None:
+        kmeans = faiss.Kmeans(
+            vectors.shape[1],
+            n_clusters,
+            niter=20,
+            seed=seed,
+            spherical=True,
+            verbose=False,
+            min_points_per_centroid=1,
+        )
+        kmeans.train(vectors)
+        _, labels = kmeans.index.search(vectors, 1)
+        return labels.ravel()
+
+    from sklearn.cluster import MiniBatchKMeans
+
+    kmeans = MiniBatchKMeans(n_clusters=n_clusters, random_state=seed, n_init=3)
+    return kmeans.fit_predict(vectors)
+
+
+class _LinkageAssembler:
+    """
+    將多個局部 linkage matrix 串接為全域 linkage matrix。
+    """
+
+    def __init__(self, n):
+        self.n = n
+        self.rows = []
+        self.counts = [1] * n
+
+    def append(self, local_linkage, node_ids):
+        """
+        將局部聚類結果加入全域矩陣。node_ids[i] 為局部第 i 個輸入對應的全域節點編號，
+        回傳局部根節點的全域編號。
+        """
+        m = len(node_ids)
+        mapping = list(node_ids)
+        for c1, c2, distance, _ in np.asarray(local_linkage).reshape(-1, 4):
+            a, b = mapping[int(c1)], mapping[int(c2)]
+            count = self.counts[a] + self.counts[b]
+            self.rows.append((a, b, distance, count))
+            self.counts.append(count)
+            mapping.append(self.n + len(self.rows) - 1)
+        return mapping[2 * m - 2] if m > 1 else mapping[0]
+
+    def linkage_matrix(self):
+        return np.asarray(self.rows, dtype=np.float64).reshape(-1, 4)
+
+
+class TreeBuilder:
+    """
+    Summary:
+    檢索樹建構器。
+
+    method: linkage 方法（single / average / complete / ward）
+    strategy: exact（直接聚類）或 kmeans（先分群再於群內聚類）
+    max_cluster_size: kmeans 策略下，單次階層式聚類最多處理的向量數
+    n_clusters: kmeans 策略每次分群的群數，預設依資料量取 ceil(n / max_cluster_size) 與 √n 的較大者
+    seed: k-means 亂數種子
+    """
+
+    def __init__(self, method=None, strategy=None, max_cluster_size=None, n_clusters=None, seed=0):
+        self.method = method or TREE_LINKAGE_METHOD
+        self.strategy = strategy or TREE_BUILD_STRATEGY
+        self.max_cluster_size = max(2, max_cluster_size or TREE_BUILD_CLUSTER_SIZE)
+        self.n_clusters = n_clusters
+        self.seed = seed
+        if self.method not in LINKAGE_METHODS:
+            raise ValueError(f"不支援的 linkage 方法: {self.method}（可用: {', '.join(LINKAGE_METHODS)}）")
+        if self.strategy not in BUILD_STRATEGIES:
+            raise ValueError(f"不支援的建構策略: {self.strategy}（可用: {', '.join(BUILD_STRATEGIES)}）")
+
+    def describe(self):
+        """
+        供 manifest 記錄的建構設定。
+        """
+        info = {"linkage_method": self.method, "build_strategy": self.strategy}
+        if self.strategy == "kmeans":
+            info["max_cluster_size"] = self.max_cluster_size
+        return info
+
+    def linkage(self, vectors):
+        """
+        回傳整體的 (n-1, 4) linkage matrix（葉節點編號即輸入順序）。
+        """
+        vectors = np.asarray(vectors)
+        if self.strategy == "exact" or len(vectors) <= self.max_cluster_size:
+            return compute_linkage(vectors, self.method)
+
+        normalized = normalize_vectors(vectors)
+        assembler = _LinkageAssembler(len(vectors))
+        self._build_partition(vectors, normalized, np.arange(len(vectors)), assembler)
+        return assembler.linkage_matrix()
+
+    def _build_partition(self, vectors, normalized, indices, assembler):
+        """
+        遞迴建構 indices 這群向量的子樹，回傳子樹根節點的全域編號。
+        """
+        if len(indices) <= self.max_cluster_size:
+            return assembler.append(compute_linkage(vectors[indices], self.method), indices.tolist())
+
+        n_clusters = self.n_clusters or max(
+            int(np.ceil(len(indices) / self.max_cluster_size)), int(np.sqrt(len(indices)))
+        )
+        n_clusters = min(n_clusters, self.max_cluster_size, len(indices))
+        labels = kmeans_assign(normalized[indices], n_clusters, self.seed)
+        groups = [indices[labels == label] for label in np.unique(labels)]
+        if len(groups) < 2:
+            # 向量幾乎相同而無法分群時，依原始順序切分
+            groups = np.array_split(indices, int(np.ceil(len(indices) / self.max_cluster_size)))
+
+        roots = [self._build_partition(vectors, normalized, group, assembler) for group in groups]
+        # 上層以各群的中心向量聚類
+        centroids = np.stack([normalized[group].mean(axis=0) for group in groups])
+        return assembler.append(compute_linkage(centroids, self.method), roots)
+
+    def build(self, vectors, texts):
+        """
+        Summary:
+        建構 FlatTree。
+
+        vectors: np.array，形狀 (n, d)
+        texts: list[str]
+        """
+        vectors = np.asarray(vectors)
+        return FlatTree.from_linkage(vectors, texts, self.linkage(vectors))
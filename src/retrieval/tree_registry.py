@@ -0,0 +1,200 @@
+"""
+多語料共用的檢索樹登錄表：記憶體上限、LRU 淘汰與合併並發載入
+
+- 同一語料的並發首次請求只會觸發一次載入 / 建構，其餘請求等待同一個結果
+- 常駐檢索樹的總大小超過上限時，淘汰最久未使用的語料，下次查詢時再重新載入（預建檔以 mmap 開啟，重新載入很快）
+- 有增量異動（insert / delete）或經背景重建換上的檢索樹只存在記憶體中，淘汰會遺失異動，因此不會被淘汰
+- 各語料的載入次數、載入時間、大小與命中次數可由 stats() 取得
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+from app.config import TREE_RESCORE_K
+from src.retrieval.tree_storage import TextStore
+
+
+def tree_nbytes(tree):
+    """
+    Summary:
+    估計檢索樹常駐所需的位元組數：結構陣列、打分時掃描的節點向量與文本。
+
+    未量化時計入完整的 float32 節點中心矩陣（每次查詢全部掃描）。
+    量化後每次查詢只掃描量化矩陣，float32 矩陣僅讀取前 TREE_RESCORE_K 個候選重新計分；
+    預建檢索樹以 mmap 開啟該矩陣，未讀取的列留在可回收的 page cache，
+    因此只計入量化矩陣與重新計分的 TREE_RESCORE_K 列，量化的檢索樹估計值小於 float32 版本。
+    """
+    texts = tree.texts
+    if isinstance(texts, TextStore):
+        text_bytes = texts.offsets.nbytes + texts.blob.nbytes
+    else:
+        text_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    vectors = tree.vectors
+    vector_bytes = vectors.nbytes
+    quantized = getattr(tree, "quantized", None)
+    if quantized is not None:
+        rescore_rows = min(TREE_RESCORE_K, vectors.shape[0])
+        vector_bytes = quantized.nbytes + rescore_rows * vectors.itemsize * vectors.shape[1]
+    return int(tree.nbytes - vectors.nbytes + vector_bytes + text_bytes)
+
+
+class _Entry:
+    __slots__ = ("tree", "nbytes", "load_seconds", "loaded_at", "last_access", "pinned")
+
+    def __init__(self, tree, load_seconds, pinned=False):
+        self.tree = tree
+        self.pinned = pinned
+        self.nbytes = tree_nbytes(tree)
+        self.load_seconds = load_seconds
+        self.loaded_at = time.time()
+        self.last_access = self.loaded_at
+
+
+class TreeRegistry:
+    """
+    Summary:
+    依語料名稱快取檢索樹。
+
+    loader: loader(name)，回傳 FlatTree；失敗時拋出的例外會傳給所有等待中的請求
+    memory_budget: 常駐檢索樹的總位元組上限，0 表示不限制
+    """
+
+    def __init__(self, loader, memory_budget=0):
+        self.loader = loader
+        self.memory_budget = max(0, int(memory_budget))
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        # 各語料的累計統計，淘汰後仍保留
+        self._history = {}
+        self.evictions = 0
+
+    def _history_for(self, name):
+        return self._history.setdefault(
+            name,
+            {"hits": 0, "misses": 0, "coalesced": 0, "loads": 0, "load_seconds_total": 0.0, "evictions": 0, "errors": 0},
+        )
+
+    def get(self, name):
+        """
+        取得檢索樹；尚未載入時由第一個請求載入，同時到達的其他請求等待同一次載入。
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                self._entries.move_to_end(name)
+                self._history_for(name)["hits"] += 1
+                entry.last_access = time.time()
+                return entry.tree
+            history = self._history_for(name)
+            future = self._loading.get(name)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._loading[name] = future
+                history["misses"] += 1
+            else:
+                history["coalesced"] += 1
+
+        if not owner:
+            return future.result()
+
+        start_time = time.perf_counter()
+        try:
+            tree = self.loader(name)
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(name, None)
+                history["errors"] += 1
+                if not history["loads"]:
+                    # 從未成功載入的名稱（例如不存在的語料）不保留統計，避免任意名稱累積
+                    self._history.pop(name, None)
+            future.set_exception(e)
+            raise
+        load_seconds = time.perf_counter() - start_time
+
+        with self._lock:
+            self._entries[name] = _Entry(tree, load_seconds)
+            self._loading.pop(name, None)
+            history["loads"] += 1
+            history["load_seconds_total"] += load_seconds
+            self._evict(keep=name)
+        future.set_result(tree)
+        return tree
+
+    def peek(self, name):
+        """
+        回傳已常駐的檢索樹（不載入、不計入命中），不存在時回傳 None。
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            return entry.tree if entry is not None else None
+
+    def __contains__(self, name):
+        with self._lock:
+            return name in self._entries
+
+    def replace(self, name, tree, pinned=True):
+        """
+        以新樹取代（例如背景重建完成後），保留命中統計並重新計算大小。
+        新樹與 loader 的結果不同時（pinned）不會被淘汰。
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                entry = _Entry(tree, 0.0, pinned)
+                self._entries[name] = entry
+            else:
+                entry.tree = tree
+                entry.nbytes = tree_nbytes(tree)
+                entry.pinned = pinned
+            self._entries.move_to_end(name)
+            self._evict(keep=name)
+
+    def evict(self, name):
+        """
+        移出指定語料（例如來源檔案更新後），回傳是否確實移出。
+        """
+        with self._lock:
+            return self._entries.pop(name, None) is not None
+
+    def _evict(self, keep):
+        if not self.memory_budget:
+            return
+        total = sum(entry.nbytes for entry in self._entries.values())
+        for name in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            entry = self._entries[name]
+            if name == keep or entry.pinned or entry.tree.is_modified:
+                continue
+            del self._entries[name]
+            total -= entry.nbytes
+            self.evictions += 1
+            self._history_for(name)["evictions"] += 1
+            print(f"檢索樹記憶體超過上限，已淘汰：{name}（{entry.nbytes / 2**20:.1f} MB）")
+        if total > self.memory_budget:
+            print(f"警告：常駐檢索樹 {total / 2**20:.1f} MB 仍超過上限 {self.memory_budget / 2**20:.1f} MB")
+
+    def stats(self):
+        with self._lock:
+            corpora = {}
+            for name, history in self._history.items():
+                entry = self._entries.get(name)
+                corpora[name] = {
+                    "resident": entry is not None,
+                    "nbytes": entry.nbytes if entry is not None else None,
+                    "last_load_seconds": entry.load_seconds if entry is not None else None,
+                    "pinned": bool(entry is not None and (entry.pinned or entry.tree.is_modified)),
+                    **history,
+                }
+            return {
+                "memory_budget_bytes": self.memory_budget,
+                "resident_bytes": sum(entry.nbytes for entry in self._entries.values()),
+                "resident": list(self._entries),
+                "loading": sorted(self._loading),
+                "evictions": self.evictions,
+                "corpora": corpora,
+            }
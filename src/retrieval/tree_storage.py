@@ -0,0 +1,157 @@
+"""
+檢索樹的二進位儲存格式，可用 np.memmap 以唯讀、零複製方式開啟
+
+目錄內容：
+- centroids.npy：(2n-1, d) float32 節點中心矩陣
+- children.npy / parents.npy / sample_counts.npy / depths.npy / leaf_ranges.npy / leaf_ids.npy：int32 結構陣列
+- linkage.npy：(n-1, 4) linkage matrix
+- texts.offsets.npy：(n+1,) int64，第 i 筆文本位於 texts.bin 的 [offsets[i], offsets[i+1])
+- texts.bin：所有文本以 UTF-8 編碼串接而成的 blob
+- centroids.f16.npy 或 centroids.i8.npy + centroids.i8.scale.npy（選用）：量化後的節點中心矩陣，
+  用於粗略打分（見 quantization）；不存在時於載入時計算並寫回
+
+多個 worker 以 mmap 開啟同一份檔案時共用作業系統的 page cache，不需各自反序列化一份。
+"""
+
+import os
+
+import numpy as np
+
+from src.retrieval.flat_tree import FlatTree
+from src.retrieval.quantization import QuantizedVectors, save_quantized, load_quantized
+
+
+CENTROIDS_FILE = "centroids.npy"
+LINKAGE_FILE = "linkage.npy"
+TEXT_OFFSETS_FILE = "texts.offsets.npy"
+TEXT_BLOB_FILE = "texts.bin"
+STRUCTURE_FILES = {
+    "children": "children.npy",
+    "parents": "parents.npy",
+    "sample_counts": "sample_counts.npy",
+    "depths": "depths.npy",
+    "leaf_ranges": "leaf_ranges.npy",
+    "leaf_ids": "leaf_ids.npy",
+}
+
+
+class TextStore:
+    """
+    以 offsets + blob 儲存的唯讀文本序列，支援索引與切片，文本在取用時才解碼。
+    """
+
+    def __init__(self, offsets, blob):
+        self.offsets = offsets
+        self.blob = blob
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _decode(self, index):
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return bytes(self.blob[start:end]).decode("utf-8")
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("TextStore index out of range")
+        return self._decode(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._decode(i)
+
+    def __repr__(self):
+        return f"TextStore(n={len(self)})"
+
+
+def write_texts(texts, path):
+    """
+    將文本寫成 texts.offsets.npy + texts.bin。
+    """
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    np.save(os.path.join(path, TEXT_OFFSETS_FILE), offsets)
+    with open(os.path.join(path, TEXT_BLOB_FILE), "wb") as f:
+        for b in encoded:
+            f.write(b)
+
+
+def open_texts(path, mmap_mode="r"):
+    """
+    開啟文本；mmap_mode 為 None 時整份讀入記憶體並回傳 list。
+    """
+    offsets = np.load(os.path.join(path, TEXT_OFFSETS_FILE), mmap_mode=mmap_mode)
+    blob_path = os.path.join(path, TEXT_BLOB_FILE)
+    if mmap_mode is None:
+        with open(blob_path, "rb") as f:
+            blob = f.read()
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+    if os.path.getsize(blob_path) == 0:
+        # 空檔案無法建立 memmap
+        return TextStore(offsets, b"")
+    return TextStore(offsets, np.memmap(blob_path, dtype=np.uint8, mode=mmap_mode))
+
+
+def save_flat_tree(tree, path, vector_dtype="float32"):
+    """
+    Summary:
+    將 FlatTree 以二進位格式寫入目錄 path（不含 manifest）。
+
+    tree: FlatTree
+    path: 輸出目錄
+    vector_dtype: float16 / int8 時一併寫入量化後的節點中心矩陣
+    """
+    tree = tree.snapshot()
+    if tree.is_modified:
+        # 增量異動後的樹先整理為連續排列
+        tree = tree.materialize()
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, CENTROIDS_FILE), np.ascontiguousarray(tree.vectors, dtype=np.float32))
+    np.save(os.path.join(path, LINKAGE_FILE), np.asarray(tree.linkage_matrix, dtype=np.float64))
+    for attr, filename in STRUCTURE_FILES.items():
+        np.save(os.path.join(path, filename), np.ascontiguousarray(getattr(tree, attr)))
+    write_texts(tree.texts, path)
+    if vector_dtype not in (None, "float32"):
+        save_quantized(QuantizedVectors.from_vectors(tree.vectors, vector_dtype), path)
+
+
+def load_flat_tree(path, mmap_mode="r", vector_dtype="float32"):
+    """
+    Summary:
+    從目錄 path 開啟 FlatTree。預設以唯讀 mmap 開啟所有陣列與文本，幾乎不需載入時間；
+    mmap_mode=None 時整份讀入記憶體。
+
+    path: save_flat_tree 的輸出目錄
+    mmap_mode: "r"（唯讀 mmap）、"c"（copy-on-write）或 None
+    vector_dtype: float16 / int8 時以量化矩陣做粗略打分；檔案不存在則由 centroids 計算並嘗試寫回
+    """
+    def load(filename):
+        return np.load(os.path.join(path, filename), mmap_mode=mmap_mode)
+
+    structure = {attr: load(filename) for attr, filename in STRUCTURE_FILES.items()}
+    tree = FlatTree(
+        load(CENTROIDS_FILE),
+        open_texts(path, mmap_mode),
+        structure["children"],
+        structure["parents"],
+        structure["sample_counts"],
+        structure["depths"],
+        load(LINKAGE_FILE),
+        leaf_ranges=structure["leaf_ranges"],
+        leaf_ids=structure["leaf_ids"],
+    )
+    if vector_dtype not in (None, "float32"):
+        quantized = load_quantized(path, vector_dtype, mmap_mode)
+        if quantized is None:
+            quantized = QuantizedVectors.from_vectors(tree.vectors, vector_dtype)
+            try:
+                save_quantized(quantized, path)
+            except OSError as e:
+                print(f"量化向量無法寫回檢索樹目錄，僅保留於記憶體：{e}")
+        tree.quantize(vector_dtype, quantized)
+    return tree
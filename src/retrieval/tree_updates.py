@@ -0,0 +1,138 @@
+"""
+檢索樹的增量更新與背景重建
+
+FlatTree.insert / delete 可在不重建的情況下新增或刪除文本，但新增的葉節點只是接在最相似節點旁，
+累積的異動越多，樹的結構越偏離重新聚類的結果。異動比例（drift）超過門檻後，
+TreeCompactor 會在背景執行緒以存活的葉節點重新建構，重播建構期間的新異動，再換上新樹。
+"""
+
+import os
+import sys
+import threading
+import time
+
+# 添加專案根目錄到路徑，以便引入其他模組
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.config import TREE_COMPACTION_DRIFT
+from src.retrieval.tree_builder import TreeBuilder
+
+
+def rebuild_tree(tree, builder=None):
+    """
+    Summary:
+    以存活的葉節點重新聚類建構 FlatTree，保留各葉節點原本的 leaf_id。
+
+    tree: FlatTree（可含增量異動）
+    builder: TreeBuilder，預設依 TREE_LINKAGE_METHOD / TREE_BUILD_STRATEGY
+    """
+    texts, vectors, leaf_ids = tree.live_leaves()
+    if not texts:
+        raise ValueError("檢索樹沒有存活的葉節點，無法重新建構")
+    new_tree = (builder or TreeBuilder()).build(vectors, texts)
+    new_tree.leaf_ids = leaf_ids[new_tree.leaf_ids].astype(new_tree.leaf_ids.dtype)
+    return new_tree
+
+
+class TreeCompactor:
+    """
+    Summary:
+    異動比例超過門檻時，在背景重新建構檢索樹。
+
+    threshold: drift 門檻
+    builder: 重建所用的 TreeBuilder
+    """
+
+    def __init__(self, threshold=TREE_COMPACTION_DRIFT, builder=None):
+        self.threshold = threshold
+        self.builder = builder
+        self.compactions = 0
+        self.last_seconds = None
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def needs_compaction(self, tree):
+        return tree.drift >= self.threshold
+
+    def compact(self, tree, on_compacted=None):
+        """
+        Summary:
+        同步重建：先在鎖內取得存活葉節點的快照並開始記錄異動，鎖外重新聚類（期間仍可繼續異動），
+        完成後在鎖內重播記錄的異動（隨即停止記錄），並將舊樹標記為已被取代，回傳新樹。
+
+        tree: FlatTree
+        on_compacted: on_compacted(new_tree)，在鎖內呼叫，用於換上新樹
+        """
+        start_time = time.time()
+        with tree._lock:
+            snapshot = tree.materialize()
+            tree.record_mutations()
+
+        try:
+            new_tree = rebuild_tree(snapshot, self.builder)
+            # 沿用舊樹的打分格式（量化）
+            new_tree.quantize(tree.vector_dtype)
+        except Exception:
+            tree.stop_recording()
+            raise
+
+        with tree._lock:
+            new_tree.apply_mutations(tree.stop_recording())
+            # 重播的異動屬於新樹的 drift，快照前的異動已在重建中吸收
+            if on_compacted is not None:
+                on_compacted(new_tree)
+            tree.supersede(new_tree)
+
+        self.compactions += 1
+        self.last_seconds = time.time() - start_time
+        print(f"檢索樹已重新建構：{new_tree.n_live_leaves} 葉節點，耗時 {self.last_seconds:.2f} 秒")
+        return new_tree
+
+    def maybe_compact(self, name, tree, on_compacted):
+        """
+        Summary:
+        drift 超過門檻且該檢索樹沒有進行中的重建時，啟動背景重建。回傳是否已啟動。
+
+        name: 檢索樹名稱（同一名稱同時只會有一個重建）
+        tree: FlatTree
+        on_compacted: on_compacted(new_tree)，重建完成時呼叫
+        """
+        if not self.needs_compaction(tree):
+            return False
+        with self._lock:
+            if name in self._running:
+                return False
+            thread = threading.Thread(
+                target=self._run, args=(name, tree, on_compacted), name=f"compact-{name}", daemon=True
+            )
+            self._running[name] = thread
+        thread.start()
+        return True
+
+    def _run(self, name, tree, on_compacted):
+        try:
+            self.compact(tree, on_compacted)
+        except Exception as e:
+            print(f"背景重建檢索樹失敗 '{name}': {e}")
+        finally:
+            with self._lock:
+                self._running.pop(name, None)
+
+    def wait(self, timeout=None):
+        """
+        等待所有進行中的背景重建完成。
+        """
+        with self._lock:
+            threads = list(self._running.values())
+        for thread in threads:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            running = sorted(self._running)
+        return {
+            "threshold": self.threshold,
+            "compactions": self.compactions,
+            "last_seconds": self.last_seconds,
+            "running": running,
+        }
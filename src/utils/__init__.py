@@ -5,9 +5,12 @@
 from .word_embedding import WordEmbedding
 from .word_chunking import RagChunking
 from .query_retrieval import Retrieval
+from .embedding_cache import EmbeddingCache, get_embedding_cache
 
 __all__ = [
     "WordEmbedding",
     "RagChunking", 
     "Retrieval",
+    "EmbeddingCache",
+    "get_embedding_cache",
 ]
@@ -0,0 +1,147 @@
+"""
+查詢向量快取：在 model.encode 前加一層 LRU 快取（可選 SQLite 磁碟層）
+"""
+
+import os
+import sys
+import threading
+
+import numpy as np
+
+# 添加專案根目錄到路徑，以便引入其他模組
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.config import EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_DISK_MAX
+from src.utils.lru_cache import LRUCache, SQLiteCache
+
+
+# 不影響向量結果、可安全略過的 encode 參數
+_NEUTRAL_ENCODE_KWARGS = {"device", "batch_size", "show_progress_bar"}
+
+
+def normalize_text(text):
+    """
+    快取鍵使用的文本正規化：去除首尾空白並將連續空白壓縮為單一空白。
+    """
+    return " ".join(str(text).split())
+
+
+def model_cache_name(model):
+    """
+    取得模型於快取鍵中的名稱。WordEmbedding 載入的模型帶有 cache_name；
+    其他模型以物件識別碼區分，僅在本行程內有效，也不會寫入磁碟層。
+    """
+    name = getattr(model, "cache_name", None)
+    if name:
+        return name
+    return f"local:{type(model).__name__}@{id(model):x}"
+
+
+class EmbeddingCache:
+    """
+    Summary:
+    以 (模型名稱, 正規化文本) 為鍵的向量快取。
+
+    maxsize: 記憶體層最多保留的向量數，0 表示停用快取
+    disk_dir: 磁碟層目錄，None 表示不使用磁碟層
+    disk_max_rows: 磁碟層最多保留的向量數，超過時刪除最久未存取者；0 表示不限制
+    """
+
+    def __init__(self, maxsize, disk_dir=None, disk_max_rows=0):
+        self.memory = LRUCache(maxsize)
+        self.disk = SQLiteCache(os.path.join(disk_dir, "embeddings.sqlite3"), disk_max_rows) if disk_dir else None
+        self.encoded = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.memory.maxsize > 0
+
+    @staticmethod
+    def key(model_name, text):
+        return f"{model_name}\x1f{normalize_text(text)}"
+
+    def _lookup(self, key, persistent):
+        vector = self.memory.get(key)
+        if vector is None and persistent and self.disk is not None:
+            vector = self.disk.get(key)
+            if vector is not None:
+                self.memory.put(key, vector)
+        return vector
+
+    def encode(self, model, texts, **kwargs):
+        """
+        Summary:
+        與 model.encode 相同的介面：先查快取，只把未命中的文本以單次批次送入模型。
+
+        model: 詞嵌入模型
+        texts: str 或 list[str]
+        """
+        if not self.enabled or set(kwargs) - _NEUTRAL_ENCODE_KWARGS:
+            return model.encode(texts, **kwargs)
+
+        single = isinstance(texts, str)
+        items = [texts] if single else list(texts)
+        if not items:
+            return model.encode(items, **kwargs)
+
+        model_name = model_cache_name(model)
+        persistent = not model_name.startswith("local:")
+        keys = [self.key(model_name, text) for text in items]
+        vectors = [self._lookup(key, persistent) for key in keys]
+
+        # 相同文本只編碼一次
+        missing = {}
+        for key, text, vector in zip(keys, items, vectors):
+            if vector is None and key not in missing:
+                missing[key] = text
+        if missing:
+            encoded = np.asarray(model.encode(list(missing.values()), **kwargs), dtype=np.float32)
+            encoded = encoded.reshape(len(missing), -1)
+            new_entries = dict(zip(missing.keys(), encoded))
+            for key, vector in new_entries.items():
+                self.memory.put(key, vector)
+            if persistent and self.disk is not None:
+                self.disk.put_many(new_entries.items())
+            with self._lock:
+                self.encoded += len(new_entries)
+            vectors = [new_entries[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+        result = np.stack(vectors)
+        return result[0] if single else result
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        stats = {"memory": self.memory.stats(), "encoded": self.encoded}
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
+
+
+_EMBEDDING_CACHE = None
+_EMBEDDING_CACHE_LOCK = threading.Lock()
+
+
+def get_embedding_cache():
+    """
+    取得行程共用的 EmbeddingCache（依 EMBEDDING_CACHE_SIZE / EMBEDDING_CACHE_DIR / EMBEDDING_CACHE_DISK_MAX 建立）。
+    """
+    global _EMBEDDING_CACHE
+    if _EMBEDDING_CACHE is None:
+        with _EMBEDDING_CACHE_LOCK:
+            if _EMBEDDING_CACHE is None:
+                _EMBEDDING_CACHE = EmbeddingCache(
+                    EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_DIR or None, EMBEDDING_CACHE_DISK_MAX
+                )
+    return _EMBEDDING_CACHE
+
+
+def cached_encode(model, texts, **kwargs):
+    """
+    經由行程共用快取呼叫 model.encode。
+    """
+    return get_embedding_cache().encode(model, texts, **kwargs)
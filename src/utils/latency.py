@@ -0,0 +1,53 @@
+"""
+延遲統計：依名稱記錄最近的耗時樣本，回報次數、平均與百分位數；另可累計事件次數
+"""
+
+import threading
+from collections import deque
+
+import numpy as np
+
+
+class LatencyTracker:
+    """
+    Summary:
+    執行緒安全的延遲統計。
+
+    window: 每個名稱保留的最近樣本數（百分位數以此計算），次數與平均則涵蓋全部樣本
+    """
+
+    def __init__(self, window=1024):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+        self._totals = {}
+        self._events = {}
+
+    def record(self, name, seconds):
+        with self._lock:
+            samples = self._samples.get(name)
+            if samples is None:
+                samples = self._samples[name] = deque(maxlen=self.window)
+            samples.append(seconds)
+            count, total = self._totals.get(name, (0, 0.0))
+            self._totals[name] = (count + 1, total + seconds)
+
+    def increment(self, name):
+        with self._lock:
+            self._events[name] = self._events.get(name, 0) + 1
+
+    def stats(self):
+        with self._lock:
+            samples = {name: np.array(values) * 1000 for name, values in self._samples.items()}
+            totals = dict(self._totals)
+            events = dict(self._events)
+        latency = {}
+        for name, values in samples.items():
+            count, total = totals[name]
+            latency[name] = {
+                "count": count,
+                "mean_ms": round(total * 1000 / count, 2),
+                "p50_ms": round(float(np.percentile(values, 50)), 2),
+                "p95_ms": round(float(np.percentile(values, 95)), 2),
+            }
+        return {"latency": latency, "events": events}
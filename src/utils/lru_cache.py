@@ -0,0 +1,183 @@
+"""
+執行緒安全的 LRU 快取與可選的 SQLite 磁碟層
+"""
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    有容量上限的 LRU 快取，記錄命中 / 未命中次數。
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+
+class SQLiteCache:
+    """
+    Summary:
+    以 SQLite 儲存的鍵值快取，值以 pickle 序列化，服務重啟後仍可沿用。
+
+    path: 資料庫檔案路徑
+    max_rows: 最多保留的筆數，超過時刪除最久未存取者；0 表示不限制
+    """
+
+    def __init__(self, path, max_rows=0):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self.max_rows = max(0, int(max_rows))
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB)")
+        # 舊版資料表沒有存取時間與到期時間欄位
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(cache)")}
+        if "accessed" not in columns:
+            self._conn.execute("ALTER TABLE cache ADD COLUMN accessed REAL NOT NULL DEFAULT 0")
+        if "expires_at" not in columns:
+            self._conn.execute("ALTER TABLE cache ADD COLUMN expires_at REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS cache_expires_at ON cache (expires_at)")
+        self._conn.commit()
+        self._rows = self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.expired = 0
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] is not None and row[1] <= now:
+                self._delete("DELETE FROM cache WHERE key = ?", (key,))
+                self.expired += 1
+                row = None
+            elif row is not None:
+                self._conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, value, expires_at=None):
+        self.put_many([(key, value)], expires_at)
+
+    def put_many(self, items, expires_at=None):
+        """
+        寫入多筆；expires_at 為到期時間（time.time() 的秒數），None 表示不過期。
+        寫入後刪除已過期的項目，並在超過 max_rows 時刪除最久未存取者。
+        """
+        now = time.time()
+        rows = {key: pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL) for key, value in items}
+        if not rows:
+            return
+        with self._lock:
+            existing = 0
+            keys = list(rows)
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                existing += self._conn.execute(
+                    f"SELECT COUNT(*) FROM cache WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchone()[0]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO cache (key, value, accessed, expires_at) VALUES (?, ?, ?, ?)",
+                [(key, value, now, expires_at) for key, value in rows.items()],
+            )
+            self._rows += len(rows) - existing
+            self.expired += self._delete("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            if self.max_rows and self._rows > self.max_rows:
+                self.evicted += self._delete(
+                    "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)",
+                    (self._rows - self.max_rows,),
+                )
+            self._conn.commit()
+
+    def _delete(self, sql, params):
+        # 呼叫端需持有 _lock；回傳刪除的筆數
+        deleted = self._conn.execute(sql, params).rowcount
+        self._rows -= deleted
+        return deleted
+
+    def pop(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()
+            self._delete("DELETE FROM cache WHERE key = ?", (key,))
+            self._conn.commit()
+        return pickle.loads(row[0]) if row is not None else default
+
+    def clear(self):
+        with self._lock:
+            self._delete("DELETE FROM cache", ())
+            self._conn.commit()
+
+    def __len__(self):
+        return self._rows
+
+    def stats(self):
+        with self._lock:
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "path": self.path,
+            "size": len(self),
+            "max_rows": self.max_rows,
+            "bytes": page_count * page_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+            "expired": self.expired,
+        }
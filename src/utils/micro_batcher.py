@@ -0,0 +1,224 @@
+"""
+跨請求的動態微批次：把並發請求的 encode / predict 合併為單次批次推論
+
+各請求的處理執行緒把輸入放入佇列後等待結果；背景執行緒取出第一筆後，
+最多再等待 max_wait 秒收集更多請求（或累積到 max_batch 筆輸入即送出），
+以單次模型呼叫完成整批，再依序把結果切回各請求。
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+
+# 不影響單筆輸出、可與其他請求合併的 encode 參數
+_BATCHABLE_ENCODE_KWARGS = {"device", "batch_size", "show_progress_bar", "normalize_embeddings"}
+# predict 同理
+_BATCHABLE_PREDICT_KWARGS = {"batch_size", "show_progress_bar"}
+
+
+class _Request:
+    __slots__ = ("items", "kwargs", "future", "enqueued_at")
+
+    def __init__(self, items, kwargs):
+        self.items = items
+        self.kwargs = kwargs
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Summary:
+    收集並發呼叫並以批次執行 batch_fn。
+
+    batch_fn: batch_fn(items, **kwargs)，回傳與 items 等長、可依列切片的結果
+    max_batch: 單一批次最多的輸入筆數
+    max_wait: 第一筆請求進入後最多等待的秒數
+    name: 執行緒與統計名稱
+    """
+
+    def __init__(self, batch_fn, max_batch=64, max_wait=0.005, name="micro-batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0.0, float(max_wait))
+        self.name = name
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.requests = 0
+        self.items = 0
+        self.max_batch_items = 0
+        self._recent_waits = deque(maxlen=1024)
+        self._recent_sizes = deque(maxlen=1024)
+
+    def _ensure_worker(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                    self._thread.start()
+
+    def submit(self, items, **kwargs):
+        """
+        送出一筆請求並阻塞等待結果。
+
+        items: list，該請求的輸入
+        """
+        self._ensure_worker()
+        request = _Request(list(items), kwargs)
+        self._queue.put(request)
+        return request.future.result()
+
+    def _collect(self):
+        first = self._queue.get()
+        batch = [first]
+        n_items = len(first.items)
+        deadline = first.enqueued_at + self.max_wait
+        while n_items < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                request = self._queue.get(block=timeout > 0, timeout=max(timeout, 0))
+            except queue.Empty:
+                break
+            batch.append(request)
+            n_items += len(request.items)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            # 參數不同的請求無法合併，依參數分組各自執行
+            groups = {}
+            for request in batch:
+                key = tuple(sorted(request.kwargs.items()))
+                groups.setdefault(key, []).append(request)
+            for requests in groups.values():
+                self._execute(requests, started)
+
+    def _execute(self, requests, started):
+        items = [item for request in requests for item in request.items]
+        try:
+            results = self.batch_fn(items, **requests[0].kwargs) if items else []
+        except BaseException as e:
+            for request in requests:
+                request.future.set_exception(e)
+            return
+
+        offset = 0
+        for request in requests:
+            end = offset + len(request.items)
+            request.future.set_result(results[offset:end])
+            offset = end
+
+        with self._stats_lock:
+            self.batches += 1
+            self.requests += len(requests)
+            self.items += len(items)
+            self.max_batch_items = max(self.max_batch_items, len(items))
+            self._recent_sizes.append(len(requests))
+            self._recent_waits.extend(started - request.enqueued_at for request in requests)
+
+    def stats(self):
+        with self._stats_lock:
+            waits = np.array(self._recent_waits) * 1000
+            sizes = np.array(self._recent_sizes)
+            return {
+                "batches": self.batches,
+                "requests": self.requests,
+                "items": self.items,
+                "mean_requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+                "mean_items_per_batch": self.items / self.batches if self.batches else 0.0,
+                "max_items_per_batch": self.max_batch_items,
+                "recent_max_requests_per_batch": int(sizes.max()) if len(sizes) else 0,
+                "queue_wait_ms_p50": float(np.percentile(waits, 50)) if len(waits) else 0.0,
+                "queue_wait_ms_p99": float(np.percentile(waits, 99)) if len(waits) else 0.0,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000,
+            }
+
+
+class BatchedEncoder:
+    """
+    Summary:
+    包裝 SentenceTransformer：encode 經由 MicroBatcher 與其他請求合併，其餘屬性轉交原模型。
+    含有會改變輸出格式的參數（例如 convert_to_tensor）時直接呼叫原模型。
+    """
+
+    def __init__(self, model, max_batch=64, max_wait=0.005):
+        self.model = model
+        self.batcher = MicroBatcher(self._encode_batch, max_batch, max_wait, name="embedding-batcher")
+
+    def _encode_batch(self, texts, **kwargs):
+        return np.asarray(self.model.encode(texts, **kwargs)).reshape(len(texts), -1)
+
+    def encode(self, sentences, **kwargs):
+        if set(kwargs) - _BATCHABLE_ENCODE_KWARGS:
+            return self.model.encode(sentences, **kwargs)
+        single = isinstance(sentences, str)
+        items = [sentences] if single else list(sentences)
+        if not items:
+            return self.model.encode(items, **kwargs)
+        result = self.batcher.submit(items, **kwargs)
+        return result[0] if single else result
+
+    def __getattr__(self, name):
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+class BatchedCrossEncoder:
+    """
+    Summary:
+    包裝 CrossEncoder：predict 經由 MicroBatcher 與其他請求合併，其餘屬性轉交原模型。
+    """
+
+    def __init__(self, model, max_batch=64, max_wait=0.005):
+        self.model = model
+        self.batcher = MicroBatcher(self._predict_batch, max_batch, max_wait, name="cross-encoder-batcher")
+
+    def _predict_batch(self, pairs, **kwargs):
+        return np.asarray(self.model.predict(pairs, **kwargs)).reshape(len(pairs))
+
+    def predict(self, sentences, **kwargs):
+        if set(kwargs) - _BATCHABLE_PREDICT_KWARGS:
+            return self.model.predict(sentences, **kwargs)
+        # 單一配對 (query, passage) 時回傳純量
+        single = isinstance(sentences, tuple) or (
+            isinstance(sentences, list) and len(sentences) == 2 and isinstance(sentences[0], str)
+        )
+        items = [sentences] if single else list(sentences)
+        if not items:
+            return self.model.predict(items, **kwargs)
+        result = self.batcher.submit(items, **kwargs)
+        return result[0] if single else result
+
+    def __getattr__(self, name):
+        if name == "model":
+            raise AttributeError(name)
+        return getattr(self.model, name)
+
+
+_BATCHERS = {}
+_BATCHERS_LOCK = threading.Lock()
+
+
+def register_batcher(name, batcher):
+    with _BATCHERS_LOCK:
+        _BATCHERS[name] = batcher
+
+
+def batching_stats():
+    """
+    回傳所有已註冊批次器的統計（供 /metrics 使用）。
+    """
+    with _BATCHERS_LOCK:
+        return {name: batcher.stats() for name, batcher in _BATCHERS.items()}
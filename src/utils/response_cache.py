@@ -0,0 +1,125 @@
+"""
+完整查詢回應快取：相同的 (語料版本, 正規化查詢, 管線選項, 設定指紋) 直接回傳先前的答案與檢索結果
+
+- 記憶體層為有容量上限的 LRU，可選的 SQLite 磁碟層在服務重啟後仍可沿用
+- 每筆項目帶有到期時間（TTL），過期時視為未命中並移除；磁碟層寫入時另清除已過期的項目，並以筆數上限淘汰最久未存取者
+- 鍵包含各語料的版本（來源檔案雜湊與增量異動標記），語料重新建構或增量新增 / 刪除後，舊項目不再命中
+- 命中 / 未命中次數依端點（/query、/query/stream）分別統計
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+from src.utils.embedding_cache import normalize_text
+from src.utils.lru_cache import LRUCache, SQLiteCache
+
+
+class ResponseCache:
+    """
+    Summary:
+    有 TTL 的查詢回應快取。
+
+    maxsize: 記憶體層最多保留的回應數，0 表示停用快取
+    ttl: 回應的有效秒數，0 表示不過期
+    disk_dir: 磁碟層目錄，None 表示不使用磁碟層
+    disk_max_rows: 磁碟層最多保留的回應數，0 表示不限制
+    """
+
+    def __init__(self, maxsize, ttl=0, disk_dir=None, disk_max_rows=0):
+        self.memory = LRUCache(maxsize)
+        self.ttl = max(0, ttl)
+        self.disk = None
+        if disk_dir and maxsize > 0:
+            self.disk = SQLiteCache(os.path.join(disk_dir, "responses.sqlite3"), disk_max_rows)
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.expired = 0
+
+    @property
+    def enabled(self):
+        return self.memory.maxsize > 0
+
+    @staticmethod
+    def key(corpora, query, use_extraction, prompt_type, fingerprint):
+        """
+        corpora: [(語料名稱, 版本)]，依請求順序
+        query: 查詢文字（以 normalize_text 正規化）
+        fingerprint: 影響回應的模型與設定摘要
+        """
+        payload = json.dumps(
+            [[list(item) for item in corpora], normalize_text(query), bool(use_extraction), prompt_type, fingerprint],
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _endpoint_stats(self, endpoint):
+        return self._endpoints.setdefault(endpoint, {"hits": 0, "misses": 0, "disk_hits": 0, "stores": 0})
+
+    def _fresh(self, entry):
+        expires_at, value = entry
+        return value if expires_at is None or expires_at > time.time() else None
+
+    def get(self, key, endpoint):
+        """
+        回傳快取的回應，未命中或已過期時回傳 None。
+        """
+        if not self.enabled:
+            return None
+        from_disk = False
+        entry = self.memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            from_disk = entry is not None
+        value = self._fresh(entry) if entry is not None else None
+        if entry is not None and value is None:
+            self.memory.pop(key)
+            if self.disk is not None:
+                self.disk.pop(key)
+        elif from_disk:
+            self.memory.put(key, entry)
+
+        with self._lock:
+            stats = self._endpoint_stats(endpoint)
+            if value is None:
+                stats["misses"] += 1
+                if entry is not None:
+                    self.expired += 1
+            else:
+                stats["hits"] += 1
+                stats["disk_hits"] += from_disk
+        return value
+
+    def put(self, key, value, endpoint):
+        if not self.enabled:
+            return
+        entry = (time.time() + self.ttl if self.ttl else None, value)
+        self.memory.put(key, entry)
+        if self.disk is not None:
+            self.disk.put(key, entry, expires_at=entry[0])
+        with self._lock:
+            self._endpoint_stats(endpoint)["stores"] += 1
+
+    def clear(self):
+        self.memory.clear()
+        if self.disk is not None:
+            self.disk.clear()
+
+    def stats(self):
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in self._endpoints.items():
+                total = stats["hits"] + stats["misses"]
+                endpoints[endpoint] = {**stats, "hit_rate": stats["hits"] / total if total else 0.0}
+            stats = {
+                "enabled": self.enabled,
+                "ttl_seconds": self.ttl,
+                "expired": self.expired,
+                "endpoints": endpoints,
+                "memory": {"size": len(self.memory), "maxsize": self.memory.maxsize},
+            }
+        if self.disk is not None:
+            stats["disk"] = self.disk.stats()
+        return stats
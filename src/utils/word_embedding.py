@@ -4,19 +4,123 @@
 
 import torch
 from sentence_transformers import SentenceTransformer
+import glob
+import pickle
+import platform
 import sys
 import os
 
+import numpy as np
+
 # 添加專案根目錄到路徑，以便引入其他模組
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 # 導入配置
-from app.config import MODEL_NAME
+from app.config import MODEL_NAME, INFERENCE_BATCHING, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS, DATA_DIR
+from app.config import (
+    EMBEDDING_BACKEND, EMBEDDING_NUM_THREADS, EMBEDDING_ONNX_DIR, EMBEDDING_AGREEMENT_SAMPLE, EMBEDDING_MIN_AGREEMENT
+)
+from src.utils.embedding_cache import cached_encode
+from src.utils.micro_batcher import BatchedEncoder, register_batcher
+
+
+EMBEDDING_BACKENDS = ("torch", "onnx", "onnx-int8", "int8")
+
+
+def _onnx_quantization_config():
+    """
+    onnx-int8 的量化設定：ARM 使用 arm64，其餘使用相容性較廣的 avx2。
+    """
+    return "arm64" if platform.machine().lower() in ("arm64", "aarch64") else "avx2"
+
+
+def load_sentence_transformer(model_name, backend="torch", device=None, num_threads=0, onnx_dir=EMBEDDING_ONNX_DIR):
+    """
+    Summary:
+    依推論後端載入 SentenceTransformer。
+    - torch：原本的 PyTorch 模型
+    - int8：以 torch 動態量化 Linear 層（僅 CPU），不需額外套件
+    - onnx：sentence-transformers 的 ONNX Runtime 後端（需安裝 optimum[onnxruntime]），模型庫沒有 ONNX 檔時自動匯出
+    - onnx-int8：將 ONNX 圖動態量化為 int8，第一次使用時寫入 onnx_dir，之後直接載入
+
+    model_name: 模型名稱或路徑
+    backend: torch / onnx / onnx-int8 / int8
+    device: torch 後端使用的裝置；其他後端固定使用 CPU
+    num_threads: CPU 推論的 intra-op 執行緒數，0 表示使用函式庫預設（torch 後端為行程層級設定）
+    onnx_dir: onnx-int8 量化後模型的存放目錄
+    """
+    if backend not in EMBEDDING_BACKENDS:
+        raise ValueError(f"不支援的詞嵌入後端：{backend}（可用：{', '.join(EMBEDDING_BACKENDS)}）")
+
+    if backend in ("torch", "int8"):
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        model = SentenceTransformer(model_name, device=device if backend == "torch" else "cpu")
+        if backend == "int8":
+            torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+        return model
+
+    import onnxruntime
+
+    model_kwargs = {"provider": "CPUExecutionProvider"}
+    if num_threads:
+        session_options = onnxruntime.SessionOptions()
+        session_options.intra_op_num_threads = num_threads
+        model_kwargs["session_options"] = session_options
+    if backend == "onnx":
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+    from sentence_transformers import export_dynamic_quantized_onnx_model
+
+    config = _onnx_quantization_config()
+    export_dir = os.path.join(str(onnx_dir), model_name.strip("/").replace("/", "__"))
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    if not os.path.exists(os.path.join(export_dir, file_name)):
+        print(f"正在將 {model_name} 匯出為 int8 量化的 ONNX 模型：{export_dir}")
+        model = SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+        model.save(export_dir)
+        export_dynamic_quantized_onnx_model(model, config, export_dir)
+    model_kwargs["file_name"] = file_name
+    return SentenceTransformer(export_dir, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+
+
+def embedding_agreement(model, sample_size=32, text_names=None, seed=0):
+    """
+    Summary:
+    以 model 重新編碼 DATA_DIR 中已存 embeddings 的文本樣本，與已存向量比較餘弦相似度。
+    回傳 {text_name: {"mean": 平均, "min": 最低, "n": 樣本數}}；維度不同時 mean / min 為 None。
+
+    model: 具 encode 的詞嵌入模型
+    sample_size: 每個語料抽樣的文本數
+    text_names: 要檢查的語料名稱，None 表示所有語料
+    """
+    if text_names is None:
+        paths = sorted(glob.glob(os.path.join(str(DATA_DIR), "*_embeddings.pkl")))
+        text_names = [os.path.basename(path)[: -len("_embeddings.pkl")] for path in paths]
+    rng = np.random.default_rng(seed)
+    results = {}
+    for text_name in text_names:
+        with open(os.path.join(str(DATA_DIR), f"{text_name}_embeddings.pkl"), "rb") as f:
+            stored = np.asarray(pickle.load(f), dtype=np.float32)
+        with open(os.path.join(str(DATA_DIR), f"{text_name}.pkl"), "rb") as f:
+            texts = pickle.load(f)
+        picks = rng.choice(len(texts), size=min(sample_size, len(texts)), replace=False)
+        encoded = np.asarray(model.encode([texts[i] for i in picks]), dtype=np.float32).reshape(len(picks), -1)
+        if encoded.shape[1] != stored.shape[1]:
+            results[text_name] = {"mean": None, "min": None, "n": len(picks)}
+            continue
+        expected = stored[picks]
+        cosines = np.sum(encoded * expected, axis=1) / (
+            np.linalg.norm(encoded, axis=1) * np.linalg.norm(expected, axis=1)
+        )
+        results[text_name] = {"mean": float(cosines.mean()), "min": float(cosines.min()), "n": len(picks)}
+    return results
 
 
 class WordEmbedding:
     def __init__(self):
         self.model = None
+        self.backend = None
         self.device = self._determine_device()
     
     def _determine_device(self):
@@ -30,21 +134,62 @@ class WordEmbedding:
         else:
             return "cpu"
 
+    def _load_backend(self):
+        """
+        依 EMBEDDING_BACKEND 載入模型；非 torch 後端無法載入，或與已存 embeddings 的餘弦一致性不足時改用 torch。
+        """
+        backend = EMBEDDING_BACKEND
+        if backend != "torch":
+            try:
+                model = load_sentence_transformer(MODEL_NAME, backend, num_threads=EMBEDDING_NUM_THREADS)
+            except Exception as e:
+                print(f"無法以 {backend} 後端載入 {MODEL_NAME}，改用 torch：{str(e)}")
+            else:
+                if self._agrees_with_stored(model, backend):
+                    self.device = "cpu"
+                    return model, backend
+        model = load_sentence_transformer(MODEL_NAME, "torch", self.device, EMBEDDING_NUM_THREADS)
+        return model, "torch"
+
+    @staticmethod
+    def _agrees_with_stored(model, backend):
+        if not EMBEDDING_AGREEMENT_SAMPLE:
+            return True
+        # 只檢查第一個語料，控制啟動時間；完整比較可用 benchmarks/bench_embedding_backends.py
+        paths = sorted(glob.glob(os.path.join(str(DATA_DIR), "*_embeddings.pkl")))
+        if not paths:
+            return True
+        text_name = os.path.basename(paths[0])[: -len("_embeddings.pkl")]
+        result = embedding_agreement(model, EMBEDDING_AGREEMENT_SAMPLE, [text_name])[text_name]
+        if result["min"] is None or result["min"] < EMBEDDING_MIN_AGREEMENT:
+            print(
+                f"{backend} 後端與已存 embeddings 的餘弦一致性不足（{text_name}：最低 {result['min']}，"
+                f"門檻 {EMBEDDING_MIN_AGREEMENT}），改用 torch"
+            )
+            return False
+        print(f"{backend} 後端與已存 embeddings 的餘弦一致性：平均 {result['mean']:.4f}，最低 {result['min']:.4f}")
+        return True
+
     def load_model(self):
         """
         加載模型用，只加載一次，避免重複加載
         """
         if self.model is None:
-            print(f"正在載入模型 {MODEL_NAME} 到 {self.device} 裝置...")
-            self.model = SentenceTransformer(MODEL_NAME)
-            self.model = self.model.to(self.device)
-            print(f"模型已成功載入到 {self.device} 裝置")
+            print(f"正在載入模型 {MODEL_NAME}（{EMBEDDING_BACKEND}）...")
+            self.model, self.backend = self._load_backend()
+            # 供向量快取區分模型；非 torch 後端的向量略有差異，分開快取
+            self.model.cache_name = MODEL_NAME if self.backend == "torch" else f"{MODEL_NAME}#{self.backend}"
+            if INFERENCE_BATCHING:
+                # 並發請求的 encode 合併為批次推論
+                self.model = BatchedEncoder(self.model, INFERENCE_MAX_BATCH, INFERENCE_MAX_WAIT_MS / 1000)
+                register_batcher("embedding", self.model.batcher)
+            print(f"模型已成功載入到 {self.device} 裝置（{self.backend}）")
 
         return self.model
 
     def embedding(self, text):
         """
-        做embedding用，支援批次處理
+        做embedding用，支援批次處理；經由行程共用的向量快取，重複文本不會重新編碼
         """
         self.load_model()
         
@@ -52,4 +197,4 @@ class WordEmbedding:
         if isinstance(text, list) and len(text) == 1:
             text = text[0]
             
-        return self.model.encode(text, device=self.device)
+        return cached_encode(self.model, text, device=self.device)